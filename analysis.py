@@ -1,59 +1,146 @@
-import sqlite3
+from typing import List, Optional
+import numpy as np
 import pandas as pd
-from db import DB_PATH
+from db import session, quarter_text_sql
 
 N_DELTAS = 12
 
+TRADE_COLUMNS = [
+    "manager",
+    "ticker",
+    "quarter",
+    "filed_date",
+    "prev_qty_proxy",
+    "qty_proxy",
+    "delta_qty_proxy",
+    "action",
+]
 
-def infer_trades_per_manager(n_deltas: int = N_DELTAS):
-    keep_obs = n_deltas + 1 #because we need to discard the first quarter
-    conn = sqlite3.connect(DB_PATH)
 
+def infer_trades_per_manager(n_deltas: int = N_DELTAS, engine: str = "sql", tickers: Optional[List[str]] = None):
+    """
+    Latest n_deltas position changes per (manager, ticker), for all tickers or just `tickers`.
+    engine="sql" reads the materialized holdings_deltas table (kept current by db.insert_holdings);
+    engine="numpy" loads raw holdings and runs infer_trades_vectorized. Both return the same frame.
+    """
+    if engine == "numpy":
+        return infer_trades_vectorized(load_holdings_frame(tickers), n_deltas)
+    if engine != "sql":
+        raise ValueError(f"unknown engine: {engine}")
+
+    where = ""
+    params = None
+    if tickers:
+        params = [t.upper() for t in tickers]
+        where = f"WHERE ticker IN ({','.join(['?'] * len(params))})"
+
+    # Same rows as capping each series to n_deltas + 1 quarters and taking LAG inside the cap:
+    # the capped first quarter is dropped, every other quarter keeps its real predecessor.
     query = f"""
-    WITH ranked AS (
+    WITH capped AS (
         SELECT
-            manager,
-            ticker,
-            quarter,
-            filed_date,
-            value_k AS qty_proxy,
+            *,
             ROW_NUMBER() OVER (
-                PARTITION BY manager, ticker
-                ORDER BY date(quarter) DESC
+                PARTITION BY ticker, manager_id
+                ORDER BY quarter DESC
             ) AS rn
-        FROM holdings
-        WHERE value_k IS NOT NULL
-    ),
-    capped AS (
-        SELECT * FROM ranked WHERE rn <= {keep_obs}
-    ),
-    ordered AS (
-        SELECT
-            *,
-            LAG(qty_proxy) OVER (
-                PARTITION BY manager, ticker
-                ORDER BY date(quarter)
-            ) AS prev_qty_proxy
-        FROM capped
+        FROM holdings_deltas
+        {where}
     )
     SELECT
-        manager,
-        ticker,
-        quarter,
-        filed_date,
-        prev_qty_proxy,
-        qty_proxy,
-        (qty_proxy - prev_qty_proxy) AS delta_qty_proxy,
-        CASE
-            WHEN (qty_proxy - prev_qty_proxy) > 0 THEN 'BUY'
-            WHEN (qty_proxy - prev_qty_proxy) < 0 THEN 'SELL'
-            ELSE 'HOLD'
-        END AS action
-    FROM ordered
-    WHERE prev_qty_proxy IS NOT NULL
-    ORDER BY ticker, manager, date(quarter)
-    """
-
-    df = pd.read_sql(query, conn)
-    conn.close()
-    return df
\ No newline at end of file
+        m.name AS manager,
+        c.ticker,
+        {quarter_text_sql("c.quarter")} AS quarter,
+        c.filed_date,
+        c.prev_qty AS prev_qty_proxy,
+        c.qty AS qty_proxy,
+        c.delta AS delta_qty_proxy,
+        c.action
+    FROM capped c
+    JOIN managers m ON m.manager_id = c.manager_id
+    WHERE c.rn <= {int(n_deltas)}
+    ORDER BY c.ticker, m.name, c.quarter
+    """
+
+    with session() as conn:
+        df = pd.read_sql(query, conn, params=params)
+    return df
+
+
+def load_holdings_frame(tickers: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Raw holdings as [manager, ticker, quarter, filed_date, value_k] (quarter as YYYY-MM-DD).
+    """
+    query = f"""
+    SELECT
+        m.name AS manager,
+        h.ticker,
+        {quarter_text_sql("h.quarter")} AS quarter,
+        h.filed_date,
+        h.value_k
+    FROM holdings h
+    JOIN managers m ON m.manager_id = h.manager_id
+    """
+    params = None
+    if tickers:
+        tickers = [t.upper() for t in tickers]
+        query += f" WHERE h.ticker IN ({','.join(['?'] * len(tickers))})"
+        params = tickers
+
+    with session() as conn:
+        return pd.read_sql(query, conn, params=params)
+
+
+def infer_trades_vectorized(holdings: pd.DataFrame, n_deltas: int = N_DELTAS) -> pd.DataFrame:
+    """
+    In-memory equivalent of infer_trades_per_manager for any frame with
+    [manager, ticker, quarter, filed_date, value_k] (e.g. data that never went through the DB).
+
+    Sorts once by (ticker, manager, quarter) on integer codes, finds series boundaries,
+    and keeps the last n_deltas rows of each series that have a predecessor.
+    """
+    h = holdings[holdings["value_k"].notna()]
+    if h.empty or n_deltas <= 0:
+        return pd.DataFrame(columns=TRADE_COLUMNS)
+
+    # factorize(sort=True) gives codes in value order, so sorting codes == sorting the strings
+    tkr_codes, _ = pd.factorize(h["ticker"], sort=True)
+    mgr_codes, _ = pd.factorize(h["manager"], sort=True)
+    q_codes, _ = pd.factorize(h["quarter"], sort=True)
+
+    order = np.lexsort((q_codes, mgr_codes, tkr_codes))
+    tkr = tkr_codes[order]
+    mgr = mgr_codes[order]
+    qty = h["value_k"].to_numpy(dtype=float)[order]
+
+    n = len(order)
+    is_start = np.ones(n, dtype=bool)
+    is_start[1:] = (tkr[1:] != tkr[:-1]) | (mgr[1:] != mgr[:-1])
+
+    # Distance from the end of each series (0 = latest quarter)
+    starts = np.flatnonzero(is_start)
+    ends = np.append(starts[1:], n) - 1
+    series_end = np.repeat(ends, np.diff(np.append(starts, n)))
+    from_end = series_end - np.arange(n)
+
+    prev = np.empty(n)
+    prev[0] = np.nan
+    prev[1:] = qty[:-1]
+
+    keep = (~is_start) & (from_end < n_deltas)
+    idx = order[keep]
+    prev = prev[keep]
+    cur = qty[keep]
+    delta = cur - prev
+
+    out = pd.DataFrame({
+        "manager": h["manager"].to_numpy()[idx],
+        "ticker": h["ticker"].to_numpy()[idx],
+        "quarter": h["quarter"].to_numpy()[idx],
+        "filed_date": h["filed_date"].to_numpy()[idx],
+        "prev_qty_proxy": prev,
+        "qty_proxy": cur,
+        "delta_qty_proxy": delta,
+        "action": np.select([delta > 0, delta < 0], ["BUY", "SELL"], default="HOLD"),
+    })
+    return out
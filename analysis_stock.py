@@ -1,7 +1,11 @@
-import sqlite3
+import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 from typing import List
-from db import DB_PATH, get_prices_eod_for_ticker
+from db import session, get_prices_eod_for_tickers, quarter_text_sql
+
+MAX_HORIZON = 4
+MAX_LAG = 3
 
 
 def _quarter_end(dt: pd.Timestamp) -> pd.Timestamp:
@@ -10,18 +14,20 @@ def _quarter_end(dt: pd.Timestamp) -> pd.Timestamp:
 
 def _build_quarter_closes(px_daily: pd.DataFrame) -> pd.DataFrame:
     """
-    px_daily: columns = ["date", "close"]
-    Returns: ["quarter", "close_q"] where quarter is calendar quarter-end (YYYY-MM-DD)
-    close_q = last available trading close on or before quarter-end.
+    px_daily: columns = ["ticker", "date", "close"], any number of tickers
+    Returns: ["ticker", "quarter", "close_q"] sorted by ticker then quarter, where quarter is
+    calendar quarter-end (YYYY-MM-DD) and close_q = last available trading close on or before it.
     """
-    px = px_daily.copy()
-    px["date"] = pd.to_datetime(px["date"])
-    px = px.sort_values("date")
-    px["quarter"] = px["date"].dt.to_period("Q").dt.end_time.dt.normalize()
-    # Last trading day in each quarter is the quarter close
-    q = px.groupby("quarter", as_index=False).last()[["quarter", "close"]]
-    q = q.rename(columns={"close": "close_q"})
-    q["quarter"] = q["quarter"].dt.strftime("%Y-%m-%d")
+    px = pd.DataFrame({
+        "ticker": px_daily["ticker"].to_numpy(),
+        "date": pd.to_datetime(px_daily["date"]).to_numpy(),
+        "close": px_daily["close"].to_numpy(),
+    })
+    px = px.sort_values(["ticker", "date"], kind="mergesort")
+    px["quarter"] = px["date"].dt.to_period("Q")
+    # Last trading day in each quarter is the quarter close; labels are only formatted per quarter
+    q = px.groupby(["ticker", "quarter"])["close"].last().rename("close_q").reset_index()
+    q["quarter"] = q["quarter"].dt.end_time.dt.normalize().dt.strftime("%Y-%m-%d")
     return q
 
 
@@ -29,91 +35,157 @@ def _get_net_exposure_all_quarters(tickers: List[str]) -> pd.DataFrame:
     """
     We compute net exposure change per ticker+quarter across ALL quarters in holdings,
     then later we filter to quarters that have prices.
+    Reads the net_exposure rollup that db.insert_holdings keeps current.
     """
     tickers = [t.upper() for t in tickers]
-    conn = sqlite3.connect(DB_PATH)
-
     placeholders = ",".join(["?"] * len(tickers))
 
     query = f"""
-    WITH base AS (
-        SELECT
-            manager,
-            ticker,
-            quarter,
-            CAST(value_k AS REAL) AS qty_proxy
-        FROM holdings
-        WHERE ticker IN ({placeholders})
-          AND value_k IS NOT NULL
-    ),
-    ordered AS (
-        SELECT
-            manager,
-            ticker,
-            quarter,
-            qty_proxy,
-            LAG(qty_proxy) OVER (
-                PARTITION BY manager, ticker
-                ORDER BY date(quarter)
-            ) AS prev_qty_proxy
-        FROM base
-    ),
-    deltas AS (
-        SELECT
-            ticker,
-            quarter,
-            (qty_proxy - prev_qty_proxy) AS delta_qty_proxy
-        FROM ordered
-        WHERE prev_qty_proxy IS NOT NULL
-    )
     SELECT
         ticker,
-        quarter,
-        SUM(delta_qty_proxy) AS net_exposure_change
-    FROM deltas
-    GROUP BY ticker, quarter
-    ORDER BY ticker, date(quarter)
+        {quarter_text_sql()} AS quarter,
+        net_exposure_change
+    FROM net_exposure
+    WHERE ticker IN ({placeholders})
+    ORDER BY ticker, net_exposure.quarter
     """
 
-    expo = pd.read_sql(query, conn, params=tickers)
-    conn.close()
+    with session() as conn:
+        expo = pd.read_sql(query, conn, params=tickers)
     return expo
 
 
-def compute_exposure_vs_next_q_return(tickers: List[str]) -> pd.DataFrame:
+def compute_exposure_vs_next_q_return(tickers: List[str], source: str = "db") -> pd.DataFrame:
     """
     Returns a DataFrame with ticker, quarter, net_exposure_change, close_q, close_next_q, and price_return_next_q
     Only for quarters where we have price data for both this quarter and next quarter.
+    source="snapshot" reads net_exposure/prices_eod from the Parquet snapshot instead of SQLite.
+    All tickers are handled in one price read, one grouped quarter-close pass and one merge.
     """
-    expo = _get_net_exposure_all_quarters(tickers)
-    if expo.empty:
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    expo, px = _load_exposure_and_prices(tickers, source)
+    if expo.empty or px.empty:
+        return pd.DataFrame()
+    if source == "snapshot":
+        expo = expo.sort_values(["ticker", "quarter"], kind="mergesort").reset_index(drop=True)
+
+    qpx = _build_quarter_closes(px)
+
+    # next-quarter return: the next stored quarter close of the same ticker
+    qpx["close_next_q"] = qpx.groupby("ticker")["close_q"].shift(-1)
+    qpx["price_return_next_q"] = (qpx["close_next_q"] / qpx["close_q"]) - 1
+
+    m = expo.merge(qpx, on=["ticker", "quarter"], how="inner")
+    m = m.dropna(subset=["close_next_q"])
+    if m.empty:
         return pd.DataFrame()
 
-    frames = []
-    for t in [x.upper() for x in tickers]:
-        px_rows = get_prices_eod_for_ticker(t)
-        if not px_rows:
-            continue
-
-        px_daily = pd.DataFrame(px_rows, columns=["date", "close"])
-        if px_daily.empty:
-            continue
-
-        qpx = _build_quarter_closes(px_daily)
-        qpx["ticker"] = t
-
-        # next-quarter return
-        qpx = qpx.sort_values("quarter").reset_index(drop=True)
-        qpx["close_next_q"] = qpx["close_q"].shift(-1)
-        qpx["price_return_next_q"] = (qpx["close_next_q"] / qpx["close_q"]) - 1
-
-        m = expo[expo["ticker"] == t].merge(
-            qpx[["ticker", "quarter", "close_q", "close_next_q", "price_return_next_q"]],
-            on=["ticker", "quarter"],
-            how="inner"
-        )
-        
-        m = m.dropna(subset=["close_next_q"]).reset_index(drop=True)
-        frames.append(m)
-
-    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
\ No newline at end of file
+    # Tickers in the order asked for, quarters ascending within each
+    order = m["ticker"].map({t: i for i, t in enumerate(tickers)}).to_numpy()
+    return m.iloc[np.argsort(order, kind="stable")].reset_index(drop=True)
+
+
+def _load_exposure_and_prices(tickers: List[str], source: str = "db"):
+    """
+    All tickers' net exposure ["ticker", "quarter", "net_exposure_change"] and daily prices
+    ["ticker", "date", "close"], one read each.
+    """
+    if source == "snapshot":
+        from snapshot import read_snapshot
+        expo = read_snapshot("net_exposure", tickers, columns=["ticker", "quarter", "net_exposure_change"])
+        px = read_snapshot("prices_eod", tickers, columns=["ticker", "date", "close"])
+    elif source == "db":
+        expo = _get_net_exposure_all_quarters(tickers)
+        px = pd.DataFrame(get_prices_eod_for_tickers(tickers), columns=["ticker", "date", "close"])
+    else:
+        raise ValueError(f"unknown source: {source}")
+    return expo, px
+
+
+def build_quarter_matrices(tickers: List[str], source: str = "db") -> dict:
+    """
+    (quarter x ticker) matrices of quarter-end close and net exposure on one calendar-quarter grid.
+    A quarter-end close is the last stored close in that calendar quarter (see _build_quarter_closes);
+    quarters without one are NaN, so a shift of h rows is always h calendar quarters.
+    """
+    tickers = sorted({t.upper() for t in tickers})
+    expo, px = _load_exposure_and_prices(tickers, source)
+    if expo.empty and px.empty:
+        return {}
+
+    closes = _build_quarter_closes(px).set_index(["ticker", "quarter"])["close_q"]
+
+    seen = pd.Index(expo["quarter"]).append(closes.index.get_level_values("quarter"))
+    periods = pd.PeriodIndex(pd.to_datetime(seen), freq="Q")
+    quarters = pd.period_range(periods.min(), periods.max(), freq="Q").end_time.normalize().strftime("%Y-%m-%d")
+
+    def to_matrix(s: pd.Series) -> np.ndarray:
+        return s.unstack("ticker").reindex(index=quarters, columns=tickers).to_numpy(dtype=float)
+
+    exposure = to_matrix(expo.set_index(["quarter", "ticker"])["net_exposure_change"])
+    close = to_matrix(closes.swaplevel().rename_axis(["quarter", "ticker"]))
+    return {"quarters": np.asarray(quarters), "tickers": np.asarray(tickers), "close": close, "exposure": exposure}
+
+
+def compute_horizon_lag_grid(
+    tickers: List[str],
+    max_horizon: int = MAX_HORIZON,
+    max_lag: int = MAX_LAG,
+    source: str = "db",
+    as_array: bool = False,
+):
+    """
+    Forward returns for horizons 1..max_horizon quarters against exposure lagged 0..max_lag
+    quarters, for every ticker and quarter at once.
+
+    Returns a long frame ["ticker", "quarter", "horizon", "lag", "net_exposure_change",
+    "close_q", "close_fwd", "price_return"] (rows with both sides present), or with
+    as_array=True a dict with returns (H x Q x T), exposure (L+1 x Q x T) and the axes.
+    horizon=1, lag=0 matches compute_exposure_vs_next_q_return wherever the next calendar quarter
+    has a close (that function pairs with the next stored quarter even across a gap).
+    """
+    m = build_quarter_matrices(tickers, source)
+    if not m:
+        return {} if as_array else pd.DataFrame()
+
+    close, exposure = m["close"], m["exposure"]
+    n_q, n_t = close.shape
+    pad = lambda a, top, bottom: np.pad(a, ((top, bottom), (0, 0)), constant_values=np.nan)
+
+    # Windows of max_horizon + 1 rows starting at each quarter: (Q, T, H + 1)
+    fwd = sliding_window_view(pad(close, 0, max_horizon), max_horizon + 1, axis=0)
+    close_fwd = np.moveaxis(fwd[..., 1:], -1, 0)  # (H, Q, T)
+    returns = close_fwd / close[None] - 1
+
+    # Windows ending at each quarter, newest first: lag l -> exposure of quarter q - l
+    back = sliding_window_view(pad(exposure, max_lag, 0), max_lag + 1, axis=0)
+    lagged = np.moveaxis(back[..., ::-1], -1, 0)  # (L + 1, Q, T)
+
+    if as_array:
+        return {
+            "quarters": m["quarters"],
+            "tickers": m["tickers"],
+            "horizons": np.arange(1, max_horizon + 1),
+            "lags": np.arange(0, max_lag + 1),
+            "returns": returns,
+            "close_fwd": close_fwd,
+            "exposure": lagged,
+        }
+
+    # Broadcast to (H, L + 1, T, Q): nonzero then walks horizon, lag, ticker, quarter in order
+    shape = (max_horizon, max_lag + 1, n_t, n_q)
+    ret4 = np.broadcast_to(np.swapaxes(returns, 1, 2)[:, None], shape)
+    exp4 = np.broadcast_to(np.swapaxes(lagged, 1, 2)[None], shape)
+    keep = ~np.isnan(ret4) & ~np.isnan(exp4)
+    h, lag, t, q = np.nonzero(keep)
+
+    return pd.DataFrame({
+        "ticker": m["tickers"][t],
+        "quarter": m["quarters"][q],
+        "horizon": h + 1,
+        "lag": lag,
+        "net_exposure_change": exp4[keep],
+        "close_q": close[q, t],
+        "close_fwd": close_fwd[h, q, t],
+        "price_return": ret4[keep],
+    })
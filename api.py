@@ -1,9 +1,9 @@
 import os
 SEC_API_KEY = os.environ.get("SEC_API_KEY", 
                              "INSERT API KEY HERE")
-SEC_BASE_URL = "https://api.sec-api.io"
+SEC_BASE_URL = os.environ.get("SEC_BASE_URL", "https://api.sec-api.io")
 
 
 STOCKDATA_API_KEY = os.environ.get("STOCKDATA_API_KEY", 
                                    "INSERT API KEY HERE")
-STOCKDATA_BASE_URL = "https://api.stockdata.org/v1"
\ No newline at end of file
+STOCKDATA_BASE_URL = os.environ.get("STOCKDATA_BASE_URL", "https://api.stockdata.org/v1")
\ No newline at end of file
@@ -0,0 +1,225 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from db import session, quarter_text_sql
+
+SIGNAL_COL = "net_exposure_change"
+RETURN_COL = "price_return_next_q"
+PERIODS_PER_YEAR = 4
+
+N_QUANTILES = 3
+LAG_QUARTERS = 0  # extra quarters to wait after the filings are public
+HOLD_QUARTERS = 1
+COST_BPS = 0.0  # charged on traded notional, per side
+
+SWEEP_QUANTILES = (2, 3, 5)
+SWEEP_LAGS = (0, 1, 2)
+SWEEP_HOLDS = (1, 2, 4)
+
+
+def get_signal_filed_dates(tickers: List[str]) -> pd.DataFrame:
+    """
+    When each ticker+quarter exposure became public: ["ticker", "quarter", "filed_date"].
+    net_exposure sums each manager's change from its previous stored quarter, so the signal is
+    public once every holdings row behind those deltas is: the latest filed_date among the
+    quarter's rows and the rows they are compared with. A late or amended filing therefore
+    delays the signal until it was filed. Quarters with any undated row get no date.
+    """
+    tickers = [t.upper() for t in tickers]
+    placeholders = ",".join(["?"] * len(tickers))
+    query = f"""
+    WITH used AS (
+        SELECT
+            ticker,
+            quarter,
+            LAG(value_k) OVER w AS prev_qty,
+            -- scalar MAX() is NULL when either date is
+            MAX(filed_date, LAG(filed_date) OVER w) AS public_date
+        FROM holdings
+        WHERE ticker IN ({placeholders})
+        WINDOW w AS (PARTITION BY ticker, manager_id ORDER BY quarter)
+    )
+    SELECT
+        ticker,
+        {quarter_text_sql()} AS quarter,
+        CASE WHEN COUNT(*) = COUNT(public_date) THEN MAX(public_date) END AS filed_date
+    FROM used
+    WHERE prev_qty IS NOT NULL
+    GROUP BY ticker, used.quarter
+    """
+    with session() as conn:
+        return pd.read_sql(query, conn, params=tickers)
+
+
+def build_panel(df: pd.DataFrame, filed: Optional[pd.DataFrame] = None) -> Dict:
+    """
+    Pivots the compute_exposure_vs_next_q_return frame to (quarter x ticker) matrices.
+
+    "avail" is the row at which each quarter's signal may first be traded: the first quarter-end
+    on or after its filed_date (see get_signal_filed_dates). A signal without a filed_date is
+    never traded.
+    """
+    quarters = np.sort(df["quarter"].unique())
+    tickers = np.sort(df["ticker"].unique())
+    qi = np.searchsorted(quarters, df["quarter"].to_numpy())
+    ti = np.searchsorted(tickers, df["ticker"].to_numpy())
+
+    shape = (len(quarters), len(tickers))
+    signal = np.full(shape, np.nan)
+    ret = np.full(shape, np.nan)
+    avail = np.full(shape, -1, dtype=np.int64)
+    signal[qi, ti] = df[SIGNAL_COL].to_numpy(dtype=float)
+    ret[qi, ti] = df[RETURN_COL].to_numpy(dtype=float)
+
+    # Past the last row, i.e. never traded, unless a filed_date says otherwise
+    avail_row = np.full(len(df), len(quarters), dtype=np.int64)
+    if filed is not None and not filed.empty:
+        fd = df[["ticker", "quarter"]].merge(filed, on=["ticker", "quarter"], how="left")["filed_date"]
+        has = fd.notna().to_numpy()
+        # quarters[i] >= filed_date  <=>  the signal is public by that quarter's close
+        avail_row[has] = np.searchsorted(quarters, fd[has].str.slice(0, 10).to_numpy(), side="left")
+        avail_row = np.maximum(avail_row, qi)
+    avail[qi, ti] = avail_row
+
+    return {"quarters": quarters, "tickers": tickers, "signal": signal, "ret": ret, "avail": avail}
+
+
+def tradable_signal(panel: Dict, lag: int = LAG_QUARTERS) -> np.ndarray:
+    """
+    Signal matrix indexed by the quarter it is traded at (avail + lag). When two signals of a
+    ticker land on the same row the newer one wins; a row with none is not traded.
+    """
+    signal, avail = panel["signal"], panel["avail"]
+    n_q, n_t = signal.shape
+    out = np.full((n_q, n_t), np.nan)
+
+    src_q, src_t = np.nonzero(~np.isnan(signal))
+    dest = avail[src_q, src_t] + lag
+    ok = dest < n_q
+    # Ascending source quarter, so later assignments (newer signals) overwrite older ones
+    out[dest[ok], src_t[ok]] = signal[src_q[ok], src_t[ok]]
+    return out
+
+
+def quantile_weights(sig: np.ndarray, ret: np.ndarray, n_quantiles: int) -> np.ndarray:
+    """
+    Dollar-neutral weights per row: equal-weight long the top exposure quantile (+1 total),
+    short the bottom one (-1 total). Rows with fewer names than quantiles stay flat.
+    """
+    usable = ~np.isnan(sig) & ~np.isnan(ret)
+    n = usable.sum(axis=1, keepdims=True)
+
+    ranks = pd.DataFrame(np.where(usable, sig, np.nan)).rank(axis=1, method="first").to_numpy()
+    bucket = np.ceil(ranks * n_quantiles / np.maximum(n, 1))
+
+    enough = n >= n_quantiles
+    long = (bucket == n_quantiles) & usable & enough
+    short = (bucket == 1) & usable & enough
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        w = long / long.sum(axis=1, keepdims=True) - short / short.sum(axis=1, keepdims=True)
+    return np.nan_to_num(w)
+
+
+def _holding_average(w: np.ndarray, hold: int) -> np.ndarray:
+    """
+    Overlapping portfolios: each row holds the mean of the last `hold` rebalances.
+    """
+    if hold <= 1:
+        return w
+    c = np.cumsum(np.vstack([np.zeros((1, w.shape[1])), w]), axis=0)
+    lo = np.maximum(np.arange(1, len(w) + 1) - hold, 0)
+    return (c[1:] - c[lo]) / hold
+
+
+def portfolio_metrics(returns: np.ndarray, turnover: np.ndarray) -> Dict:
+    r = returns[~np.isnan(returns)]
+    if len(r) == 0:
+        return {"n_periods": 0, "mean_return": np.nan, "ann_return": np.nan, "ann_vol": np.nan,
+                "sharpe": np.nan, "max_drawdown": np.nan, "avg_turnover": np.nan, "total_return": np.nan}
+
+    equity = np.cumprod(1 + r)
+    drawdown = equity / np.maximum.accumulate(np.maximum(equity, 1.0)) - 1
+    sd = r.std(ddof=1) if len(r) > 1 else np.nan
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe = r.mean() / sd * np.sqrt(PERIODS_PER_YEAR)
+    return {
+        "n_periods": int(len(r)),
+        "mean_return": float(r.mean()),
+        "ann_return": float(equity[-1] ** (PERIODS_PER_YEAR / len(r)) - 1) if equity[-1] > 0 else -1.0,
+        "ann_vol": float(sd * np.sqrt(PERIODS_PER_YEAR)),
+        "sharpe": float(sharpe),
+        "max_drawdown": float(drawdown.min()),
+        "avg_turnover": float(np.nanmean(turnover)),
+        "total_return": float(equity[-1] - 1),
+    }
+
+
+def run_backtest(
+    panel: Dict,
+    n_quantiles: int = N_QUANTILES,
+    lag: int = LAG_QUARTERS,
+    hold: int = HOLD_QUARTERS,
+    cost_bps: float = COST_BPS,
+) -> Dict:
+    """
+    Long/short quantile backtest on a build_panel() panel. Weights set at a quarter's close
+    earn that ticker's next-quarter return. Returns summary metrics and a per-quarter frame.
+    """
+    ret = panel["ret"]
+    sig = tradable_signal(panel, lag)
+    w = _holding_average(quantile_weights(sig, ret, n_quantiles), hold)
+
+    # Traded notional per rebalance (the first row builds the book); turnover is half of it
+    traded = np.abs(np.diff(np.vstack([np.zeros((1, w.shape[1])), w]), axis=0)).sum(axis=1)
+    gross = (w * np.nan_to_num(ret)).sum(axis=1)
+    net = gross - traded * cost_bps / 1e4
+
+    invested = np.abs(w).sum(axis=1) > 0
+    net = np.where(invested, net, np.nan)
+    turnover = np.where(invested, traded / 2, np.nan)
+
+    per_quarter = pd.DataFrame({
+        "quarter": panel["quarters"],
+        "gross_return": np.where(invested, gross, np.nan),
+        "net_return": net,
+        "turnover": turnover,
+        "n_long": (w > 0).sum(axis=1),
+        "n_short": (w < 0).sum(axis=1),
+    })
+
+    summary = {"n_quantiles": n_quantiles, "lag": lag, "hold": hold, "cost_bps": cost_bps}
+    summary.update(portfolio_metrics(net, turnover))
+    return {"summary": summary, "per_quarter": per_quarter}
+
+
+def _sweep_chunk(panel: Dict, params: List[tuple], cost_bps: float) -> List[Dict]:
+    return [run_backtest(panel, q, lag, hold, cost_bps)["summary"] for q, lag, hold in params]
+
+
+def sweep_backtests(
+    panel: Dict,
+    quantiles: Iterable[int] = SWEEP_QUANTILES,
+    lags: Iterable[int] = SWEEP_LAGS,
+    holds: Iterable[int] = SWEEP_HOLDS,
+    cost_bps: float = COST_BPS,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """
+    Summary metrics for every (n_quantiles, lag, hold) combination, one row each.
+    workers > 1 splits the grid across processes (the panel is sent once per chunk).
+    """
+    grid = list(product(quantiles, lags, holds))
+    if workers > 1 and len(grid) > 1:
+        chunks = [grid[i::workers] for i in range(workers) if grid[i::workers]]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = pool.map(_sweep_chunk, [panel] * len(chunks), chunks, [cost_bps] * len(chunks))
+            rows = [r for part in parts for r in part]
+    else:
+        rows = _sweep_chunk(panel, grid, cost_bps)
+
+    return pd.DataFrame(rows).sort_values(["n_quantiles", "lag", "hold"]).reset_index(drop=True)
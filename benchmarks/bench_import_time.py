@@ -0,0 +1,94 @@
+"""
+Import-time benchmark: what each entry point and stage costs to load, and whether the light
+entry points (main, pipeline, ingest/prices) stay free of pandas/scipy/statsmodels/matplotlib.
+
+    python benchmarks/bench_import_time.py --repeat 5
+
+Exits 1 if a light target pulls in a heavy library, so it can guard CI or a pre-commit hook.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["pandas", "numpy", "scipy", "statsmodels", "matplotlib", "pyarrow"]
+
+# target -> (import statement, must stay light)
+TARGETS = {
+    "main": ("import main", True),
+    "pipeline": ("import pipeline", True),
+    "ingest": ("import sec_edgar, db", True),
+    "prices": ("import update_prices", True),
+    "analyze": ("import analysis, analysis_stock, reports, backtest", False),
+    "stats": ("import stats_tests, panel", False),
+    "plots": ("import plots", False),
+}
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s?(\s*)(\S+)")
+
+
+def _probe(statement: str) -> dict:
+    """
+    One fresh interpreter: total import time (top-level modules' cumulative us) and heavy modules loaded.
+    """
+    code = (
+        f"{statement}\n"
+        "import sys, json\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Top-level entries (no indent) already include their children; skip what Python itself preloads
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if m and not m.group(2):
+            total_us += int(m.group(1))
+    heavy = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {"ms": total_us / 1000, "heavy": heavy}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--repeat", type=int, default=5, help="fresh interpreters per target (median reported)")
+    ap.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    results = {}
+    failed = []
+    print(f"{'target':<10}{'median ms':>11}{'min ms':>9}  heavy modules loaded")
+    for name in args.targets:
+        statement, light = TARGETS[name]
+        runs = [_probe(statement) for _ in range(args.repeat)]
+        times = [r["ms"] for r in runs]
+        heavy = runs[-1]["heavy"]
+        results[name] = {"median_ms": statistics.median(times), "min_ms": min(times), "heavy": heavy, "light": light}
+
+        flag = "  <-- should be light" if light and heavy else ""
+        print(f"{name:<10}{statistics.median(times):>11.1f}{min(times):>9.1f}  {', '.join(heavy) or '-'}{flag}")
+        if light and heavy:
+            failed.append(name)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved {args.json}")
+
+    if failed:
+        print(f"import regression: {', '.join(failed)} load heavy libraries at import")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+End-to-end pipeline benchmark against the local API stub (benchmarks/stub_server.py).
+
+    python benchmarks/bench_pipeline.py --managers 2000 --tickers 200 --latency-ms 40 --error-rate 0.05
+
+Times ingest, price update, trade inference, exposure merge, stats and reports on synthetic
+13F filings and prices, and prints throughput and HTTP latency per step. Everything runs in a
+throwaway directory; my_db.db, sec_cache/ and real API quota are never touched.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from stub_server import StubServer
+from synthetic import synthetic_filings, synthetic_tickers
+
+
+def _percentile_ms(hist, buckets, q: float) -> str:
+    """
+    Upper bound of the histogram bucket holding the q-quantile.
+    """
+    total = sum(hist)
+    if not total:
+        return "-"
+    seen = 0
+    for count, bound in zip(hist, buckets):
+        seen += count
+        if seen >= q * total:
+            return f"<={bound}" if bound != "inf" else f">{buckets[-2]}"
+    return "-"
+
+
+def run(args) -> dict:
+    tickers = synthetic_tickers(args.tickers)
+    t0 = time.perf_counter()
+    filings = synthetic_filings(
+        args.managers, tickers, n_quarters=args.quarters, holdings_per_filing=args.holdings, seed=args.seed
+    )
+    n_holdings = sum(len(f["holdings"]) for f in filings)
+    print(f"generated {len(filings):,} filings / {n_holdings:,} holdings in {time.perf_counter() - t0:.1f}s")
+
+    stub = StubServer(
+        filings,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    ).start()
+
+    # api.py reads these at import, so set them before any pipeline module loads
+    os.environ["SEC_BASE_URL"] = stub.url + "/"
+    os.environ["STOCKDATA_BASE_URL"] = stub.url + "/v1"
+    os.environ["SEC_API_KEY"] = "bench"
+    os.environ["STOCKDATA_API_KEY"] = "bench"
+
+    import db
+    import metrics
+    import pipeline
+    import sec_edgar
+    from analysis import infer_trades_per_manager
+    from analysis_stock import compute_exposure_vs_next_q_return
+    from filing_cache import FilingCache
+    from reports import write_trades_txt_all, write_exposure_summary
+    from stats_tests import run_stats
+    from update_prices import run_update_prices
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        sec_edgar.FILING_CACHE = FilingCache(os.path.join(tmp, "sec_cache"))
+        sec_edgar.SEC_CACHE_ENABLED = not args.no_cache
+        pipeline.BASE_DIR = tmp
+        pipeline.TICKERS = tickers
+        pipeline.RUN_SEC_INGEST = True
+        pipeline.SEC_REPLAY_FROM_CACHE = False
+        pipeline.SEC_INGEST_WORKERS = args.workers
+        pipeline.SEC_REQUESTS_PER_SECOND = args.sec_rps
+        pipeline.YEARS_13F_WINDOW = max(1, args.quarters // 4 + 1)
+
+        metrics.reset()
+        steps = {}
+
+        def step(name, fn):
+            with metrics.stage(name) as st:
+                out = fn()
+            steps[name] = st
+            return out
+
+        with db.session():
+            db.create_db()
+            step("ingest", pipeline.sec_ingest)
+            step("prices", lambda: run_update_prices(tickers=tickers, max_quarters=args.quarters))
+            trades = step("trade_inference", infer_trades_per_manager)
+            df = step("exposure_merge", lambda: compute_exposure_vs_next_q_return(tickers))
+            step("stats", lambda: run_stats(df, n_resamples=args.resamples))
+            step("reports", lambda: (
+                write_trades_txt_all(trades, tickers, tmp),
+                write_exposure_summary(df, os.path.join(tmp, "exposure_vs_next_q_return.txt")),
+            ))
+
+        report = metrics.report()
+
+    stub.stop()
+
+    counters = {name: st["counters"] for name, st in steps.items()}
+    rows = {
+        "ingest": counters["ingest"].get("holdings_inserted", 0),
+        "prices": counters["prices"].get("prices_upserted", 0),
+        "trade_inference": len(trades),
+        "exposure_merge": len(df),
+        "stats": len(df),
+        "reports": len(trades) + len(df),
+    }
+    endpoints = report["http"]["endpoints"]
+    buckets = report["http"]["latency_buckets_ms"]
+
+    results = {
+        "params": vars(args),
+        "filings": len(filings),
+        "holdings_in_filings": n_holdings,
+        "stub_requests": dict(stub.requests),
+        "stub_throttled": dict(stub.throttled),
+        "steps": [
+            {
+                "step": name,
+                "wall_seconds": st["wall_seconds"],
+                "cpu_seconds": st["cpu_seconds"],
+                "rows": rows[name],
+                "rows_per_second": rows[name] / st["wall_seconds"] if st["wall_seconds"] else None,
+                "http_requests": st.get("http_requests", 0),
+                "sql_seconds": st.get("sql_seconds", 0.0),
+            }
+            for name, st in steps.items()
+        ],
+        "http": {
+            ep: {
+                "requests": e["requests"],
+                "retries": e["retries"],
+                "mean_ms": 1000 * e["seconds"] / e["requests"],
+                "p50_ms": _percentile_ms(e["latency_ms"], buckets, 0.5),
+                "p95_ms": _percentile_ms(e["latency_ms"], buckets, 0.95),
+                "max_ms": e["max_ms"],
+                "bytes": e["bytes"],
+            }
+            for ep, e in endpoints.items()
+        },
+    }
+    return results
+
+
+def print_results(results: dict):
+    print(f"\n{'step':<16}{'wall s':>9}{'cpu s':>9}{'rows':>12}{'rows/s':>12}{'http':>7}{'sql s':>8}")
+    for s in results["steps"]:
+        rps = f"{s['rows_per_second']:,.0f}" if s["rows_per_second"] else "-"
+        print(
+            f"{s['step']:<16}{s['wall_seconds']:>9.3f}{s['cpu_seconds']:>9.3f}{s['rows']:>12,}"
+            f"{rps:>12}{s['http_requests']:>7}{s['sql_seconds']:>8.3f}"
+        )
+
+    print(f"\n{'endpoint':<40}{'reqs':>7}{'retries':>9}{'mean ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'MB':>8}")
+    for ep, e in results["http"].items():
+        print(
+            f"{ep:<40}{e['requests']:>7}{e['retries']:>9}{e['mean_ms']:>9.1f}{e['p50_ms']:>9}"
+            f"{e['p95_ms']:>9}{e['max_ms']:>9.1f}{e['bytes'] / 1e6:>8.1f}"
+        )
+    print(f"\nstub throttled (429): {results['stub_throttled'] or 0}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--managers", type=int, default=500, help="13F filers (one filing each per quarter)")
+    ap.add_argument("--tickers", type=int, default=100, help="tracked tickers (pipeline TICKERS)")
+    ap.add_argument("--quarters", type=int, default=12)
+    ap.add_argument("--holdings", type=int, default=60, help="positions per filing")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 429")
+    ap.add_argument("--workers", type=int, default=4, help="SEC ingest worker threads")
+    ap.add_argument("--sec-rps", type=float, default=0.0, help="client rate limit (0 = off)")
+    ap.add_argument("--resamples", type=int, default=10_000, help="run_stats bootstrap/permutation draws")
+    ap.add_argument("--no-cache", action="store_true", help="don't write the raw filing cache")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    results = run(args)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+SQL (materialized holdings_deltas) vs NumPy trade inference on synthetic holdings.
+
+    python benchmarks/bench_trade_inference.py --sizes 10000 1000000 10000000
+
+Each size gets its own throwaway SQLite file; my_db.db is never touched.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import analysis
+from synthetic import synthetic_holdings_rows, synthetic_tickers
+
+CHUNK_ROWS = 100_000
+
+
+def _chunks(rows, size: int):
+    chunk = []
+    for r in rows:
+        chunk.append(r)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+
+def run_size(n_rows: int, n_tickers: int, check: bool):
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.create_db()
+
+        with db.session():
+            tickers = synthetic_tickers(n_tickers)
+            rows = synthetic_holdings_rows(n_rows, n_tickers=n_tickers)
+            # Bulk path: plain inserts, then one full holdings_deltas build
+            _, t_load = _timed(db.replace_holdings_for_tickers, tickers, _chunks(rows, CHUNK_ROWS))
+
+            sql_df, t_sql = _timed(analysis.infer_trades_per_manager, engine="sql")
+            holdings, t_read = _timed(analysis.load_holdings_frame)
+            np_df, t_np = _timed(analysis.infer_trades_vectorized, holdings)
+
+        same = sql_df.equals(np_df) if check else None
+
+    print(
+        f"rows={n_rows:>10,}  load+materialize={t_load:8.2f}s  "
+        f"sql={t_sql:7.3f}s  numpy={t_np:7.3f}s (+read {t_read:6.3f}s)  "
+        f"trades={len(sql_df):,}  identical={same}"
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    ap.add_argument("--tickers", type=int, default=500)
+    ap.add_argument("--no-check", action="store_true", help="skip the SQL == NumPy output check")
+    args = ap.parse_args()
+
+    for n in args.sizes:
+        run_size(n, args.tickers, check=not args.no_check)
+
+
+if __name__ == "__main__":
+    main()
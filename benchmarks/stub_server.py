@@ -0,0 +1,208 @@
+"""
+Local stand-in for the two external APIs, so benchmarks never spend real quota:
+
+    POST /                   sec-api query endpoint (Lucene-ish query, from/size paging, filedAt sort)
+    GET  /v1/data/eod        stockdata EOD bars (symbols + date, or date_from/date_to)
+
+Point the pipeline at it with SEC_BASE_URL=<url> and STOCKDATA_BASE_URL=<url>/v1 (api.py reads both
+from the environment). Latency and 429s can be injected to exercise the retry/rate-limit paths.
+"""
+import json
+import random
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from synthetic import synthetic_price_bars
+
+# sec-api rejects queries past this from+size
+SEC_MAX_RESULT_WINDOW = 10000
+
+_FILED_AT_RE = re.compile(r"filedAt:\[(\S+) TO (\S+)\]")
+_TICKER_RE = re.compile(r"holdings\.ticker:(\([^)]*\)|\S+)")
+
+
+class StubServer:
+    """
+    Threaded HTTP stub serving `filings` (sec-api shaped dicts) and synthetic prices.
+
+    latency_ms / jitter_ms: added to every response.
+    error_rate: share of requests answered 429 with Retry-After: retry_after seconds.
+    """
+
+    def __init__(
+        self,
+        filings: List[Dict],
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        retry_after: float = 0.0,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.requests = Counter()
+        self.throttled = Counter()
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+        # filedAt-sorted filings, plus a ticker -> filing positions index for the query filter
+        self._filings = sorted(filings, key=lambda f: f["filedAt"])
+        self._filed = [f["filedAt"][:10] for f in self._filings]
+        self._by_ticker = defaultdict(set)
+        for i, f in enumerate(self._filings):
+            for h in f.get("holdings") or []:
+                self._by_ticker[h.get("ticker")].add(i)
+
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _delay_and_throttle(self, endpoint: str) -> bool:
+        with self._lock:
+            self.requests[endpoint] += 1
+            delay = self.latency_ms + (self._rnd.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+            throttled = self.error_rate > 0 and self._rnd.random() < self.error_rate
+            if throttled:
+                self.throttled[endpoint] += 1
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return throttled
+
+    def sec_query(self, payload: Dict) -> Optional[Dict]:
+        """
+        Answers a sec-api query payload; None when from+size is past the result window.
+        """
+        query = payload.get("query", "")
+        offset = int(payload.get("from", 0))
+        size = int(payload.get("size", 50))
+        if offset + size > SEC_MAX_RESULT_WINDOW:
+            return None
+
+        lo, hi = 0, len(self._filings)
+        m = _FILED_AT_RE.search(query)
+        if m:
+            if m.group(1) != "*":
+                lo = bisect_left(self._filed, m.group(1)[:10])
+            if m.group(2) != "*":
+                hi = bisect_right(self._filed, m.group(2)[:10])
+
+        m = _TICKER_RE.search(query)
+        if m:
+            tickers = m.group(1).strip("()").split(" OR ")
+            hits = sorted(set().union(*(self._by_ticker.get(t.strip(), set()) for t in tickers)))
+            idx = hits[bisect_left(hits, lo):bisect_left(hits, hi)]
+        else:
+            idx = list(range(lo, hi))
+
+        sort = (payload.get("sort") or [{}])[0].get("filedAt", {}).get("order", "desc")
+        if sort == "desc":
+            idx = idx[::-1]
+
+        return {
+            "total": {"value": len(idx), "relation": "eq"},
+            "filings": [self._filings[i] for i in idx[offset:offset + size]],
+        }
+
+    @staticmethod
+    def eod(params: Dict[str, List[str]]) -> Dict:
+        symbols = (params.get("symbols") or [""])[0].split(",")
+        if "date" in params:
+            # Nearest previous trading day, like the real endpoint
+            day = date.fromisoformat(params["date"][0][:10])
+            date_from, date_to = day - timedelta(days=7), day
+            single = True
+        else:
+            date_from = date.fromisoformat(params["date_from"][0][:10])
+            date_to = date.fromisoformat(params["date_to"][0][:10])
+            single = False
+
+        data = []
+        for s in symbols:
+            bars = synthetic_price_bars(s, date_from, date_to)
+            if single:
+                bars = bars[-1:]
+            # Newest first, timestamps as the API sends them
+            data.extend(
+                {"ticker": s, "date": f"{d}T00:00:00.000Z", "close": c, "open": c, "high": c, "low": c}
+                for d, c in reversed(bars)
+            )
+        return {"meta": {"returned": len(data)}, "data": data}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # else delayed ACKs add ~40ms to every keep-alive response
+
+            def _send(self, status: int, body: Optional[Dict], headers: Optional[Dict] = None):
+                raw = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def _throttled(self, endpoint: str) -> bool:
+                if stub._delay_and_throttle(endpoint):
+                    self._send(429, {"message": "Too Many Requests"}, {"Retry-After": str(stub.retry_after)})
+                    return True
+                return False
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if self._throttled("sec"):
+                    return
+                body = stub.sec_query(payload)
+                if body is None:
+                    self._send(400, {"message": f"from + size must be <= {SEC_MAX_RESULT_WINDOW}"})
+                else:
+                    self._send(200, body)
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                if not parts.path.rstrip("/").endswith("/data/eod"):
+                    self._send(404, {"message": "not found"})
+                    return
+                if self._throttled("eod"):
+                    return
+                self._send(200, stub.eod(parse_qs(parts.query)))
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,165 @@
+"""
+Synthetic 13F holdings for benchmarks: no API keys, no network.
+"""
+import math
+import random
+import zlib
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+def quarter_ends(n_quarters: int, last: date = date(2025, 12, 31)) -> List[str]:
+    """
+    The n_quarters calendar quarter-ends up to and including `last`, oldest first.
+    """
+    out = []
+    y, m = last.year, last.month
+    for _ in range(n_quarters):
+        first_of_next = date(y + (m == 12), m % 12 + 1, 1)
+        out.append((first_of_next - timedelta(days=1)).isoformat())
+        m -= 3
+        if m <= 0:
+            m += 12
+            y -= 1
+    return out[::-1]
+
+
+def synthetic_tickers(n: int) -> List[str]:
+    """
+    Deterministic fake symbols: AAA, AAB, ... (never collide with ORCL/UNH/FDS).
+    """
+    out = []
+    for i in range(n):
+        s = ""
+        k = i
+        for _ in range(3):
+            s = chr(ord("A") + k % 26) + s
+            k //= 26
+        out.append("X" + s)
+    return out
+
+
+def synthetic_holdings_rows(
+    n_rows: int,
+    n_tickers: int = 100,
+    n_quarters: int = 20,
+    seed: int = 0,
+) -> Iterator[Tuple]:
+    """
+    Yields about n_rows holdings rows in db.insert_holdings format:
+    (accession_no, manager, quarter, ticker, value_k, filed_date).
+
+    Each (manager, ticker) series covers a contiguous run of quarters, and positions
+    follow a random walk, with occasional full exits and re-entries, like real 13F data.
+    """
+    rnd = random.Random(seed)
+    tickers = synthetic_tickers(n_tickers)
+    quarters = quarter_ends(n_quarters)
+
+    emitted = 0
+    manager_no = 0
+    while emitted < n_rows:
+        manager = f"SYNTHETIC CAPITAL {manager_no:06d} LLC"
+        cik = 1_000_000 + manager_no
+        manager_no += 1
+
+        held = rnd.sample(tickers, k=min(len(tickers), rnd.randint(1, 40)))
+        first_q = rnd.randint(0, max(0, n_quarters - 2))
+
+        for qi in range(first_q, n_quarters):
+            q = quarters[qi]
+            filed = (date.fromisoformat(q) + timedelta(days=rnd.randint(10, 45))).isoformat()
+            accession_no = f"{cik:010d}-{q[2:4]}-{qi:06d}"
+
+            for t in held:
+                if rnd.random() < 0.05:
+                    continue  # skipped quarter (position closed then reopened)
+                value_k = float(max(0, int(rnd.lognormvariate(12, 1.5))))
+                yield (accession_no, manager, q, t, value_k, filed)
+                emitted += 1
+                if emitted >= n_rows:
+                    return
+
+
+def last_filed_quarter(today: Optional[date] = None) -> date:
+    """
+    The latest quarter-end whose 45-day 13F deadline has passed.
+    """
+    d = (today or date.today()) - timedelta(days=46)
+    # Day before the first day of d's quarter, unless d is itself a quarter-end
+    if (d + timedelta(days=1)).month in (1, 4, 7, 10) and (d + timedelta(days=1)).day == 1:
+        return d
+    return date(d.year, (d.month - 1) // 3 * 3 + 1, 1) - timedelta(days=1)
+
+
+def synthetic_filings(
+    n_managers: int,
+    tracked: List[str],
+    n_quarters: int = 12,
+    holdings_per_filing: int = 60,
+    tracked_share: float = 0.3,
+    seed: int = 0,
+) -> List[Dict]:
+    """
+    sec-api-shaped 13F-HR filings: one per manager per quarter, filed 10-45 days after
+    quarter-end. Each holds ~holdings_per_filing positions, about tracked_share of them in
+    `tracked` tickers and the rest in filler names the pipeline should skip.
+    Positions follow a per-(manager, ticker) random walk with occasional exits.
+    """
+    rnd = random.Random(seed)
+    quarters = quarter_ends(n_quarters, last=last_filed_quarter())
+    filler = ["F" + t[1:] for t in synthetic_tickers(max(holdings_per_filing * 4, 100))]
+
+    filings = []
+    for mgr in range(n_managers):
+        name = f"SYNTHETIC CAPITAL {mgr:06d} LLC"
+        cik = 2_000_000 + mgr
+        n_tracked = min(len(tracked), max(1, int(holdings_per_filing * tracked_share)))
+        book = rnd.sample(tracked, k=n_tracked) + rnd.sample(filler, k=holdings_per_filing - n_tracked)
+        value = {t: rnd.lognormvariate(12, 1.5) for t in book}
+        first_q = rnd.randint(0, max(0, n_quarters - 2))
+
+        for qi in range(first_q, n_quarters):
+            q = quarters[qi]
+            filed = date.fromisoformat(q) + timedelta(days=rnd.randint(10, 45))
+            holdings = []
+            for t in book:
+                if rnd.random() < 0.05:
+                    continue
+                value[t] *= math.exp(rnd.gauss(0, 0.25))
+                holdings.append({"ticker": t, "cusip": f"{zlib.crc32(t.encode()):09d}", "value": int(value[t])})
+
+            filings.append({
+                "accessionNo": f"{cik:010d}-{q[2:4]}-{qi:06d}",
+                "cik": str(cik),
+                "companyName": name,
+                "formType": "13F-HR",
+                "periodOfReport": q,
+                "filedAt": f"{filed.isoformat()}T{rnd.randint(6, 20):02d}:{rnd.randint(0, 59):02d}:00-04:00",
+                "holdings": holdings,
+            })
+    return filings
+
+
+def synthetic_close(ticker: str, day: date) -> float:
+    """
+    Deterministic daily close for any (ticker, date): drift plus a slow cycle, so repeated
+    requests for overlapping ranges agree.
+    """
+    phase = zlib.crc32(ticker.encode()) % 1000
+    base = 20 + phase / 10
+    n = day.toordinal()
+    return round(base * math.exp(0.0002 * (n - 737425) + 0.15 * math.sin(n / 45 + phase)), 4)
+
+
+def synthetic_price_bars(ticker: str, date_from: date, date_to: date) -> List[Tuple[str, float]]:
+    """
+    (date, close) for every weekday in [date_from, date_to], oldest first.
+    """
+    out = []
+    d = date_from
+    while d <= date_to:
+        if d.weekday() < 5:
+            out.append((d.isoformat(), synthetic_close(ticker, d)))
+        d += timedelta(days=1)
+    return out
@@ -1,95 +1,729 @@
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from metrics import TimedConnection, incr
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "my_db.db")
 
+# Applied to every connection. WAL lets readers (analysis, notebooks) run while a writer is active;
+# synchronous=NORMAL is durable across app crashes in WAL mode and skips the per-commit fsync.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",      # 64 MB page cache
+    "PRAGMA mmap_size = 268435456",    # 256 MB memory-mapped reads
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 30000",
+)
+
+# Keep rows a later filing for the same (manager, ticker, quarter) replaced in holdings_superseded
+ARCHIVE_SUPERSEDED_HOLDINGS = True
+
+_local = threading.local()
+
 
 def get_connection():
-    return sqlite3.connect(DB_PATH)
+    """
+    A new tuned connection in autocommit mode; transactions are opened explicitly by transaction().
+    """
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, timeout=30, factory=TimedConnection)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
 
 
-def create_db():
+@contextmanager
+def session():
+    """
+    Reuses one connection for everything this thread does inside the block
+    (e.g. one pipeline run, or one worker). Nested sessions share the outer connection.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+
     conn = get_connection()
-    cur = conn.cursor()
+    _local.conn = conn
+    _local.tx_depth = 0
+    try:
+        yield conn
+    finally:
+        _local.conn = None
+        conn.close()
+
+
+@contextmanager
+def transaction():
+    """
+    Write scope: commits once when the outermost transaction() exits, rolls back on error.
+    Helpers called inside an outer transaction() join it instead of committing on their own.
+    """
+    with session() as conn:
+        if _local.tx_depth:
+            _local.tx_depth += 1
+            try:
+                yield conn
+            finally:
+                _local.tx_depth -= 1
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        _local.tx_depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            _local.tx_depth = 0
+
+
+def quarter_to_int(quarter: str) -> int:
+    """
+    "2024-03-31" -> 20240331 (holdings.quarter is stored as a sortable yyyymmdd integer)
+    """
+    return int(str(quarter)[:10].replace("-", ""))
+
+
+def quarter_from_int(quarter: int) -> str:
+    q = int(quarter)
+    return f"{q // 10000:04d}-{q // 100 % 100:02d}-{q % 100:02d}"
+
+
+def quarter_text_sql(col: str = "quarter") -> str:
+    """
+    SQL expression turning an integer quarter column back into YYYY-MM-DD.
+    """
+    return f"printf('%04d-%02d-%02d', {col} / 10000, {col} / 100 % 100, {col} % 100)"
+
 
-    # Holdings Table
+def _columns(cur, table: str):
+    return [r[1] for r in cur.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def _primary_key(cur, table: str):
+    rows = cur.execute(f"PRAGMA table_info({table})").fetchall()
+    return [r[1] for r in sorted(rows, key=lambda r: r[5]) if r[5]]
+
+
+def _create_holdings_tables(cur):
+    # Manager dimension: holdings stores the integer id instead of the name string
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS managers (
+        manager_id INTEGER PRIMARY KEY,
+        name       TEXT NOT NULL UNIQUE
+    )
+    """)
+
+    # Holdings Table: one current row per position-quarter; the latest filing for it wins.
+    # Clustered on the key, so the per-(ticker, manager) quarter windows in analysis/analysis_stock
+    # read rows in order straight from the table, without a second (covering) copy in an index.
     cur.execute("""
     CREATE TABLE IF NOT EXISTS holdings (
         accession_no TEXT NOT NULL,
-        manager      TEXT NOT NULL,
-        quarter      TEXT NOT NULL,
+        manager_id   INTEGER NOT NULL REFERENCES managers(manager_id),
+        quarter      INTEGER NOT NULL,  -- yyyymmdd
         ticker       TEXT NOT NULL,
         value_k      REAL NOT NULL,
-        filed_date   TEXT,          -- YYYY-MM-DD (clean)
-        PRIMARY KEY (accession_no, manager, ticker)
-    )
+        filed_date   TEXT,              -- YYYY-MM-DD (clean)
+        PRIMARY KEY (ticker, manager_id, quarter)
+    ) WITHOUT ROWID
     """)
 
-    # Backfill Table
+    # Rows an amendment / re-filed report replaced (same layout, keyed by filing)
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS ingest_checkpoint (
-        ticker TEXT PRIMARY KEY,
-        last_filed_at TEXT
+    CREATE TABLE IF NOT EXISTS holdings_superseded (
+        accession_no TEXT NOT NULL,
+        manager_id   INTEGER NOT NULL,
+        quarter      INTEGER NOT NULL,  -- yyyymmdd
+        ticker       TEXT NOT NULL,
+        value_k      REAL NOT NULL,
+        filed_date   TEXT,
+        PRIMARY KEY (accession_no, manager_id, ticker)
     )
     """)
 
-    # Price Table
+    # Old (manager name, text quarter) shape, for ad-hoc queries and notebooks
+    cur.execute(f"""
+    CREATE VIEW IF NOT EXISTS holdings_v AS
+    SELECT
+        h.accession_no,
+        m.name AS manager,
+        {quarter_text_sql("h.quarter")} AS quarter,
+        h.ticker,
+        h.value_k,
+        h.filed_date
+    FROM holdings h
+    JOIN managers m ON m.manager_id = h.manager_id
+    """)
+
+
+def _create_delta_tables(cur) -> bool:
+    """
+    Materialized quarter-over-quarter position changes, maintained by _insert_holdings.
+    Returns True if the tables were just created (and so still need a full build).
+    """
+    existed = bool(cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'holdings_deltas'"
+    ).fetchone())
+
+    # One row per holdings row that has a previous quarter in its (manager, ticker) series
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS prices_eod (
-        ticker TEXT NOT NULL,
-        date   TEXT NOT NULL,   -- YYYY-MM-DD
-        close  REAL NOT NULL,
-        PRIMARY KEY (ticker, date)
-    )
+    CREATE TABLE IF NOT EXISTS holdings_deltas (
+        ticker       TEXT NOT NULL,
+        manager_id   INTEGER NOT NULL,
+        quarter      INTEGER NOT NULL,  -- yyyymmdd
+        accession_no TEXT NOT NULL,
+        filed_date   TEXT,
+        prev_qty     REAL NOT NULL,
+        qty          REAL NOT NULL,
+        delta        REAL NOT NULL,
+        action       TEXT NOT NULL,     -- BUY / SELL / HOLD
+        PRIMARY KEY (ticker, manager_id, quarter, accession_no)
+    ) WITHOUT ROWID
     """)
 
-    conn.commit()
-    conn.close()
+    # Per ticker-quarter rollup of holdings_deltas.delta
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS net_exposure (
+        ticker              TEXT NOT NULL,
+        quarter             INTEGER NOT NULL,  -- yyyymmdd
+        net_exposure_change REAL NOT NULL,
+        PRIMARY KEY (ticker, quarter)
+    ) WITHOUT ROWID
+    """)
+    return not existed
 
 
-def insert_holdings(rows):
+def _upsert_holdings(cur, select_sql: str, params=()):
     """
-    rows: (accession_no, manager, quarter, ticker, value_k, filed_date)
+    Writes (accession_no, manager_id, quarter, ticker, value_k, filed_date) rows from select_sql.
+    A row replaces the stored one for its (manager, ticker, quarter) only if it was filed later
+    (same day: higher accession number), so the result doesn't depend on arrival order.
     """
-    if not rows:
-        return 0
+    cur.execute(f"""
+        INSERT INTO holdings
+        (accession_no, manager_id, quarter, ticker, value_k, filed_date)
+        SELECT * FROM ({select_sql}) WHERE true
+        ON CONFLICT (ticker, manager_id, quarter) DO UPDATE SET
+            accession_no = excluded.accession_no,
+            value_k = excluded.value_k,
+            filed_date = excluded.filed_date
+        WHERE (COALESCE(excluded.filed_date, ''), excluded.accession_no)
+            > (COALESCE(holdings.filed_date, ''), holdings.accession_no)
+    """, params)
 
-    conn = get_connection()
-    cur = conn.cursor()
-    before = conn.total_changes
 
+def _archive_losers(cur, source: str):
+    """
+    Copies rows of `source` (a table with the holdings columns) that aren't the current
+    holdings row for their position-quarter into holdings_superseded.
+    """
+    if not ARCHIVE_SUPERSEDED_HOLDINGS:
+        return
+    cur.execute(f"""
+        INSERT OR IGNORE INTO holdings_superseded
+        (accession_no, manager_id, quarter, ticker, value_k, filed_date)
+        SELECT s.accession_no, s.manager_id, s.quarter, s.ticker, s.value_k, s.filed_date
+        FROM {source} s
+        JOIN holdings h
+          ON h.ticker = s.ticker AND h.manager_id = s.manager_id AND h.quarter = s.quarter
+        WHERE h.accession_no != s.accession_no
+    """)
+
+
+def _migrate_holdings_text_schema(cur):
+    """
+    Pre-migration DBs store manager names and TEXT quarters in holdings.
+    Rebuilds the table into the interned/integer layout, keeping the latest filing per position-quarter.
+    """
+    cur.execute("ALTER TABLE holdings RENAME TO holdings_text_old")
+    _create_holdings_tables(cur)
+    cur.execute("INSERT OR IGNORE INTO managers (name) SELECT DISTINCT manager FROM holdings_text_old")
+    cur.execute("""
+        CREATE TEMP TABLE holdings_old AS
+        SELECT
+            h.accession_no,
+            m.manager_id,
+            CAST(replace(substr(h.quarter, 1, 10), '-', '') AS INTEGER) AS quarter,
+            h.ticker,
+            h.value_k,
+            h.filed_date
+        FROM holdings_text_old h
+        JOIN managers m ON m.name = h.manager
+    """)
+    cur.execute("DROP TABLE holdings_text_old")
+    _upsert_holdings(cur, "SELECT * FROM temp.holdings_old")
+    _archive_losers(cur, "temp.holdings_old")
+    cur.execute("DROP TABLE temp.holdings_old")
+
+
+def _migrate_holdings_latest_wins(cur) -> int:
+    """
+    DBs keyed by (accession_no, manager, ticker) can hold several filings' rows for one
+    position-quarter. Rebuilds holdings on the (ticker, manager, quarter) key, latest filing
+    wins, the rest go to holdings_superseded. Returns the number of rows superseded.
+    """
+    # RENAME would carry the index and re-point the view at the old table; both are recreated below
+    cur.execute("DROP INDEX IF EXISTS idx_holdings_ticker_manager_quarter")
+    cur.execute("DROP VIEW IF EXISTS holdings_v")
+    cur.execute("ALTER TABLE holdings RENAME TO holdings_by_filing_old")
+    _create_holdings_tables(cur)
+    before = cur.execute("SELECT COUNT(*) FROM holdings_by_filing_old").fetchone()[0]
+    _upsert_holdings(cur, """
+        SELECT accession_no, manager_id, quarter, ticker, value_k, filed_date
+        FROM holdings_by_filing_old
+    """)
+    _archive_losers(cur, "holdings_by_filing_old")
+    cur.execute("DROP TABLE holdings_by_filing_old")
+    return before - cur.execute("SELECT COUNT(*) FROM holdings").fetchone()[0]
+
+
+def _has_rowid(cur, table: str) -> bool:
+    sql = cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    return bool(sql) and "WITHOUT ROWID" not in sql[0].upper()
+
+
+def _migrate_holdings_clustered(cur):
+    """
+    Earlier (ticker, manager, quarter)-keyed DBs keep holdings as a rowid table plus a covering
+    index that repeats nearly every column. Rebuilds it clustered on its key; rows are unchanged.
+    """
+    cur.execute("DROP INDEX IF EXISTS idx_holdings_ticker_manager_quarter")
+    cur.execute("DROP VIEW IF EXISTS holdings_v")
+    cur.execute("ALTER TABLE holdings RENAME TO holdings_rowid_old")
+    _create_holdings_tables(cur)
+    cur.execute("""
+        INSERT INTO holdings (accession_no, manager_id, quarter, ticker, value_k, filed_date)
+        SELECT accession_no, manager_id, quarter, ticker, value_k, filed_date
+        FROM holdings_rowid_old
+        ORDER BY ticker, manager_id, quarter
+    """)
+    cur.execute("DROP TABLE holdings_rowid_old")
+
+
+def _migrate_forward_checkpoint(cur):
+    """
+    Older DBs only have the backward checkpoint. The start of the newest stored filing day
+    per ticker (else the backward checkpoint) is a safe starting point for forward mode: at
+    worst the first forward query re-reads filings whose rows the upsert leaves as they are
+    (an equal filing never replaces the stored one). It is written as an offset timestamp,
+    like sec-api's filedAt.
+    """
+    cur.execute("ALTER TABLE ingest_checkpoint ADD COLUMN newest_filed_at TEXT")
+    cur.execute("""
+        UPDATE ingest_checkpoint
+        SET newest_filed_at = COALESCE(
+            (SELECT MAX(h.filed_date) || 'T00:00:00+00:00' FROM holdings h WHERE h.ticker = ingest_checkpoint.ticker),
+            last_filed_at
+        )
+    """)
+
+
+def create_db():
+    migrated = False
+    compacted = False
+
+    with transaction() as conn:
+        cur = conn.cursor()
+
+        if "manager" in _columns(cur, "holdings"):
+            _migrate_holdings_text_schema(cur)
+            migrated = True
+        elif "accession_no" in _primary_key(cur, "holdings"):
+            superseded = _migrate_holdings_latest_wins(cur)
+            print(f"create_db: {superseded} holdings rows superseded by later filings")
+            migrated = True
+        elif _has_rowid(cur, "holdings"):
+            _migrate_holdings_clustered(cur)
+            compacted = True
+        else:
+            _create_holdings_tables(cur)
+
+        if _create_delta_tables(cur) or migrated:
+            _rebuild_deltas(cur)
+
+        # Ingest checkpoints: backfill covers [last_filed_at, newest_filed_at]; forward mode extends the top
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_checkpoint (
+            ticker TEXT PRIMARY KEY,
+            last_filed_at TEXT,
+            newest_filed_at TEXT
+        )
+        """)
+        if "newest_filed_at" not in _columns(cur, "ingest_checkpoint"):
+            _migrate_forward_checkpoint(cur)
+
+        # Price Table
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS prices_eod (
+            ticker TEXT NOT NULL,
+            date   TEXT NOT NULL,   -- YYYY-MM-DD
+            close  REAL NOT NULL,
+            PRIMARY KEY (ticker, date)
+        )
+        """)
+
+        # Universe runner progress: one row per shard, phase = pending/merged/priced/done
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS universe_progress (
+            universe   TEXT NOT NULL,
+            shard_id   INTEGER NOT NULL,
+            tickers    TEXT NOT NULL,   -- comma-separated
+            phase      TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (universe, shard_id)
+        )
+        """)
+
+        # Pipeline stage fingerprints (a stage is skipped while its fingerprint is unchanged)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS stage_cache (
+            stage       TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            updated_at  TEXT NOT NULL
+        )
+        """)
+
+        # Vendor price files already imported (a file is skipped while its fingerprint is unchanged)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS price_import_files (
+            path        TEXT PRIMARY KEY,   -- absolute path
+            fingerprint TEXT NOT NULL,
+            imported_at TEXT NOT NULL
+        )
+        """)
+
+    # Reclaim the space the text-keyed table used (VACUUM can't run inside a transaction)
+    if (migrated or compacted) and not _local.tx_depth:
+        with session() as conn:
+            conn.execute("VACUUM")
+    if migrated:
+        print("create_db: migrated holdings to one row per (manager, ticker, quarter), latest filing wins")
+    elif compacted:
+        print("create_db: rebuilt holdings clustered on (ticker, manager, quarter), covering index dropped")
+
+
+def _manager_ids(cur, names) -> Dict[str, int]:
+    names = list(set(names))
+    cur.executemany("INSERT OR IGNORE INTO managers (name) VALUES (?)", [(n,) for n in names])
+
+    ids = {}
+    for i in range(0, len(names), 500):
+        chunk = names[i:i + 500]
+        placeholders = ",".join(["?"] * len(chunk))
+        for manager_id, name in cur.execute(
+            f"SELECT manager_id, name FROM managers WHERE name IN ({placeholders})", chunk
+        ):
+            ids[name] = manager_id
+    return ids
+
+
+def _stage_series(cur, sql: str, params=()):
+    """
+    Loads (manager_id, ticker) pairs into temp.touched_series for _refresh_deltas.
+    """
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS touched_series (
+            manager_id INTEGER NOT NULL,
+            ticker     TEXT NOT NULL,
+            PRIMARY KEY (ticker, manager_id)
+        )
+    """)
+    cur.execute(f"INSERT OR IGNORE INTO temp.touched_series (manager_id, ticker) {sql}", params)
+
+
+def _refresh_deltas(cur):
+    """
+    Re-derives holdings_deltas for every series in temp.touched_series (the whole series, so a
+    backfilled older quarter also fixes its neighbour's delta), then the net_exposure rows for
+    every (ticker, quarter) those series cover. Empties touched_series when done.
+    """
+    cur.execute("""
+        DELETE FROM holdings_deltas
+        WHERE (ticker, manager_id) IN (SELECT ticker, manager_id FROM temp.touched_series)
+    """)
+    cur.execute("""
+        INSERT INTO holdings_deltas
+        (ticker, manager_id, quarter, accession_no, filed_date, prev_qty, qty, delta, action)
+        SELECT
+            ticker,
+            manager_id,
+            quarter,
+            accession_no,
+            filed_date,
+            prev_qty,
+            qty,
+            qty - prev_qty,
+            CASE
+                WHEN (qty - prev_qty) > 0 THEN 'BUY'
+                WHEN (qty - prev_qty) < 0 THEN 'SELL'
+                ELSE 'HOLD'
+            END
+        FROM (
+            SELECT
+                h.ticker,
+                h.manager_id,
+                h.quarter,
+                h.accession_no,
+                h.filed_date,
+                h.value_k AS qty,
+                LAG(h.value_k) OVER (
+                    PARTITION BY h.ticker, h.manager_id
+                    ORDER BY h.quarter
+                ) AS prev_qty
+            FROM holdings h
+            JOIN temp.touched_series t
+              ON t.ticker = h.ticker AND t.manager_id = h.manager_id
+        )
+        WHERE prev_qty IS NOT NULL
+    """)
+
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS touched_quarters (
+            ticker  TEXT NOT NULL,
+            quarter INTEGER NOT NULL,
+            PRIMARY KEY (ticker, quarter)
+        )
+    """)
+    cur.execute("DELETE FROM temp.touched_quarters")
+    cur.execute("""
+        INSERT OR IGNORE INTO temp.touched_quarters (ticker, quarter)
+        SELECT h.ticker, h.quarter
+        FROM holdings h
+        JOIN temp.touched_series t
+          ON t.ticker = h.ticker AND t.manager_id = h.manager_id
+    """)
+    cur.execute("""
+        DELETE FROM net_exposure
+        WHERE (ticker, quarter) IN (SELECT ticker, quarter FROM temp.touched_quarters)
+    """)
+    cur.execute("""
+        INSERT INTO net_exposure (ticker, quarter, net_exposure_change)
+        SELECT d.ticker, d.quarter, SUM(d.delta)
+        FROM holdings_deltas d
+        JOIN temp.touched_quarters q
+          ON q.ticker = d.ticker AND q.quarter = d.quarter
+        GROUP BY d.ticker, d.quarter
+    """)
+
+    cur.execute("DELETE FROM temp.touched_quarters")
+    cur.execute("DELETE FROM temp.touched_series")
+
+
+def _rebuild_deltas(cur, tickers=None):
+    """
+    Full re-derivation of holdings_deltas / net_exposure (all tickers, or just `tickers`).
+    """
+    if tickers is None:
+        cur.execute("DELETE FROM net_exposure")
+        _stage_series(cur, "SELECT DISTINCT manager_id, ticker FROM holdings")
+    else:
+        tickers = [t.upper() for t in tickers]
+        placeholders = ",".join(["?"] * len(tickers))
+        cur.execute(f"DELETE FROM net_exposure WHERE ticker IN ({placeholders})", tickers)
+        _stage_series(cur, f"SELECT DISTINCT manager_id, ticker FROM holdings WHERE ticker IN ({placeholders})", tickers)
+        cur.execute(f"DELETE FROM holdings_deltas WHERE ticker IN ({placeholders})", tickers)
+    _refresh_deltas(cur)
+
+
+def _insert_holdings(cur, rows, refresh_deltas: bool = True) -> int:
+    """
+    rows: (accession_no, manager, quarter, ticker, value_k, filed_date), manager as a name and
+    quarter as YYYY-MM-DD; both are converted to the stored id/integer forms here.
+    A row for a position-quarter already stored only replaces it if filed later (see _upsert_holdings).
+    Only the (manager, ticker) series that actually changed get their deltas re-derived.
+    Returns the number of holdings rows inserted or replaced.
+    """
+    ids = _manager_ids(cur, [r[1] for r in rows])
+
+    stored = []
+    for accession_no, manager, quarter, ticker, value_k, filed_date in rows:
+        try:
+            q = quarter_to_int(quarter)
+        except ValueError:
+            continue
+        stored.append((accession_no, ids[manager], q, ticker, value_k, filed_date))
+
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS incoming_holdings (
+            accession_no TEXT, manager_id INTEGER, quarter INTEGER,
+            ticker TEXT, value_k REAL, filed_date TEXT
+        )
+    """)
+    cur.execute("DELETE FROM temp.incoming_holdings")
     cur.executemany("""
-        INSERT OR IGNORE INTO holdings
-        (accession_no, manager, quarter, ticker, value_k, filed_date)
+        INSERT INTO temp.incoming_holdings
+        (accession_no, manager_id, quarter, ticker, value_k, filed_date)
         VALUES (?, ?, ?, ?, ?, ?)
-    """, rows)
+    """, stored)
 
-    conn.commit()
+    if refresh_deltas:
+        _stage_series(cur, """
+            SELECT DISTINCT i.manager_id, i.ticker
+            FROM temp.incoming_holdings i
+            WHERE NOT EXISTS (
+                SELECT 1 FROM holdings h
+                WHERE h.ticker = i.ticker
+                  AND h.manager_id = i.manager_id
+                  AND h.quarter = i.quarter
+                  AND (COALESCE(h.filed_date, ''), h.accession_no)
+                      >= (COALESCE(i.filed_date, ''), i.accession_no)
+            )
+        """)
+
+    # Stored rows this batch is about to replace; incoming rows that lost are archived after the write
+    if ARCHIVE_SUPERSEDED_HOLDINGS:
+        cur.execute("""
+            INSERT OR IGNORE INTO holdings_superseded
+            (accession_no, manager_id, quarter, ticker, value_k, filed_date)
+            SELECT h.accession_no, h.manager_id, h.quarter, h.ticker, h.value_k, h.filed_date
+            FROM holdings h
+            JOIN temp.incoming_holdings i
+              ON i.ticker = h.ticker AND i.manager_id = h.manager_id AND i.quarter = h.quarter
+            WHERE (COALESCE(i.filed_date, ''), i.accession_no)
+                > (COALESCE(h.filed_date, ''), h.accession_no)
+        """)
+
+    conn = cur.connection
+    before = conn.total_changes
+    _upsert_holdings(cur, """
+        SELECT accession_no, manager_id, quarter, ticker, value_k, filed_date
+        FROM temp.incoming_holdings
+    """)
     inserted = conn.total_changes - before
-    conn.close()
+    _archive_losers(cur, "temp.incoming_holdings")
+    cur.execute("DELETE FROM temp.incoming_holdings")
+    incr("holdings_rows_in", len(rows))
+    incr("holdings_inserted", inserted)
+
+    if refresh_deltas:
+        _refresh_deltas(cur)
     return inserted
 
 
+def insert_holdings(rows):
+    """
+    rows: (accession_no, manager, quarter, ticker, value_k, filed_date)
+    """
+    if not rows:
+        return 0
+
+    with transaction() as conn:
+        return _insert_holdings(conn.cursor(), rows)
+
+
+def replace_holdings_for_tickers(tickers, row_batches, replaceable=None):
+    """
+    Deletes the tickers' holdings and re-inserts them from row_batches (an iterable of row lists)
+    in ONE transaction, so a failed rebuild leaves the old rows in place.
+    replaceable: optional accession_no -> bool; only rows from filings it accepts are deleted,
+    the rest are kept and compete with the new rows as usual (latest filing wins).
+    """
+    tickers = [t.upper() for t in tickers]
+    placeholders = ",".join(["?"] * len(tickers))
+
+    with transaction() as conn:
+        cur = conn.cursor()
+        if replaceable is None:
+            cur.execute(f"DELETE FROM holdings WHERE ticker IN ({placeholders})", tickers)
+            cur.execute(f"DELETE FROM holdings_superseded WHERE ticker IN ({placeholders})", tickers)
+        else:
+            stored = cur.execute(f"""
+                SELECT accession_no FROM holdings WHERE ticker IN ({placeholders})
+                UNION
+                SELECT accession_no FROM holdings_superseded WHERE ticker IN ({placeholders})
+            """, tickers + tickers).fetchall()
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS replaced_accessions (accession_no TEXT PRIMARY KEY)")
+            cur.execute("DELETE FROM temp.replaced_accessions")
+            cur.executemany(
+                "INSERT INTO temp.replaced_accessions (accession_no) VALUES (?)",
+                [(a,) for (a,) in stored if replaceable(a)],
+            )
+            for table in ("holdings", "holdings_superseded"):
+                cur.execute(f"""
+                    DELETE FROM {table}
+                    WHERE ticker IN ({placeholders})
+                      AND accession_no IN (SELECT accession_no FROM temp.replaced_accessions)
+                """, tickers)
+        inserted = 0
+        for rows in row_batches:
+            if rows:
+                inserted += _insert_holdings(cur, rows, refresh_deltas=False)
+        _rebuild_deltas(cur, tickers)
+        return inserted
+
+
 def get_backfill_checkpoint(ticker: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT last_filed_at FROM ingest_checkpoint WHERE ticker = ?", (ticker.upper(),))
-    row = cur.fetchone()
-    conn.close()
+    with session() as conn:
+        row = conn.execute(
+            "SELECT last_filed_at FROM ingest_checkpoint WHERE ticker = ?", (ticker.upper(),)
+        ).fetchone()
     return row[0] if row else None
 
 
-def set_backfill_checkpoint(ticker: str, last_filed_at: str):
-    conn = get_connection()
-    cur = conn.cursor()
+def _set_backfill_checkpoint(cur, ticker: str, last_filed_at: str):
     cur.execute("""
         INSERT INTO ingest_checkpoint (ticker, last_filed_at)
         VALUES (?, ?)
         ON CONFLICT(ticker) DO UPDATE SET last_filed_at = excluded.last_filed_at
     """, (ticker.upper(), last_filed_at))
-    conn.commit()
-    conn.close()
+
+
+def set_backfill_checkpoint(ticker: str, last_filed_at: str):
+    with transaction() as conn:
+        _set_backfill_checkpoint(conn.cursor(), ticker, last_filed_at)
+
+
+def get_forward_checkpoint(ticker: str):
+    with session() as conn:
+        row = conn.execute(
+            "SELECT newest_filed_at FROM ingest_checkpoint WHERE ticker = ?", (ticker.upper(),)
+        ).fetchone()
+    return row[0] if row else None
+
+
+def _set_forward_checkpoint(cur, ticker: str, newest_filed_at: str):
+    cur.execute("""
+        INSERT INTO ingest_checkpoint (ticker, newest_filed_at)
+        VALUES (?, ?)
+        ON CONFLICT(ticker) DO UPDATE SET newest_filed_at = excluded.newest_filed_at
+    """, (ticker.upper(), newest_filed_at))
+
+
+def set_forward_checkpoint(ticker: str, newest_filed_at: str):
+    with transaction() as conn:
+        _set_forward_checkpoint(conn.cursor(), ticker, newest_filed_at)
+
+
+def insert_holdings_with_checkpoints(
+    rows,
+    checkpoints: Dict[str, Optional[str]],
+    forward_checkpoints: Optional[Dict[str, Optional[str]]] = None,
+):
+    """
+    Writes a batch's rows and moves each ticker's checkpoint in ONE transaction,
+    so a crash can never leave a checkpoint ahead of the rows it covers.
+    checkpoints: ticker -> last_filed_at (None leaves that ticker untouched)
+    forward_checkpoints: ticker -> newest_filed_at, likewise
+    """
+    with transaction() as conn:
+        cur = conn.cursor()
+        inserted = _insert_holdings(cur, rows) if rows else 0
+        for ticker, last_filed_at in checkpoints.items():
+            if last_filed_at:
+                _set_backfill_checkpoint(cur, ticker, last_filed_at)
+        for ticker, newest_filed_at in (forward_checkpoints or {}).items():
+            if newest_filed_at:
+                _set_forward_checkpoint(cur, ticker, newest_filed_at)
+    return inserted
 
 
 def upsert_prices_eod(rows):
@@ -99,32 +733,126 @@ def upsert_prices_eod(rows):
     if not rows:
         return 0
 
-    conn = get_connection()
-    cur = conn.cursor()
-    before = conn.total_changes
-
-    cur.executemany("""
-        INSERT INTO prices_eod (ticker, date, close)
-        VALUES (?, ?, ?)
-        ON CONFLICT(ticker, date) DO UPDATE SET
-            close = excluded.close
-    """, rows)
-
-    conn.commit()
-    changed = conn.total_changes - before
-    conn.close()
+    with transaction() as conn:
+        before = conn.total_changes
+        conn.executemany("""
+            INSERT INTO prices_eod (ticker, date, close)
+            VALUES (?, ?, ?)
+            ON CONFLICT(ticker, date) DO UPDATE SET
+                close = excluded.close
+        """, rows)
+        changed = conn.total_changes - before
+    incr("prices_upserted", changed)
     return changed
 
 
 def get_prices_eod_for_ticker(ticker: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT date, close
-        FROM prices_eod
-        WHERE ticker = ?
-        ORDER BY date ASC
-    """, (ticker.upper(),))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
\ No newline at end of file
+    with session() as conn:
+        return conn.execute("""
+            SELECT date, close
+            FROM prices_eod
+            WHERE ticker = ?
+            ORDER BY date ASC
+        """, (ticker.upper(),)).fetchall()
+
+
+def get_prices_eod_for_tickers(tickers: List[str]):
+    """
+    (ticker, date, close) for every ticker in one query, ordered by ticker then date.
+    """
+    tickers = [t.upper() for t in tickers]
+    placeholders = ",".join(["?"] * len(tickers))
+    with session() as conn:
+        return conn.execute(f"""
+            SELECT ticker, date, close
+            FROM prices_eod
+            WHERE ticker IN ({placeholders})
+            ORDER BY ticker, date ASC
+        """, tickers).fetchall()
+
+
+def table_state(table: str, value_col: str, date_col: Optional[str] = None):
+    """
+    Cheap change marker: [row count, max rowid, sum of value_col] (+ a checksum of date_col).
+    Appends move the count, delete+reinsert moves the max rowid, in-place upserts move the sum.
+    WITHOUT ROWID tables (holdings) have no rowid to report; the count and sum stand for them.
+    date_col catches upserts that only change a date (a later filing with the same value).
+    """
+    with session() as conn:
+        rowid = "MAX(rowid)" if _has_rowid(conn.cursor(), table) else "NULL"
+        dates = f", TOTAL(CAST(REPLACE({date_col}, '-', '') AS INTEGER))" if date_col else ""
+        return list(conn.execute(f"SELECT COUNT(*), {rowid}, TOTAL({value_col}){dates} FROM {table}").fetchone())
+
+
+def get_stage_fingerprint(stage: str) -> Optional[str]:
+    with session() as conn:
+        row = conn.execute("SELECT fingerprint FROM stage_cache WHERE stage = ?", (stage,)).fetchone()
+    return row[0] if row else None
+
+
+def set_stage_fingerprint(stage: str, fingerprint: str):
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO stage_cache (stage, fingerprint, updated_at)
+            VALUES (?, ?, datetime('now'))
+            ON CONFLICT(stage) DO UPDATE SET
+                fingerprint = excluded.fingerprint,
+                updated_at = excluded.updated_at
+        """, (stage, fingerprint))
+
+
+def get_price_import_fingerprint(path: str) -> Optional[str]:
+    with session() as conn:
+        row = conn.execute("SELECT fingerprint FROM price_import_files WHERE path = ?", (path,)).fetchone()
+    return row[0] if row else None
+
+
+def set_price_import_fingerprint(path: str, fingerprint: str):
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO price_import_files (path, fingerprint, imported_at)
+            VALUES (?, ?, datetime('now'))
+            ON CONFLICT(path) DO UPDATE SET
+                fingerprint = excluded.fingerprint,
+                imported_at = excluded.imported_at
+        """, (path, fingerprint))
+
+
+def get_shard_phases(universe: str) -> Dict[int, str]:
+    with session() as conn:
+        rows = conn.execute(
+            "SELECT shard_id, phase FROM universe_progress WHERE universe = ?", (universe,)
+        ).fetchall()
+    return dict(rows)
+
+
+def latest_unfinished_universe(suffix: str) -> Optional[str]:
+    """
+    The most recently updated universe key ending in `suffix` with a shard not yet done.
+    """
+    with session() as conn:
+        row = conn.execute("""
+            SELECT universe FROM universe_progress
+            WHERE substr(universe, -length(?)) = ?
+            GROUP BY universe
+            HAVING SUM(phase != 'done') > 0
+            ORDER BY MAX(updated_at) DESC
+            LIMIT 1
+        """, (suffix, suffix)).fetchone()
+    return row[0] if row else None
+
+
+def set_shard_phase(universe: str, shard_id: int, tickers: List[str], phase: str):
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO universe_progress (universe, shard_id, tickers, phase, updated_at)
+            VALUES (?, ?, ?, ?, datetime('now'))
+            ON CONFLICT(universe, shard_id) DO UPDATE SET
+                phase = excluded.phase,
+                updated_at = excluded.updated_at
+        """, (universe, shard_id, ",".join(tickers), phase))
+
+
+def reset_universe_progress(universe: str):
+    with transaction() as conn:
+        conn.execute("DELETE FROM universe_progress WHERE universe = ?", (universe,))
@@ -0,0 +1,126 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Iterator, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "sec_cache")
+CACHE_MAX_BYTES = 2 * 1024 ** 3  # 2 GB of compressed filings
+
+
+class FilingCache:
+    """
+    Raw sec-api filing JSON on disk, gzip-compressed, one file per accession number.
+    Files are addressed by sha1(accession_no) and fanned out over 256 sub-directories.
+    get() and touch() refresh the file's mtime, so eviction (oldest mtime first) is LRU:
+    ingest touches every filing it sees again instead of rewriting it.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None  # lazily computed total bytes on disk
+
+    def _path(self, accession_no: str) -> str:
+        h = hashlib.sha1(accession_no.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, h[:2], h + ".json.gz")
+
+    def _files(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".json.gz"):
+                    yield os.path.join(root, name)
+
+    def _current_size(self) -> int:
+        if self._size is None:
+            self._size = sum(os.path.getsize(p) for p in self._files())
+        return self._size
+
+    def has(self, accession_no: str) -> bool:
+        return os.path.exists(self._path(accession_no))
+
+    def touch(self, accession_no: str) -> bool:
+        """
+        Marks a cached filing as just used; False if it isn't cached.
+        """
+        try:
+            os.utime(self._path(accession_no))
+        except OSError:
+            return False
+        return True
+
+    def get(self, accession_no: str) -> Optional[Dict]:
+        path = self._path(accession_no)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                filing = json.load(f)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return filing
+
+    def put(self, accession_no: str, filing: Dict):
+        path = self._path(accession_no)
+        data = gzip.compress(json.dumps(filing, separators=(",", ":")).encode("utf-8"))
+
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            old = os.path.getsize(path) if os.path.exists(path) else 0
+            size = self._current_size()  # before the write, so the new file isn't counted twice
+
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+            self._size = size - old + len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        Drops least recently used files until the cache is back under 90% of the cap.
+        """
+        target = int(self.max_bytes * 0.9)
+        files = []
+        for p in self._files():
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+        files.sort()
+
+        size = sum(f[1] for f in files)
+        for _, nbytes, p in files:
+            if size <= target:
+                break
+            try:
+                os.remove(p)
+                size -= nbytes
+            except OSError:
+                pass
+        self._size = size
+
+    def iter_filings(self) -> Iterator[Dict]:
+        """
+        Every cached filing, one at a time (no network). Does not touch mtimes.
+        """
+        for p in self._files():
+            try:
+                with gzip.open(p, "rt", encoding="utf-8") as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._current_size()
@@ -0,0 +1,126 @@
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+POOL_SIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    One pooled session per process so every worker thread reuses keep-alive connections.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session = s
+        return _session
+
+
+class RateLimiter:
+    """
+    Spaces requests so at most `requests_per_second` leave this process, across all threads.
+    requests_per_second <= 0 disables the limit.
+    """
+
+    def __init__(self, requests_per_second: float):
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+        self.set_rate(requests_per_second)
+
+    def set_rate(self, requests_per_second: float):
+        with self._lock:
+            self.requests_per_second = requests_per_second
+            self._interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_at)
+            self._next_at = slot + self._interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _retry_after_seconds(r: requests.Response) -> Optional[float]:
+    value = r.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _response_bytes(r: requests.Response, stream: bool) -> int:
+    length = r.headers.get("Content-Length")
+    if length and length.isdigit():
+        return int(length)
+    # No length header: count the body unless the caller wants to stream it
+    return 0 if stream else len(r.content)
+
+
+def request_with_retry(
+    method: str,
+    url: str,
+    limiter: Optional[RateLimiter] = None,
+    max_retries: int = MAX_RETRIES,
+    **kwargs,
+) -> requests.Response:
+    """
+    Sends a request through the shared session, retrying 429/5xx and connection errors
+    with exponential backoff (Retry-After wins when the server sends one).
+    Raises for any other HTTP error, or once retries are exhausted.
+    """
+    session = get_session()
+    attempt = 0
+
+    while True:
+        if limiter is not None:
+            limiter.wait()
+
+        backoff = min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * (2 ** attempt))
+        started = time.perf_counter()
+        try:
+            r = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            metrics.record_http(url, time.perf_counter() - started, None, retry=attempt > 0)
+            if attempt >= max_retries:
+                raise
+            attempt += 1
+            time.sleep(backoff)
+            continue
+
+        metrics.record_http(
+            url,
+            time.perf_counter() - started,
+            r.status_code,
+            _response_bytes(r, kwargs.get("stream", False)),
+            retry=attempt > 0,
+        )
+
+        if r.status_code in RETRY_STATUS and attempt < max_retries:
+            wait = _retry_after_seconds(r)
+            r.close()
+            attempt += 1
+            time.sleep(backoff if wait is None else min(wait, MAX_BACKOFF_SECONDS))
+            continue
+
+        r.raise_for_status()
+        return r
@@ -0,0 +1,317 @@
+"""
+Bulk import of licensed daily price files (CSV or Parquet) into prices_eod, with no API calls.
+
+    python import_prices.py history/eod_*.parquet extra.csv.gz --tickers ORCL UNH FDS
+
+Files are read in chunks (pandas for CSV, pyarrow record batches for Parquet) and validated:
+a ticker, a parseable date and a finite positive close, else the row is rejected and counted.
+Valid rows go into a (ticker, date)-keyed staging table in a scratch SQLite file with the
+journal off, so duplicates collapse there (the last file/row wins). One transaction then
+upserts the staged rows into prices_eod in key order, which appends to the primary-key index
+instead of inserting at random. Throughput is bounded by SQLite's per-row inserts, a few
+hundred thousand rows a second.
+
+Files whose size/mtime haven't changed since their last import (price_import_files) are
+skipped (--force re-reads).
+"""
+import argparse
+import os
+import tempfile
+from collections import Counter
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import db
+from db import session, transaction, create_db, get_price_import_fingerprint, set_price_import_fingerprint
+from metrics import incr
+
+CHUNK_ROWS = 1_000_000
+STAGING_CACHE_KB = 262_144  # 256 MB page cache for the scratch file
+
+# Accepted header names (case-insensitive), first match wins
+TICKER_COLUMNS = ("ticker", "symbol")
+DATE_COLUMNS = ("date", "trade_date", "timestamp")
+CLOSE_COLUMNS = ("close", "close_price")
+
+CSV_SUFFIXES = (".csv", ".csv.gz", ".csv.bz2", ".csv.zip", ".csv.xz", ".txt")
+PARQUET_SUFFIXES = (".parquet", ".pq")
+
+
+def _file_format(path: str) -> str:
+    name = path.lower()
+    if name.endswith(PARQUET_SUFFIXES):
+        return "parquet"
+    if name.endswith(CSV_SUFFIXES):
+        return "csv"
+    raise ValueError(f"{path}: unknown price file type (expected {', '.join(CSV_SUFFIXES + PARQUET_SUFFIXES)})")
+
+
+def _parquet():
+    try:
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet price files need pyarrow: pip install pyarrow") from e
+    return pyarrow.parquet
+
+
+def expand_paths(paths: List[str]) -> List[str]:
+    """
+    Files as given; directories contribute their CSV/Parquet files (sorted, recursively).
+    """
+    files = []
+    for p in paths:
+        if not os.path.isdir(p):
+            files.append(p)
+            continue
+        for root, _, names in sorted(os.walk(p)):
+            files.extend(
+                os.path.join(root, n) for n in sorted(names)
+                if n.lower().endswith(CSV_SUFFIXES + PARQUET_SUFFIXES)
+            )
+    return files
+
+
+def _header(path: str) -> List[str]:
+    if _file_format(path) == "parquet":
+        return list(_parquet().ParquetFile(path).schema_arrow.names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def _resolve_columns(path: str, ticker_col: Optional[str], date_col: Optional[str], close_col: Optional[str]) -> Dict[str, str]:
+    """
+    File column for ticker/date/close: the explicit name if given, else the first known alias present.
+    """
+    header = _header(path)
+    by_lower = {c.lower(): c for c in header}
+    out = {}
+    for key, given, aliases in [
+        ("ticker", ticker_col, TICKER_COLUMNS),
+        ("date", date_col, DATE_COLUMNS),
+        ("close", close_col, CLOSE_COLUMNS),
+    ]:
+        name = by_lower.get(given.lower()) if given else next((by_lower[a] for a in aliases if a in by_lower), None)
+        if name is None:
+            raise ValueError(f"{path}: no {key} column (have {', '.join(header)})")
+        out[key] = name
+    return out
+
+
+def _iter_chunks(path: str, cols: Dict[str, str], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    The file's ticker/date/close columns in chunks of about chunk_rows rows.
+    """
+    names = [cols["ticker"], cols["date"], cols["close"]]
+    if _file_format(path) == "parquet":
+        for batch in _parquet().ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=names):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(
+            path,
+            usecols=names,
+            dtype={cols["ticker"]: str, cols["date"]: str},
+            chunksize=chunk_rows,
+        )
+
+
+def _normalize_dates(s: pd.Series) -> np.ndarray:
+    """
+    YYYY-MM-DD strings (None where unparseable) from datetime, yyyymmdd integer, or
+    ISO / yyyymmdd string columns; timestamps keep their date part.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        parsed = s.dt.tz_localize(None) if getattr(s.dt, "tz", None) is not None else s
+    elif pd.api.types.is_numeric_dtype(s):
+        parsed = pd.to_datetime(s.astype("Int64").astype("string"), format="%Y%m%d", errors="coerce")
+    else:
+        text = s.astype("string").str.strip()
+        parsed = pd.to_datetime(text.str.slice(0, 10), format="%Y-%m-%d", errors="coerce")
+        compact = parsed.isna() & text.str.fullmatch(r"\d{8}").fillna(False)
+        if compact.any():
+            parsed = parsed.where(~compact, pd.to_datetime(text[compact], format="%Y%m%d", errors="coerce"))
+
+    days = parsed.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+    out = np.datetime_as_string(days, unit="D").astype(object)
+    out[np.isnat(days)] = None
+    return out
+
+
+def _factorized(s: pd.Series, clean) -> np.ndarray:
+    """
+    clean() applied to the distinct values of s only (a few thousand tickers or dates per
+    million rows), broadcast back to one object array; missing values map to None.
+    """
+    codes, uniques = pd.factorize(s)
+    values = np.append(np.asarray(clean(pd.Series(uniques)), dtype=object), None)
+    return values[codes]
+
+
+def _clean_tickers(s: pd.Series) -> np.ndarray:
+    t = s.astype("string").str.strip().str.upper()
+    return t.where(t != "").to_numpy(dtype=object, na_value=None)
+
+
+def clean_chunk(df: pd.DataFrame, cols: Dict[str, str], tickers: Optional[set] = None):
+    """
+    Validated (ticker, date, close) arrays for one chunk, plus a Counter of rejected rows by
+    reason and the number of rows skipped by the tickers filter. Row order is kept.
+    """
+    rejects = Counter()
+
+    ticker = _factorized(df[cols["ticker"]], _clean_tickers)
+    dates = _factorized(df[cols["date"]], _normalize_dates)
+    close = pd.to_numeric(df[cols["close"]], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+    bad_ticker = pd.isna(ticker)
+    bad_date = ~bad_ticker & pd.isna(dates)
+    bad_close = ~bad_ticker & ~bad_date & ~(np.isfinite(close) & (close > 0))
+    rejects["ticker"] = int(bad_ticker.sum())
+    rejects["date"] = int(bad_date.sum())
+    rejects["close"] = int(bad_close.sum())
+    keep = ~(bad_ticker | bad_date | bad_close)
+
+    skipped = 0
+    if tickers is not None:
+        wanted = keep & pd.Series(ticker).isin(tickers).to_numpy()
+        skipped = int(keep.sum() - wanted.sum())
+        keep = wanted
+
+    if keep.all():
+        return (ticker, dates, close), +rejects, skipped
+    return (ticker[keep], dates[keep], close[keep]), +rejects, skipped
+
+
+def _file_fingerprint(path: str, cols: Dict[str, str], tickers: Optional[set]) -> str:
+    st = os.stat(path)
+    wanted = ",".join(sorted(tickers)) if tickers is not None else "*"
+    return f"{st.st_size}:{st.st_mtime_ns}:{cols['ticker']},{cols['date']},{cols['close']}:{wanted}"
+
+
+def import_price_files(
+    paths: List[str],
+    tickers: Optional[List[str]] = None,
+    ticker_col: Optional[str] = None,
+    date_col: Optional[str] = None,
+    close_col: Optional[str] = None,
+    chunk_rows: int = CHUNK_ROWS,
+    force: bool = False,
+) -> Dict:
+    """
+    Loads every file in `paths` (files or directories) into prices_eod in one transaction;
+    an existing (ticker, date) close is overwritten. tickers limits the import to those names.
+    Returns counts: files, skipped_files, rows_read, rejected (by reason), filtered, staged, changed.
+    """
+    files = expand_paths(paths)
+    wanted = {t.upper() for t in tickers} if tickers else None
+    stats = {"files": 0, "skipped_files": 0, "rows_read": 0, "rejected": Counter(), "filtered": 0, "staged": 0, "changed": 0}
+
+    create_db()
+    plan = []
+    with session():
+        for path in files:
+            cols = _resolve_columns(path, ticker_col, date_col, close_col)
+            fp = _file_fingerprint(path, cols, wanted)
+            if not force and get_price_import_fingerprint(os.path.abspath(path)) == fp:
+                print(f"{path}: unchanged since last import, skipped")
+                stats["skipped_files"] += 1
+                continue
+            plan.append((path, cols, fp))
+    if not plan:
+        return stats
+
+    # Scratch file next to the DB; ATTACH/DETACH can't run inside the transaction
+    fd, staging_path = tempfile.mkstemp(prefix="price_import_", suffix=".db", dir=os.path.dirname(os.path.abspath(db.DB_PATH)))
+    os.close(fd)
+    try:
+        with session() as conn:
+            conn.execute("ATTACH DATABASE ? AS price_import", (staging_path,))
+            try:
+                conn.execute("PRAGMA price_import.journal_mode = OFF")
+                conn.execute("PRAGMA price_import.synchronous = OFF")
+                conn.execute(f"PRAGMA price_import.cache_size = -{STAGING_CACHE_KB}")
+                conn.execute("""
+                    CREATE TABLE price_import.prices (
+                        ticker TEXT NOT NULL,
+                        date   TEXT NOT NULL,
+                        close  REAL NOT NULL,
+                        PRIMARY KEY (ticker, date)
+                    ) WITHOUT ROWID
+                """)
+                with transaction():
+                    _load(conn, plan, wanted, chunk_rows, stats)
+            finally:
+                conn.execute("DETACH DATABASE price_import")
+    finally:
+        os.remove(staging_path)
+
+    rejected = ", ".join(f"{k}={v}" for k, v in sorted(stats["rejected"].items())) or "none"
+    print(
+        f"price import: files={stats['files']} rows={stats['rows_read']:,} rejected: {rejected} "
+        f"filtered={stats['filtered']:,} staged={stats['staged']:,} stored/updated={stats['changed']:,}"
+    )
+    return stats
+
+
+def _load(conn, plan, wanted, chunk_rows: int, stats: Dict):
+    """
+    Stages every planned file, then writes the staged rows to prices_eod (caller's transaction).
+    """
+    # Chunks are parsed on this thread: a parser thread contending for the GIL slows
+    # executemany (which releases and re-takes it per row) far more than it overlaps
+    for path, cols, fp in plan:
+        n_file = 0
+        for chunk in _iter_chunks(path, cols, chunk_rows):
+            (ticker, dates, close), rejects, skipped = clean_chunk(chunk, cols, wanted)
+            conn.executemany(
+                "INSERT OR REPLACE INTO price_import.prices (ticker, date, close) VALUES (?, ?, ?)",
+                zip(ticker.tolist(), dates.tolist(), close.tolist()),
+            )
+            n_file += len(chunk)
+            stats["rejected"].update(rejects)
+            stats["filtered"] += skipped
+        stats["rows_read"] += n_file
+        incr("price_import_rows", n_file)
+        stats["files"] += 1
+        set_price_import_fingerprint(os.path.abspath(path), fp)
+        print(f"{path}: {n_file:,} rows read")
+
+    stats["staged"] = conn.execute("SELECT COUNT(*) FROM price_import.prices").fetchone()[0]
+
+    # Staged rows come out in (ticker, date) order, so the primary-key index grows by appending
+    before = conn.total_changes
+    conn.execute("""
+        INSERT INTO main.prices_eod (ticker, date, close)
+        SELECT ticker, date, close FROM price_import.prices WHERE true
+        ON CONFLICT(ticker, date) DO UPDATE SET
+            close = excluded.close
+        WHERE prices_eod.close IS NOT excluded.close
+    """)
+    stats["changed"] = conn.total_changes - before
+    incr("prices_imported", stats["changed"])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Bulk-load vendor daily price files into prices_eod")
+    ap.add_argument("paths", nargs="+", help="CSV (.csv, .csv.gz, ...) / Parquet files or directories of them")
+    ap.add_argument("--tickers", nargs="+", metavar="TICKER", help="only import these tickers")
+    ap.add_argument("--ticker-col", help=f"default: first of {', '.join(TICKER_COLUMNS)}")
+    ap.add_argument("--date-col", help=f"default: first of {', '.join(DATE_COLUMNS)}")
+    ap.add_argument("--close-col", help=f"default: first of {', '.join(CLOSE_COLUMNS)}")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    ap.add_argument("--force", action="store_true", help="re-import files even if unchanged")
+    args = ap.parse_args(argv)
+
+    import_price_files(
+        args.paths,
+        tickers=args.tickers,
+        ticker_col=args.ticker_col,
+        date_col=args.date_col,
+        close_col=args.close_col,
+        chunk_rows=args.chunk_rows,
+        force=args.force,
+    )
+
+
+if __name__ == "__main__":
+    main()
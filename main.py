@@ -1,4 +1,111 @@
-from pipeline import run_pipeline
+import argparse
+
+# Only the light pipeline module loads here; each stage imports its own heavy libraries
+import pipeline
+
+
+def _ingest_args(p):
+    g = p.add_argument_group("ingest")
+    g.add_argument("--years", type=int, help=f"13F backfill window (default {pipeline.YEARS_13F_WINDOW})")
+    g.add_argument("--workers", type=int, help=f"SEC fetch threads (default {pipeline.SEC_INGEST_WORKERS})")
+    g.add_argument("--rps", type=float, help=f"SEC requests per second (default {pipeline.SEC_REQUESTS_PER_SECOND})")
+    g.add_argument("--batch-size", type=int, help=f"tickers per SEC query (default {pipeline.SEC_BATCH_SIZE})")
+    g.add_argument(
+        "--mode",
+        choices=["forward", "backfill", "both"],
+        help=f"forward: only filings newer than the last run; backfill: only older (default {pipeline.SEC_INGEST_MODE})",
+    )
+    g.add_argument("--replay-from-cache", action="store_true", help="rebuild holdings from sec_cache/ (no API calls)")
+    g.add_argument("--no-ingest", action="store_true", help="skip SEC ingest")
+
+
+def _prices_args(p):
+    g = p.add_argument_group("prices")
+    g.add_argument("--quarters", type=int, help=f"recent quarters priced per ticker (default {pipeline.PRICE_QUARTERS_PER_TICKER})")
+    g.add_argument(
+        "--import-file",
+        action="append",
+        metavar="PATH",
+        help="vendor daily price CSV/Parquet file or directory to load first (repeatable)",
+    )
+    g.add_argument("--no-fetch", action="store_true", help="don't call the price API for missing quarters")
+
+
+def _analyze_args(p):
+    g = p.add_argument_group("analyze")
+    g.add_argument("--report-workers", type=int, help="processes writing the trade reports")
+    g.add_argument("--backtest-workers", type=int, help="processes for the backtest sweep")
+    g.add_argument("--no-snapshot", action="store_true", help="don't write the Parquet snapshot")
+
+
+def _stats_args(p):
+    g = p.add_argument_group("stats")
+    g.add_argument("--resamples", type=int, help=f"bootstrap/permutation draws, 0 = off (default {pipeline.STATS_RESAMPLES:,})")
+    g.add_argument(
+        "--normalize",
+        choices=["total_13f_value", "none"],
+        help=f"panel regression exposure scale (default {pipeline.PANEL_NORMALIZE})",
+    )
+
+
+SUBCOMMANDS = {
+    "ingest": ("pull new 13F filings into holdings", [_ingest_args]),
+    "prices": ("import price files, fetch missing quarter-end closes", [_prices_args]),
+    "analyze": ("trade reports, exposure merge, summary and backtest", [_analyze_args]),
+    "stats": ("statistical tests and panel regressions", [_stats_args]),
+    "plots": ("exposure/return charts", []),
+    "all": ("every stage in order", [_ingest_args, _prices_args, _analyze_args, _stats_args]),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--tickers", nargs="+", metavar="TICKER", help=f"default: {' '.join(pipeline.TICKERS)}")
+    common.add_argument(
+        "--force",
+        action="append",
+        default=[],
+        choices=pipeline.STAGES + ["all"],
+        metavar="STAGE",
+        help=f"re-run STAGE even if its inputs are unchanged (repeatable; one of {', '.join(pipeline.STAGES)}, all)",
+    )
+
+    parser = argparse.ArgumentParser(description="13F flows pipeline")
+    sub = parser.add_subparsers(dest="command", metavar="COMMAND")
+    for name, (help_text, groups) in SUBCOMMANDS.items():
+        p = sub.add_parser(name, parents=[common], help=help_text, description=help_text)
+        for add in groups:
+            add(p)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    command = args.command or "all"
+    opt = lambda name, default=None: getattr(args, name, default)
+
+    normalize = opt("normalize")
+    pipeline.configure(
+        tickers=[t.upper() for t in args.tickers] if opt("tickers") else None,
+        years_13f_window=opt("years"),
+        sec_ingest_workers=opt("workers"),
+        sec_requests_per_second=opt("rps"),
+        sec_batch_size=opt("batch_size"),
+        sec_ingest_mode=opt("mode"),
+        sec_replay_from_cache=True if opt("replay_from_cache") else None,
+        run_sec_ingest=False if opt("no_ingest") else None,
+        price_quarters_per_ticker=opt("quarters"),
+        price_import_files=opt("import_file"),
+        price_fetch_missing=False if opt("no_fetch") else None,
+        report_workers=opt("report_workers"),
+        backtest_workers=opt("backtest_workers"),
+        write_snapshot=False if opt("no_snapshot") else None,
+        stats_resamples=opt("resamples"),
+        panel_normalize=None if normalize is None else (False if normalize == "none" else normalize),
+    )
+    pipeline.run_command(command, force=opt("force", []))
+
 
 if __name__ == "__main__":
-    run_pipeline()
\ No newline at end of file
+    main()
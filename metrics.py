@@ -0,0 +1,258 @@
+"""
+Lightweight run instrumentation: per-stage wall/CPU time and row counts, HTTP stats per
+endpoint, SQL statement timings and free-form counters, written out as one JSON report per run.
+
+Everything is process-global and thread-safe, so worker threads (SEC ingest) record into the
+same report. Hooks live in http_client.request_with_retry and db.get_connection.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+# Upper bounds (ms) of the HTTP latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000]
+SQL_KEY_CHARS = 120
+SQL_TOP_N = 25
+
+_lock = threading.Lock()
+_run: Dict = {}
+_current_stage: Optional[Dict] = None
+
+
+def reset():
+    """
+    Starts a new run: clears every stage, HTTP, SQL and counter record.
+    """
+    global _run, _current_stage
+    now = datetime.now(timezone.utc)
+    with _lock:
+        _run = {
+            "run_id": now.strftime("%Y%m%dT%H%M%SZ"),
+            "started_at": now.isoformat(timespec="seconds"),
+            "t0": time.perf_counter(),
+            "stages": [],
+            "http": {},
+            "sql": {},
+            "counters": {},
+        }
+        _current_stage = None
+
+
+reset()
+
+
+def _stage_add(key: str, n: float):
+    if _current_stage is not None:
+        _current_stage[key] = _current_stage.get(key, 0) + n
+
+
+def incr(name: str, n: float = 1):
+    """
+    Adds n to a named counter, both run-wide and on the running stage.
+    """
+    with _lock:
+        _run["counters"][name] = _run["counters"].get(name, 0) + n
+        if _current_stage is not None:
+            counters = _current_stage["counters"]
+            counters[name] = counters.get(name, 0) + n
+
+
+def record_http(url: str, seconds: float, status: Optional[int], n_bytes: int = 0, retry: bool = False):
+    """
+    One HTTP attempt. status=None means the request failed before a response (timeout, reset).
+    """
+    parts = urlsplit(url)
+    endpoint = f"{parts.netloc}{parts.path}"
+    ms = seconds * 1000
+
+    with _lock:
+        e = _run["http"].get(endpoint)
+        if e is None:
+            e = _run["http"][endpoint] = {
+                "requests": 0,
+                "retries": 0,
+                "errors": 0,
+                "bytes": 0,
+                "seconds": 0.0,
+                "max_ms": 0.0,
+                "status": {},
+                "latency_ms": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            }
+        e["requests"] += 1
+        e["retries"] += int(retry)
+        e["bytes"] += n_bytes
+        e["seconds"] += seconds
+        e["max_ms"] = max(e["max_ms"], ms)
+        key = str(status) if status is not None else "error"
+        e["status"][key] = e["status"].get(key, 0) + 1
+        if status is None or status >= 400:
+            e["errors"] += 1
+        i = next((i for i, b in enumerate(LATENCY_BUCKETS_MS) if ms <= b), len(LATENCY_BUCKETS_MS))
+        e["latency_ms"][i] += 1
+
+        _stage_add("http_requests", 1)
+        _stage_add("http_seconds", seconds)
+
+
+def record_sql(sql: str, seconds: float, new_statement: bool = True):
+    """
+    Time spent on one statement; fetches after the execute add time without adding a count.
+    """
+    key = " ".join(sql.split())[:SQL_KEY_CHARS]
+    with _lock:
+        s = _run["sql"].get(key)
+        if s is None:
+            s = _run["sql"][key] = {"count": 0, "seconds": 0.0, "max_seconds": 0.0}
+        s["count"] += int(new_statement)
+        s["seconds"] += seconds
+        s["max_seconds"] = max(s["max_seconds"], seconds)
+
+        _stage_add("sql_statements", int(new_statement))
+        _stage_add("sql_seconds", seconds)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that reports each statement's execute + fetch time to record_sql.
+    """
+
+    _sql = ""
+
+    def _timed(self, new_statement, fn, *args):
+        t = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            record_sql(self._sql, time.perf_counter() - t, new_statement)
+
+    def execute(self, sql, *args):
+        self._sql = sql
+        return self._timed(True, super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        self._sql = sql
+        return self._timed(True, super().executemany, sql, *args)
+
+    def fetchall(self):
+        return self._timed(False, super().fetchall)
+
+    def fetchmany(self, *args):
+        return self._timed(False, super().fetchmany, *args)
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    sqlite3 connection factory whose cursors (including conn.execute and pandas) are timed.
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+
+@contextmanager
+def _profiler(kind: Optional[str], name: str, out_dir: Optional[str]):
+    if not kind:
+        yield
+        return
+
+    os.makedirs(out_dir, exist_ok=True)
+    if kind == "cprofile":
+        import cProfile
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            prof.dump_stats(os.path.join(out_dir, f"{name}.prof"))
+    elif kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument not installed; stage runs unprofiled (pip install pyinstrument)")
+            yield
+            return
+        prof = Profiler()
+        prof.start()
+        try:
+            yield
+        finally:
+            prof.stop()
+            with open(os.path.join(out_dir, f"{name}.html"), "w", encoding="utf-8") as f:
+                f.write(prof.output_html())
+    else:
+        raise ValueError(f"unknown profiler: {kind}")
+
+
+@contextmanager
+def stage(name: str, profile: Optional[str] = None, profile_dir: Optional[str] = None):
+    """
+    Times one pipeline stage. The yielded dict takes rows_in / rows_out / skipped from the caller;
+    HTTP, SQL and counters recorded while it runs are attributed to it.
+    profile="cprofile" or "pyinstrument" writes <profile_dir>/<name>.prof / .html.
+    """
+    global _current_stage
+    rec = {"stage": name, "rows_in": None, "rows_out": None, "skipped": False, "counters": {}}
+    with _lock:
+        outer = _current_stage
+        _current_stage = rec
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        with _profiler(profile, name, profile_dir):
+            yield rec
+    finally:
+        rec["wall_seconds"] = round(time.perf_counter() - wall, 6)
+        rec["cpu_seconds"] = round(time.process_time() - cpu, 6)
+        with _lock:
+            _run["stages"].append(rec)
+            _current_stage = outer
+
+
+def run_id() -> str:
+    return _run["run_id"]
+
+
+def report() -> Dict:
+    with _lock:
+        sql = sorted(_run["sql"].items(), key=lambda kv: kv[1]["seconds"], reverse=True)
+        return {
+            "run_id": _run["run_id"],
+            "started_at": _run["started_at"],
+            "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "wall_seconds": round(time.perf_counter() - _run["t0"], 6),
+            "stages": [dict(s) for s in _run["stages"]],
+            "http": {
+                "latency_buckets_ms": LATENCY_BUCKETS_MS + ["inf"],
+                "endpoints": json.loads(json.dumps(_run["http"])),
+            },
+            "sql": {
+                "statements": sum(s["count"] for _, s in sql),
+                "seconds": sum(s["seconds"] for _, s in sql),
+                "top": [dict(statement=k, **v) for k, v in sql[:SQL_TOP_N]],
+            },
+            "counters": dict(_run["counters"]),
+        }
+
+
+def write_report(out_dir: str) -> str:
+    """
+    Writes report() to <out_dir>/run_<run_id>.json and returns the path.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"run_{run_id()}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report(), f, indent=2)
+    return path
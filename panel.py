@@ -0,0 +1,286 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse, stats
+
+from db import session, quarter_text_sql
+
+Y_COL = "price_return_next_q"
+X_COL = "net_exposure_change"
+NW_LAGS = 4
+# Alternating projections, only used for three or more sets of effects
+FE_TOL = 1e-10  # stop when no group mean is above this fraction of the column's scale
+FE_MAX_ITER = 500
+
+
+def get_total_13f_value(tickers: List[str]) -> pd.DataFrame:
+    """
+    Sum of value_k across all managers per ticker+quarter: ["ticker", "quarter", "total_13f_value"].
+    """
+    tickers = [t.upper() for t in tickers]
+    placeholders = ",".join(["?"] * len(tickers))
+    query = f"""
+    SELECT
+        ticker,
+        {quarter_text_sql()} AS quarter,
+        SUM(value_k) AS total_13f_value
+    FROM holdings
+    WHERE ticker IN ({placeholders})
+    GROUP BY ticker, holdings.quarter
+    """
+    with session() as conn:
+        return pd.read_sql(query, conn, params=tickers)
+
+
+def normalize_exposure(df: pd.DataFrame, by: str = "total_13f_value") -> pd.DataFrame:
+    """
+    Adds "exposure_norm" = net_exposure_change / scale, so ORCL and FDS are on one scale.
+    by="total_13f_value": the ticker's total 13F value that quarter (looked up from holdings).
+    by="market_cap": a market_cap column the caller supplies (the DB has no share counts).
+    Rows without a positive scale are dropped.
+    """
+    out = df.copy()
+    if by == "total_13f_value":
+        if "total_13f_value" not in out.columns:
+            tot = get_total_13f_value(out["ticker"].unique().tolist())
+            out = out.merge(tot, on=["ticker", "quarter"], how="left")
+        scale = out["total_13f_value"]
+    elif by == "market_cap":
+        if "market_cap" not in out.columns:
+            raise ValueError("normalize_exposure(by='market_cap') needs a market_cap column")
+        scale = out["market_cap"]
+    else:
+        raise ValueError(f"unknown normalization: {by}")
+
+    out["exposure_norm"] = out[X_COL].astype(float) / scale.astype(float)
+    return out[scale.astype(float) > 0].reset_index(drop=True)
+
+
+def _design(df: pd.DataFrame, y: str, x: List[str]):
+    d = df.dropna(subset=[y] + x)
+    return d, d[y].to_numpy(dtype=float), d[x].to_numpy(dtype=float).reshape(len(d), len(x))
+
+
+def _result(names: List[str], beta: np.ndarray, se: np.ndarray, dof: int, n_obs: int, **extra) -> Dict:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = beta / se
+    p = 2 * stats.t.sf(np.abs(t), df=max(dof, 1))
+    out = {
+        "params": dict(zip(names, beta.tolist())),
+        "se": dict(zip(names, se.tolist())),
+        "t_stat": dict(zip(names, t.tolist())),
+        "p_value": dict(zip(names, p.tolist())),
+        "n_obs": int(n_obs),
+    }
+    out.update(extra)
+    return out
+
+
+def _ols_se(X: np.ndarray, resid: np.ndarray, dof: int, clusters: Optional[np.ndarray]) -> np.ndarray:
+    """
+    Classical SEs, or cluster-robust (CR1) when clusters are given.
+    """
+    xtx_inv = np.linalg.pinv(X.T @ X)
+    if clusters is None:
+        s2 = resid @ resid / max(dof, 1)
+        return np.sqrt(np.diag(xtx_inv) * s2)
+
+    codes, uniq = pd.factorize(clusters)
+    g = len(uniq)
+    n, k = X.shape
+    # Per-cluster score sums via one bincount per regressor (no cluster loop)
+    scores = np.column_stack([np.bincount(codes, weights=X[:, j] * resid, minlength=g) for j in range(k)])
+    meat = scores.T @ scores
+    c = (g / max(g - 1, 1)) * ((n - 1) / max(dof, 1))
+    return np.sqrt(np.diag(c * xtx_inv @ meat @ xtx_inv))
+
+
+def pooled_ols(df: pd.DataFrame, y: str = Y_COL, x: Optional[List[str]] = None, cluster: Optional[str] = "ticker") -> Dict:
+    """
+    y = a + b'x over all ticker-quarters, SEs clustered by `cluster` (None = classical).
+    """
+    x = x or [X_COL]
+    d, Y, X = _design(df, y, x)
+    X = np.column_stack([np.ones(len(Y)), X])
+    beta, *_ = np.linalg.lstsq(X, Y, rcond=None)
+    resid = Y - X @ beta
+    dof = len(Y) - X.shape[1]
+    se = _ols_se(X, resid, dof, d[cluster].to_numpy() if cluster else None)
+    return _result(["const"] + x, beta, se, dof, len(Y))
+
+
+def _group_means(v: np.ndarray, codes: np.ndarray, cnt: np.ndarray) -> np.ndarray:
+    return np.column_stack([np.bincount(codes, weights=v[:, j], minlength=len(cnt)) for j in range(v.shape[1])]) / cnt[:, None]
+
+
+def _two_way_demean(v: np.ndarray, big: np.ndarray, small: np.ndarray) -> np.ndarray:
+    """
+    Exact two-way sweep: demean by the `big` groups (tickers), then solve the small
+    normal-equation system for the `small` effects (quarters, a few dozen) directly.
+    With B = big-group demeaning and D the small-group dummies, the effects g solve
+    (D'BD) g = D'Bv, and D'BD = diag(n_small) - C' diag(1/n_big) C for the sparse
+    big x small count matrix C. lstsq takes the minimum-norm g when D'BD is singular
+    (one free level per connected component), which leaves the residual unchanged.
+    """
+    n_big = np.bincount(big).astype(float)
+    n_small = np.bincount(small).astype(float)
+    v = v - _group_means(v, big, n_big)[big]
+
+    c = sparse.csr_matrix((np.ones(len(big)), (big, small)), shape=(len(n_big), len(n_small)))
+    a = np.diag(n_small) - (c.T @ sparse.diags(1.0 / n_big) @ c).toarray()
+    rhs = np.column_stack([np.bincount(small, weights=v[:, j], minlength=len(n_small)) for j in range(v.shape[1])])
+    g, *_ = np.linalg.lstsq(a, rhs, rcond=None)
+
+    fitted = g[small]
+    return v - (fitted - _group_means(fitted, big, n_big)[big])
+
+
+def within_demean(values: np.ndarray, group_codes: List[np.ndarray], tol: float = FE_TOL, max_iter: int = FE_MAX_ITER) -> np.ndarray:
+    """
+    Sweeps out every set of fixed effects from each column of `values` (n x k).
+    One set is one group-mean subtraction; two sets (ticker + quarter) are solved exactly
+    by _two_way_demean, which on unbalanced panels is both faster and more accurate than
+    alternating projections (see benchmarks/bench_panel_fe.py). Three or more sets fall
+    back to alternating group-mean subtraction. An empty `values` comes back empty.
+    """
+    v = values.astype(float).copy()
+    if len(v) == 0:
+        return v
+    if len(group_codes) == 2:
+        big, small = sorted(group_codes, key=lambda c: -(int(c.max()) + 1))
+        return _two_way_demean(v, big, small)
+    return _alternating_demean(v, group_codes, tol, max_iter)
+
+
+def _alternating_demean(v: np.ndarray, group_codes: List[np.ndarray], tol: float = FE_TOL, max_iter: int = FE_MAX_ITER) -> np.ndarray:
+    """
+    Alternating group-mean subtraction (exact after one pass for one set of effects).
+    Each sweep is a bincount, so cost is O(n) per pass with no dummy matrix.
+    """
+    counts = [np.bincount(c).astype(float) for c in group_codes]
+
+    for _ in range(max_iter):
+        biggest = 0.0
+        for codes, cnt in zip(group_codes, counts):
+            for j in range(v.shape[1]):
+                means = np.bincount(codes, weights=v[:, j], minlength=len(cnt)) / cnt
+                v[:, j] -= means[codes]
+                scale = float(np.max(np.abs(v[:, j]))) or 1.0
+                biggest = max(biggest, float(np.max(np.abs(means))) / scale)
+        if len(group_codes) == 1 or biggest < tol:
+            break
+    return v
+
+
+def fixed_effects_ols(
+    df: pd.DataFrame,
+    y: str = Y_COL,
+    x: Optional[List[str]] = None,
+    effects: tuple = ("ticker", "quarter"),
+    cluster: Optional[str] = "ticker",
+) -> Dict:
+    """
+    y = b'x + ticker FE + quarter FE (any subset of `effects`), estimated by within-demeaning.
+    """
+    x = x or [X_COL]
+    d, Y, X = _design(df, y, x)
+    codes = [pd.factorize(d[e])[0] for e in effects]
+
+    dm = within_demean(np.column_stack([Y, X]), codes)
+    Yd, Xd = dm[:, 0], dm[:, 1:]
+
+    beta, *_ = np.linalg.lstsq(Xd, Yd, rcond=None)
+    resid = Yd - Xd @ beta
+    n_fe = sum(len(np.unique(c)) for c in codes) - max(len(codes) - 1, 0)
+    dof = len(Yd) - Xd.shape[1] - n_fe
+    se = _ols_se(Xd, resid, dof, d[cluster].to_numpy() if cluster else None)
+    return _result(x, beta, se, dof, len(Yd), effects=list(effects))
+
+
+def newey_west_se(series: np.ndarray, lags: int = NW_LAGS) -> float:
+    """
+    HAC standard error of the mean of `series` (Bartlett kernel).
+    """
+    s = np.asarray(series, dtype=float)
+    s = s[~np.isnan(s)]
+    t = len(s)
+    if t < 2:
+        return float("nan")
+    e = s - s.mean()
+    var = e @ e / t
+    for lag in range(1, min(lags, t - 1) + 1):
+        w = 1 - lag / (lags + 1)
+        var += 2 * w * (e[lag:] @ e[:-lag]) / t
+    return float(np.sqrt(max(var, 0.0) / t))
+
+
+def fama_macbeth(
+    df: pd.DataFrame,
+    y: str = Y_COL,
+    x: Optional[List[str]] = None,
+    time_col: str = "quarter",
+    nw_lags: int = NW_LAGS,
+) -> Dict:
+    """
+    One cross-sectional OLS per quarter, then the time-series average of the slopes with
+    Newey-West errors. All quarters are solved together: per-quarter X'X and X'y come from
+    one reduceat over quarter-sorted rows, then one batched pseudo-inverse.
+    """
+    x = x or [X_COL]
+    d, Y, X = _design(df, y, x)
+    order = np.argsort(d[time_col].to_numpy(), kind="mergesort")
+    quarters = d[time_col].to_numpy()[order]
+    Y = Y[order]
+    X = np.column_stack([np.ones(len(Y)), X[order]])
+    k = X.shape[1]
+
+    starts = np.flatnonzero(np.r_[True, quarters[1:] != quarters[:-1]])
+    n_t = np.diff(np.r_[starts, len(Y)])
+
+    xtx = np.add.reduceat(np.einsum("ni,nj->nij", X, X), starts, axis=0)
+    xty = np.add.reduceat(X * Y[:, None], starts, axis=0)
+
+    # A quarter needs more names than regressors to give a slope
+    ok = n_t > k
+    betas = np.full((len(starts), k), np.nan)
+    if ok.any():
+        betas[ok] = (np.linalg.pinv(xtx[ok]) @ xty[ok][:, :, None])[:, :, 0]
+
+    valid = betas[ok]
+    mean = valid.mean(axis=0) if len(valid) else np.full(k, np.nan)
+    se = np.array([newey_west_se(valid[:, j], nw_lags) for j in range(k)])
+
+    per_quarter = pd.DataFrame(betas, columns=["const"] + x)
+    per_quarter.insert(0, time_col, quarters[starts])
+    per_quarter["n_obs"] = n_t
+
+    return _result(
+        ["const"] + x, mean, se, len(valid) - 1, len(Y),
+        n_periods=int(len(valid)),
+        nw_lags=int(nw_lags),
+        per_period=per_quarter,
+    )
+
+
+def run_panel(df: pd.DataFrame, normalize: Optional[str] = "total_13f_value", nw_lags: int = NW_LAGS) -> Dict:
+    """
+    Pooled, two-way fixed-effects and Fama-MacBeth regressions of next-quarter return on exposure.
+    With normalize set, the regressor is exposure_norm (see normalize_exposure).
+    """
+    if df.empty:
+        return {}
+    x = [X_COL]
+    if normalize:
+        df = normalize_exposure(df, by=normalize)
+        x = ["exposure_norm"]
+        # No positive scale anywhere (e.g. no holdings for these tickers): nothing to regress
+        if df.empty:
+            return {}
+
+    return {
+        "normalize": normalize,
+        "pooled": pooled_ols(df, x=x),
+        "fixed_effects": fixed_effects_ols(df, x=x),
+        "fama_macbeth": fama_macbeth(df, x=x, nw_lags=nw_lags),
+    }
@@ -1,19 +1,84 @@
+import hashlib
+import json
 import os
-import pandas as pd
-
-from db import create_db, insert_holdings, get_backfill_checkpoint, set_backfill_checkpoint
-from sec_edgar import get_13f_filings_for_ticker_backfill, extract_holdings
-from analysis import infer_trades_per_manager
-from analysis_stock import compute_exposure_vs_next_q_return
-from stats_tests import run_stats
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List
+
+from db import (
+    session,
+    create_db,
+    get_backfill_checkpoint,
+    get_forward_checkpoint,
+    insert_holdings_with_checkpoints,
+    replace_holdings_for_tickers,
+    table_state,
+    get_stage_fingerprint,
+    set_stage_fingerprint,
+)
+from sec_edgar import (
+    iter_13f_filing_pages_backfill,
+    iter_13f_filing_pages_forward,
+    iter_cached_filing_pages,
+    is_filing_cached,
+    extract_holdings_multi,
+    oldest_filed_at,
+    newest_filed_at,
+    SEC_RATE_LIMITER,
+)
 from update_prices import run_update_prices
-from plots import save_all_plots
+import metrics
+
+# pandas/scipy/statsmodels/matplotlib and the modules built on them are imported inside the
+# stages that use them, so ingest- and price-only runs never load them
+if TYPE_CHECKING:
+    import pandas as pd
 
 #Edit the following 4 for customizability
 TICKERS = ["ORCL", "UNH", "FDS"]
 RUN_SEC_INGEST = True
+SEC_REPLAY_FROM_CACHE = False  # rebuild holdings from sec_cache/ only (no API calls)
 YEARS_13F_WINDOW = 5
 PRICE_QUARTERS_PER_TICKER = 28
+PRICE_IMPORT_FILES = []  # vendor daily CSV/Parquet files loaded into prices_eod first (see import_prices.py)
+PRICE_FETCH_MISSING = True  # False: prices come only from PRICE_IMPORT_FILES (no API calls)
+STATS_RESAMPLES = 0  # block bootstrap / permutation draws in run_stats (0 = off; e.g. 100_000 via --resamples)
+PANEL_NORMALIZE = "total_13f_value"  # exposure scale for panel regressions (None = raw dollars)
+WRITE_SNAPSHOT = True  # Parquet copy of holdings/prices/exposure under snapshot/ (needs pyarrow)
+
+# SEC ingest concurrency: worker threads share one pooled session and one rate limiter
+SEC_INGEST_WORKERS = 4
+SEC_REQUESTS_PER_SECOND = 5.0
+SEC_PAGE_SIZE = 200
+SEC_BATCH_SIZE = 50  # tickers OR'ed into one query; each filing is downloaded once per batch
+# "forward" only fetches filings newer than each ticker's newest checkpoint (cheap daily refresh),
+# "backfill" only walks older ones, "both" does forward then backfill
+SEC_INGEST_MODE = "both"
+
+# >1 writes the per-ticker trade reports in parallel processes
+REPORT_WORKERS = 1
+# >1 evaluates the backtest parameter sweep in parallel processes
+BACKTEST_WORKERS = 1
+
+# Every run writes run_reports/run_<timestamp>.json (stage times, HTTP, SQL, row counts).
+# "cprofile" or "pyinstrument" also profiles each stage into run_reports/profile_<timestamp>/
+PROFILE_STAGES = None
+
+
+# Ingest and prices always run (they are what discovers new data, and are incremental already);
+# every later stage is skipped while its fingerprint (inputs + parameters + upstream) is unchanged
+STAGES = ["ingest", "prices", "trades", "exposure", "summary", "stats", "backtest", "plots"]
+
+# CLI subcommand -> stages it runs (the exposure stage is added whenever a later stage needs its frame)
+COMMANDS = {
+    "ingest": ["ingest"],
+    "prices": ["prices"],
+    "analyze": ["trades", "exposure", "summary", "backtest"],
+    "stats": ["stats"],
+    "plots": ["plots"],
+    "all": STAGES,
+}
 
 
 def project_dir() -> str:
@@ -23,67 +88,14 @@ def project_dir() -> str:
 BASE_DIR = project_dir()
 
 
-def write_trades_txt_by_ticker(df: pd.DataFrame, ticker: str):
-    out_path = os.path.join(BASE_DIR, f"{ticker}_trades.txt")
-
-    sub = df[df["ticker"] == ticker].copy()
-    sub = sub.sort_values(["manager", "quarter"])
-
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.write("=== " + ticker + " (per-manager position changes; qty_proxy=value_k) ===\n\n")
-
-        for manager, g in sub.groupby("manager", sort=True):
-            f.write(f"MANAGER: {manager}\n")
-            f.write("-" * (9 + len(manager)) + "\n")
-            f.write("quarter | filed_date | action | prev_qty | qty | delta\n")
-
-            for _, row in g.iterrows():
-                f.write(
-                    f"{row['quarter']} | "
-                    f"{row['filed_date']} | "
-                    f"{row['action']} | "
-                    f"{row['prev_qty_proxy']:.0f} | "
-                    f"{row['qty_proxy']:.0f} | "
-                    f"{row['delta_qty_proxy']:.0f}\n"
-                )
-            f.write("\n")
-
-    print(f"Saved {out_path}")
-
-
-def write_exposure_summary_txt(df: pd.DataFrame, filename="exposure_vs_next_q_return.txt"):
-    path = os.path.join(BASE_DIR, filename)
-
-    with open(path, "w", encoding="utf-8") as f:
-        if df.empty:
-            f.write("No matched rows. Likely: missing next-quarter close in prices.\n")
-            return
-
-        for ticker, g in df.groupby("ticker", sort=True):
-            f.write(f"=== {ticker} — Net 13F Exposure vs Next-Quarter Return ===\n\n")
-            f.write("quarter | net_exposure | next_q_return | signal\n")
-            f.write("-" * 56 + "\n")
-
-            for _, row in g.iterrows():
-                net_exp = float(row["net_exposure_change"])
-                ret = float(row["price_return_next_q"])
-
-                if net_exp == 0 or ret == 0:
-                    signal = "NEUTRAL"
-                elif (net_exp > 0 and ret > 0) or (net_exp < 0 and ret < 0):
-                    signal = "MATCH"
-                else:
-                    signal = "MISMATCH"
+def write_trades_txt_by_ticker(df: "pd.DataFrame", ticker: str):
+    from reports import write_trades_txt_all
+    write_trades_txt_all(df, [ticker], BASE_DIR)
 
-                f.write(
-                    f"{row['quarter']} | "
-                    f"{net_exp:>12,.0f} | "
-                    f"{ret:>8.2%} | "
-                    f"{signal}\n"
-                )
-            f.write("\n\n")
 
-    print(f"Saved {path}")
+def write_exposure_summary_txt(df: "pd.DataFrame", filename="exposure_vs_next_q_return.txt"):
+    from reports import write_exposure_summary
+    write_exposure_summary(df, os.path.join(BASE_DIR, filename))
 
 
 def write_stats_txt(stats: dict, filename="stats_summary.txt"):
@@ -112,63 +124,527 @@ def write_stats_txt(stats: dict, filename="stats_summary.txt"):
         f.write(f"  hits = {stats['directional']['hits']} / {stats['directional']['n_obs']}\n")
         f.write(f"  binomial p-value = {float(stats['directional']['p_value']):.4f}\n")
 
+        rs = stats.get("resampling")
+        if rs:
+            f.write(
+                f"\nResampling ({rs['n_resamples']:,} draws, block length {rs['block_len']}, seed {rs['seed']}):\n"
+            )
+            f.write(f"  statistic | observed | {rs['ci']:.0%} block-bootstrap CI | permutation p-value\n")
+            for name, label, fmt in [
+                ("r", "r", ".3f"),
+                ("rho", "rho", ".3f"),
+                ("beta", "beta", ".10f"),
+                ("r_squared", "R^2", ".4f"),
+                ("hit_rate", "hit rate", ".2%"),
+            ]:
+                v = rs["stats"][name]
+                f.write(
+                    f"  {label} | {v['observed']:{fmt}} | "
+                    f"[{v['ci_low']:{fmt}}, {v['ci_high']:{fmt}}] | "
+                    f"{v['p_perm']:.4f}\n"
+                )
+
     print(f"Saved {path}")
 
 
-def sec_ingest():
-    if not RUN_SEC_INGEST:
-        print("SEC ingest skipped (RUN_SEC_INGEST=False).")
-        return
+def write_panel_txt(results: dict, filename="panel_summary.txt"):
+    path = os.path.join(BASE_DIR, filename)
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("=== Panel Regressions: Next-Quarter Return on Net Exposure ===\n\n")
+        if not results:
+            f.write("No matched rows.\n")
+            return
+
+        f.write(f"exposure normalization: {results['normalize'] or 'none'}\n\n")
+        for key, title in [
+            ("pooled", "Pooled OLS (SE clustered by ticker)"),
+            ("fixed_effects", "Ticker + quarter fixed effects (within, SE clustered by ticker)"),
+            ("fama_macbeth", f"Fama-MacBeth (Newey-West, {results['fama_macbeth']['nw_lags']} lags)"),
+        ]:
+            r = results[key]
+            f.write(f"{title}:\n")
+            for name in r["params"]:
+                f.write(
+                    f"  {name}: coef = {r['params'][name]:.6g}  se = {r['se'][name]:.6g}  "
+                    f"t = {r['t_stat'][name]:.2f}  p = {r['p_value'][name]:.4f}\n"
+                )
+            f.write(f"  N = {r['n_obs']}")
+            if key == "fama_macbeth":
+                f.write(f"  quarters = {r['n_periods']}")
+            f.write("\n\n")
+
+    print(f"Saved {path}")
+
+
+def run_backtest_stage(df: "pd.DataFrame"):
+    from backtest import build_panel, get_signal_filed_dates, run_backtest, sweep_backtests
 
-    for ticker in TICKERS:
-        checkpoint = get_backfill_checkpoint(ticker)
+    if df.empty:
+        print("backtest skipped: no matched rows")
+        return 0
 
-        filings = get_13f_filings_for_ticker_backfill(
-            ticker=ticker,
-            limit=200,
-            end_checkpoint_filed_at=checkpoint,
-            years=YEARS_13F_WINDOW
+    panel = build_panel(df, get_signal_filed_dates(TICKERS))
+    base = run_backtest(panel)
+    base["per_quarter"].to_csv(os.path.join(BASE_DIR, "backtest_returns.csv"), index=False)
+
+    sweep = sweep_backtests(panel, workers=BACKTEST_WORKERS)
+    path = os.path.join(BASE_DIR, "backtest_sweep.csv")
+    sweep.to_csv(path, index=False)
+
+    s = base["summary"]
+    if not s["n_periods"]:
+        print("backtest: no quarter had a signal public in time to trade")
+    else:
+        print(
+            f"backtest ({s['n_quantiles']} quantiles, lag {s['lag']}, hold {s['hold']}): "
+            f"sharpe={s['sharpe']:.2f} max_dd={s['max_drawdown']:.2%} turnover={s['avg_turnover']:.2f}"
         )
+    print(f"Saved {path}")
+    return s["n_periods"]
+
+
+def _ticker_batches(tickers: List[str], size: int) -> List[List[str]]:
+    size = max(1, size)
+    return [tickers[i:i + size] for i in range(0, len(tickers), size)]
+
+
+def _forward_pages(batch: List[str], fcps: dict):
+    """
+    (filings, rows, forward checkpoint moves) per page newer than the batch's forward checkpoints.
+    Tickers without one haven't been backfilled yet and are left to backfill.
+    """
+    tickers = [t for t in batch if fcps[t]]
+    if not tickers:
+        return
+
+    for filings in iter_13f_filing_pages_forward(
+        tickers=tickers,
+        start_filed_at=oldest_filed_at([fcps[t] for t in tickers]),
+        page_size=SEC_PAGE_SIZE,
+    ):
+        rows = extract_holdings_multi(filings, tickers, forward_checkpoints=fcps)
+        newest = newest_filed_at([f.get("filedAt") for f in filings])
+
+        moved = {}
+        for t in tickers:
+            new_cp = newest_filed_at([fcps[t], newest])
+            if new_cp != fcps[t]:
+                fcps[t] = moved[t] = new_cp
+        yield filings, rows, moved
+
+
+def _backfill_pages(batch: List[str], cps: dict, fcps: dict):
+    """
+    (filings, rows, backfill checkpoint moves, forward checkpoint moves) per page not newer than
+    the batch's backfill checkpoints. A never-ingested ticker's query starts today, so its forward
+    checkpoint is set from the first (newest) page.
+    """
+    fresh = [t for t in batch if cps[t] is None]
+
+    # A never-ingested ticker needs the full window; otherwise start below the newest checkpoint
+    end_checkpoint = None if fresh else newest_filed_at([cps[t] for t in batch])
+
+    for filings in iter_13f_filing_pages_backfill(
+        tickers=batch,
+        page_size=SEC_PAGE_SIZE,
+        end_checkpoint_filed_at=end_checkpoint,
+        years=YEARS_13F_WINDOW
+    ):
+        rows = extract_holdings_multi(filings, batch, cps)  #this helps to structure data for SQL
+        oldest = oldest_filed_at([f.get("filedAt") for f in filings])
+        newest = newest_filed_at([f.get("filedAt") for f in filings])
+
+        moved, moved_fwd = {}, {}
+        for t in batch:
+            new_cp = oldest_filed_at([cps[t], oldest])
+            if new_cp != cps[t]:
+                cps[t] = moved[t] = new_cp
+        for t in fresh:
+            new_cp = newest_filed_at([fcps[t], newest])
+            if new_cp != fcps[t]:
+                fcps[t] = moved_fwd[t] = new_cp
+        yield filings, rows, moved, moved_fwd
+
+
+class _IngestStopped(Exception):
+    """
+    The writer gave up (error or Ctrl-C); fetch threads unwind instead of waiting on the queue.
+    """
+
+
+def _put(out_q: queue.Queue, stop: threading.Event, item):
+    while not stop.is_set():
+        try:
+            out_q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+    raise _IngestStopped
+
+
+def _fetch_batch_pages(
+    batch_id: int,
+    batch: List[str],
+    checkpoints: dict,
+    forward: dict,
+    out_q: queue.Queue,
+    stop: threading.Event,
+):
+    """
+    Network + parsing only (runs in a worker thread). One query covers the whole batch,
+    so each filing is downloaded and parsed once for all of its tickers. Each page is
+    handed to the writer as soon as it arrives; the bounded queue keeps memory to a few pages.
+    Returns early once `stop` is set.
+    """
+    cps = {t: checkpoints[t] for t in batch}
+    fcps = {t: forward[t] for t in batch}
+
+    try:
+        if stop.is_set():
+            return
+        if SEC_INGEST_MODE in ("forward", "both"):
+            for filings, rows, moved_fwd in _forward_pages(batch, fcps):
+                _put(out_q, stop, ("page", batch_id, (len(filings), rows, {}, moved_fwd)))
+        if SEC_INGEST_MODE in ("backfill", "both"):
+            for filings, rows, moved, moved_fwd in _backfill_pages(batch, cps, fcps):
+                _put(out_q, stop, ("page", batch_id, (len(filings), rows, moved, moved_fwd)))
+        _put(out_q, stop, ("done", batch_id, None))
+    except _IngestStopped:
+        return
+    except Exception as e:
+        try:
+            _put(out_q, stop, ("error", batch_id, e))
+        except _IngestStopped:
+            return
 
-        rows = extract_holdings(filings, ticker)  #this helps to structure data for SQL
-        inserted = insert_holdings(rows)
 
-        filed_ats = [f.get("filedAt") for f in filings if f.get("filedAt")]
-        if filed_ats:
-            oldest = min(filed_ats)
-            set_backfill_checkpoint(ticker, oldest)
+def sec_replay_from_cache():
+    """
+    Rebuilds holdings for TICKERS from the raw filing cache, with no network.
+    Only rows from filings still in the cache are replaced: rows whose filing was evicted
+    are kept, since the checkpoints say they were downloaded and nothing would refetch them.
+    """
+    stats = {"filings": 0, "rows": 0}
 
-        print(f"{ticker}: filings={len(filings)} rows={len(rows)} inserted={inserted} checkpoint={checkpoint}")
+    def row_batches():
+        for filings in iter_cached_filing_pages(SEC_PAGE_SIZE):
+            rows = extract_holdings_multi(filings, TICKERS)
+            stats["filings"] += len(filings)
+            stats["rows"] += len(rows)
+            yield rows
 
+    inserted = replace_holdings_for_tickers(TICKERS, row_batches(), replaceable=is_filing_cached)
+    print(f"SEC replay from cache: filings={stats['filings']} rows={stats['rows']} inserted={inserted}")
 
-def run_pipeline():
+
+def sec_ingest():
+    if not RUN_SEC_INGEST:
+        print("SEC ingest skipped (RUN_SEC_INGEST=False).")
+        return
+
+    if SEC_REPLAY_FROM_CACHE:
+        sec_replay_from_cache()
+        return
+
+    if SEC_INGEST_MODE not in ("forward", "backfill", "both"):
+        raise ValueError(f"unknown SEC_INGEST_MODE: {SEC_INGEST_MODE}")
+
+    SEC_RATE_LIMITER.set_rate(SEC_REQUESTS_PER_SECOND)
+    checkpoints = {ticker: get_backfill_checkpoint(ticker) for ticker in TICKERS}
+    forward = {ticker: get_forward_checkpoint(ticker) for ticker in TICKERS}
+    batches = _ticker_batches(TICKERS, SEC_BATCH_SIZE)
+    totals = [[0, 0, 0] for _ in batches]  # filings, rows, inserted
+    errors = {}
+
+    workers = max(1, SEC_INGEST_WORKERS)
+    out_q = queue.Queue(maxsize=2 * workers)
+
+    stop = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch_id, batch in enumerate(batches):
+            pool.submit(_fetch_batch_pages, batch_id, batch, checkpoints, forward, out_q, stop)
+
+        # DB writes stay on this thread: one transaction per page (rows + checkpoints).
+        # If this loop raises, the fetch threads are told to stop and the queue is drained
+        # so none stays blocked on put() while the pool waits for them.
+        try:
+            pending = len(batches)
+            while pending:
+                kind, batch_id, payload = out_q.get()
+
+                if kind == "page":
+                    n_filings, rows, moved, moved_fwd = payload
+                    inserted = insert_holdings_with_checkpoints(rows, moved, moved_fwd)
+                    totals[batch_id][0] += n_filings
+                    totals[batch_id][1] += len(rows)
+                    totals[batch_id][2] += inserted
+                    continue
+
+                pending -= 1
+                label = ",".join(batches[batch_id])
+                n_filings, n_rows, inserted = totals[batch_id]
+                if kind == "error":
+                    errors[batch_id] = payload
+                    print(f"{label}: ingest failed ({payload}); stored pages kept")
+                print(f"{label}: filings={n_filings} rows={n_rows} inserted={inserted}")
+        finally:
+            stop.set()
+            while True:
+                try:
+                    out_q.get_nowait()
+                except queue.Empty:
+                    break
+
+    # Every other batch has finished and kept its pages; the run still has to fail
+    if errors:
+        first = errors[min(errors)]
+        raise RuntimeError(f"SEC ingest failed for {len(errors)} of {len(batches)} batches (first: {first!r})") from first
+
+
+def _fingerprint(inputs: dict) -> str:
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _run_stage(name: str, inputs: dict, outputs: List[str], fn, force) -> str:
+    """
+    Runs fn() unless the stage's stored fingerprint matches `inputs` and all outputs exist.
+    fn may return (rows_in, rows_out) for the run report.
+    Returns the fingerprint, which downstream stages take as an input.
+    """
+    fp = _fingerprint(inputs)
+    with _stage(name) as st:
+        if (
+            name not in force
+            and "all" not in force
+            and get_stage_fingerprint(name) == fp
+            and all(os.path.exists(p) for p in outputs)
+        ):
+            print(f"[{name}] unchanged, skipped")
+            st["skipped"] = True
+            return fp
+
+        rows = fn()
+        if rows is not None:
+            st["rows_in"], st["rows_out"] = rows
+        set_stage_fingerprint(name, fp)
+    return fp
+
+
+def _stage(name: str):
+    profile_dir = None
+    if PROFILE_STAGES:
+        profile_dir = os.path.join(BASE_DIR, "run_reports", f"profile_{metrics.run_id()}")
+    return metrics.stage(name, profile=PROFILE_STAGES, profile_dir=profile_dir)
+
+
+def _load_exposure_csv(path: str) -> "pd.DataFrame":
+    import pandas as pd
+
+    try:
+        return pd.read_csv(path)
+    except (FileNotFoundError, pd.errors.EmptyDataError):
+        return pd.DataFrame()
+
+
+def configure(**settings):
+    """
+    Overrides module settings (TICKERS, YEARS_13F_WINDOW, ...) for this process, e.g. from the CLI.
+    Keys are the lower-case setting names; None values keep the default.
+    """
+    for key, value in settings.items():
+        name = key.upper()
+        if name not in globals() or name.startswith("_"):
+            raise ValueError(f"unknown setting: {key}")
+        if value is not None:
+            globals()[name] = value
+
+
+def run_pipeline(force=(), stages=None):
+    """
+    One DB session (connection) is shared by every stage of the run.
+    stages: subset of STAGES to run (default all); force: stage names (or "all") to run
+    even when their fingerprint is unchanged.
+    """
+    stages = set(STAGES if stages is None else stages)
+    unknown = (set(force) - {"all"} | stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"unknown stage(s): {', '.join(sorted(unknown))}")
+
+    metrics.reset()
+    try:
+        with session():
+            _run_stages(set(force), stages)
+    finally:
+        path = metrics.write_report(os.path.join(BASE_DIR, "run_reports"))
+        print(f"Saved {path}")
+
+
+def run_command(command: str, force=()):
+    """
+    Runs one CLI subcommand (see COMMANDS).
+    """
+    run_pipeline(force=force, stages=COMMANDS[command])
+
+
+def _run_stages(force=frozenset(), stages=frozenset(STAGES)):
     create_db()
 
     # 1) Create holdings database
-    sec_ingest()
+    if "ingest" in stages:
+        with _stage("ingest") as st:
+            sec_ingest()
+            st["rows_in"] = st["counters"].get("holdings_extracted", 0)
+            st["rows_out"] = st["counters"].get("holdings_inserted", 0)
 
     # 2) Create prices database
-    run_update_prices(tickers=TICKERS, max_quarters=PRICE_QUARTERS_PER_TICKER)
+    if "prices" in stages:
+        with _stage("prices") as st:
+            if PRICE_IMPORT_FILES:
+                from import_prices import import_price_files
+                import_price_files(PRICE_IMPORT_FILES)
+            if PRICE_FETCH_MISSING:
+                run_update_prices(tickers=TICKERS, max_quarters=PRICE_QUARTERS_PER_TICKER)
+            st["rows_in"] = st["counters"].get("price_bars", 0) + st["counters"].get("price_import_rows", 0)
+            st["rows_out"] = st["counters"].get("prices_upserted", 0) + st["counters"].get("prices_imported", 0)
+
+    if not stages - {"ingest", "prices"}:
+        return
+
+    holdings = table_state("holdings", "value_k", "filed_date")
+    prices = table_state("prices_eod", "close")
 
     # 3) Write manager summaries
-    trades = infer_trades_per_manager()
-    for t in TICKERS:
-        write_trades_txt_by_ticker(trades, t)
+    if "trades" in stages:
+        from analysis import N_DELTAS
+
+        def trades_stage():
+            from analysis import infer_trades_per_manager
+            from reports import write_trades_txt_all
+
+            trades = infer_trades_per_manager()
+            write_trades_txt_all(trades, TICKERS, BASE_DIR, workers=REPORT_WORKERS)
+            return holdings[0], len(trades)
+
+        _run_stage(
+            "trades",
+            {"holdings": holdings, "tickers": TICKERS, "n_deltas": N_DELTAS},
+            [os.path.join(BASE_DIR, f"{t}_trades.txt") for t in TICKERS],
+            trades_stage,
+            force,
+        )
 
-    # 4) Create larger dataset across managers
-    df = compute_exposure_vs_next_q_return(TICKERS)
-    print("Merged rows:", len(df))
+    if not stages & {"exposure", "summary", "stats", "backtest", "plots"}:
+        return
 
+    # 4) Create larger dataset across managers (always checked: every later stage reads its frame)
     csv_path = os.path.join(BASE_DIR, "exposure_vs_next_q_return.csv")
-    df.to_csv(csv_path, index=False)
-    print(f"Saved {csv_path}")
+    merged = {}
+
+    def exposure_stage():
+        from analysis_stock import compute_exposure_vs_next_q_return
+
+        df = compute_exposure_vs_next_q_return(TICKERS)
+        print("Merged rows:", len(df))
+
+        df.to_csv(csv_path, index=False)
+        print(f"Saved {csv_path}")
+
+        if WRITE_SNAPSHOT:
+            try:
+                from snapshot import export_snapshot
+                export_snapshot(TICKERS, exposure_df=df)
+            except ImportError as e:
+                print(f"snapshot skipped: {e}")
+        merged["df"] = df
+        return holdings[0] + prices[0], len(df)
+
+    exposure_fp = _run_stage(
+        "exposure",
+        {"holdings": holdings, "prices": prices, "tickers": TICKERS, "snapshot": WRITE_SNAPSHOT},
+        [csv_path],
+        exposure_stage,
+        force,
+    )
+
+    def exposure_df() -> "pd.DataFrame":
+        # Later stages reuse the frame if it was just built, else read back the CSV
+        if "df" not in merged:
+            merged["df"] = _load_exposure_csv(csv_path)
+        return merged["df"]
 
     # 5) Write exposure summary
-    write_exposure_summary_txt(df)
+    if "summary" in stages:
+        def summary_stage():
+            df = exposure_df()
+            write_exposure_summary_txt(df)
+            return len(df), None
+
+        _run_stage(
+            "summary",
+            {"exposure": exposure_fp},
+            [os.path.join(BASE_DIR, "exposure_vs_next_q_return.txt")],
+            summary_stage,
+            force,
+        )
 
     # 6) Run stats tests
-    stats = run_stats(df)
-    write_stats_txt(stats)
+    if "stats" in stages:
+        def stats_stage():
+            from stats_tests import run_stats
+            from panel import run_panel
+
+            df = exposure_df()
+            write_stats_txt(run_stats(df, n_resamples=STATS_RESAMPLES))
+            write_panel_txt(run_panel(df, normalize=PANEL_NORMALIZE))
+            return len(df), None
+
+        _run_stage(
+            "stats",
+            {"exposure": exposure_fp, "holdings": holdings, "resamples": STATS_RESAMPLES, "normalize": PANEL_NORMALIZE},
+            [os.path.join(BASE_DIR, "stats_summary.txt"), os.path.join(BASE_DIR, "panel_summary.txt")],
+            stats_stage,
+            force,
+        )
 
-    # 7) Create plots
-    save_all_plots(df, BASE_DIR)
+    # 7) Backtest long/short exposure quantiles (signals wait for their filed_date)
+    if "backtest" in stages:
+        import backtest
+
+        _run_stage(
+            "backtest",
+            {
+                "exposure": exposure_fp,
+                "holdings": holdings,
+                "params": [backtest.N_QUANTILES, backtest.LAG_QUARTERS, backtest.HOLD_QUARTERS, backtest.COST_BPS],
+                "sweep": [backtest.SWEEP_QUANTILES, backtest.SWEEP_LAGS, backtest.SWEEP_HOLDS],
+            },
+            [os.path.join(BASE_DIR, "backtest_returns.csv"), os.path.join(BASE_DIR, "backtest_sweep.csv")],
+            lambda: (len(exposure_df()), run_backtest_stage(exposure_df())),
+            force,
+        )
+
+    # 8) Create plots
+    if "plots" in stages:
+        def plots_stage():
+            from plots import save_all_plots
+
+            df = exposure_df()
+            save_all_plots(df, BASE_DIR)
+            return len(df), None
+
+        _run_stage(
+            "plots",
+            {"exposure": exposure_fp},
+            [
+                os.path.join(BASE_DIR, name)
+                for name in (
+                    "scatter_exposure_vs_next_q_return.png",
+                    "timeseries_net_exposure.png",
+                    "overlay_exposure_z_vs_next_q_return.png",
+                )
+            ],
+            plots_stage,
+            force,
+        )
@@ -0,0 +1,126 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+
+# Lines are joined and written this many at a time, so memory stays flat for huge reports
+REPORT_CHUNK_LINES = 10000
+
+TRADES_HEADER = "quarter | filed_date | action | prev_qty | qty | delta\n"
+EXPOSURE_HEADER = "quarter | net_exposure | next_q_return | signal\n"
+
+
+def _write_chunked(path: str, lines: List[str]):
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        for i in range(0, len(lines), REPORT_CHUNK_LINES):
+            f.write("".join(lines[i:i + REPORT_CHUNK_LINES]))
+
+
+def _run_bounds(values: np.ndarray):
+    """
+    (start, end) of each run of equal consecutive values.
+    """
+    n = len(values)
+    cuts = np.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = np.concatenate(([0], cuts))
+    ends = np.concatenate((cuts, [n]))
+    return zip(starts.tolist(), ends.tolist())
+
+
+def trades_txt_lines(sub: pd.DataFrame, ticker: str) -> List[str]:
+    """
+    Lines of <ticker>_trades.txt for one ticker's rows of infer_trades_per_manager().
+    """
+    lines = ["=== " + ticker + " (per-manager position changes; qty_proxy=value_k) ===\n\n"]
+    if sub.empty:
+        return lines
+
+    sub = sub.sort_values(["manager", "quarter"], kind="mergesort")
+
+    body = [
+        f"{q} | {fd} | {a} | {p:.0f} | {x:.0f} | {d:.0f}\n"
+        for q, fd, a, p, x, d in zip(
+            sub["quarter"].tolist(),
+            sub["filed_date"].tolist(),
+            sub["action"].tolist(),
+            sub["prev_qty_proxy"].tolist(),
+            sub["qty_proxy"].tolist(),
+            sub["delta_qty_proxy"].tolist(),
+        )
+    ]
+
+    managers = sub["manager"].to_numpy()
+    for start, end in _run_bounds(managers):
+        manager = managers[start]
+        lines.append(f"MANAGER: {manager}\n")
+        lines.append("-" * (9 + len(manager)) + "\n")
+        lines.append(TRADES_HEADER)
+        lines.extend(body[start:end])
+        lines.append("\n")
+    return lines
+
+
+def _write_trades_file(sub: pd.DataFrame, ticker: str, out_dir: str) -> str:
+    out_path = os.path.join(out_dir, f"{ticker}_trades.txt")
+    _write_chunked(out_path, trades_txt_lines(sub, ticker))
+    return out_path
+
+
+def write_trades_txt_all(df: pd.DataFrame, tickers: Iterable[str], out_dir: str, workers: int = 1):
+    """
+    Writes <ticker>_trades.txt for every ticker, splitting the trades frame once.
+    workers > 1 formats and writes the files in parallel processes.
+    """
+    tickers = list(tickers)
+    groups = dict(tuple(df.groupby("ticker", sort=False))) if not df.empty else {}
+    empty = df.iloc[0:0]
+    jobs = [(groups.get(t, empty), t) for t in tickers]
+
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths = list(pool.map(_write_trades_file, *zip(*jobs), [out_dir] * len(jobs)))
+    else:
+        paths = [_write_trades_file(sub, t, out_dir) for sub, t in jobs]
+
+    for p in paths:
+        print(f"Saved {p}")
+
+
+def exposure_summary_lines(df: pd.DataFrame) -> List[str]:
+    """
+    Lines of exposure_vs_next_q_return.txt, with MATCH/MISMATCH/NEUTRAL computed column-wise.
+    """
+    if df.empty:
+        return ["No matched rows. Likely: missing next-quarter close in prices.\n"]
+
+    lines = []
+    for ticker, g in df.groupby("ticker", sort=True):
+        net_exp = g["net_exposure_change"].to_numpy(dtype=float)
+        ret = g["price_return_next_q"].to_numpy(dtype=float)
+
+        signal = np.select(
+            [
+                (net_exp == 0) | (ret == 0),
+                ((net_exp > 0) & (ret > 0)) | ((net_exp < 0) & (ret < 0)),
+            ],
+            ["NEUTRAL", "MATCH"],
+            default="MISMATCH",
+        )
+
+        lines.append(f"=== {ticker} — Net 13F Exposure vs Next-Quarter Return ===\n\n")
+        lines.append(EXPOSURE_HEADER)
+        lines.append("-" * 56 + "\n")
+        lines.extend(
+            f"{q} | {e:>12,.0f} | {r:>8.2%} | {s}\n"
+            for q, e, r, s in zip(g["quarter"].tolist(), net_exp.tolist(), ret.tolist(), signal.tolist())
+        )
+        lines.append("\n\n")
+    return lines
+
+
+def write_exposure_summary(df: pd.DataFrame, path: str):
+    _write_chunked(path, exposure_summary_lines(df))
+    if not df.empty:
+        print(f"Saved {path}")
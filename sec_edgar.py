@@ -1,7 +1,22 @@
-import requests
-from typing import List, Dict, Tuple, Optional
-from datetime import datetime, timedelta
+from typing import List, Dict, Tuple, Optional, Iterator
+from datetime import datetime, timedelta, timezone
 from api import SEC_API_KEY, SEC_BASE_URL
+from http_client import RateLimiter, request_with_retry
+from metrics import incr
+from filing_cache import FilingCache
+
+SEC_REQUESTS_PER_SECOND = 5.0
+SEC_MAX_FROM = 10000  # sec-api rejects queries where from + size goes past this
+
+# Shared by every ingest thread so the whole process stays inside the sec-api quota
+SEC_RATE_LIMITER = RateLimiter(SEC_REQUESTS_PER_SECOND)
+
+# Raw filing JSON is kept on disk so extraction changes can be replayed without API calls
+SEC_CACHE_ENABLED = True
+FILING_CACHE = FilingCache()
+
+# Decode query responses one filing at a time (needs ijson; falls back to r.json() without it)
+SEC_STREAM_JSON = True
 
 
 def _safe_float(x):
@@ -14,27 +29,162 @@ def _safe_float(x):
 
 
 def _parse_filed_at(x: Optional[str]) -> Optional[datetime]:
+    """
+    Aware UTC datetime for a sec-api filedAt (which carries an offset) or a stored value
+    (a bare YYYY-MM-DD date counts as midnight UTC), so any two of them compare.
+    """
     if not x:
         return None
     try:
-        return datetime.fromisoformat(x)
+        dt = datetime.fromisoformat(x)
     except Exception:
         try:
-            return datetime.strptime(x[:10], "%Y-%m-%d")
+            dt = datetime.strptime(x[:10], "%Y-%m-%d")
         except Exception:
             return None
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
 
 
-def get_13f_filings_for_ticker_backfill(
-    ticker: str,
-    limit: int = 200,
-    end_checkpoint_filed_at: Optional[str] = None,
-    years: int = 5,
-) -> List[Dict]:
+def _accession_no(f: Dict) -> Optional[str]:
+    accession_no = (
+        f.get("accessionNo")
+        or f.get("accessionNumber")
+        or f.get("id")
+        or f.get("linkToHtml")
+    )
+    return str(accession_no) if accession_no else None
+
+
+def _cache_filings(filings: List[Dict]):
+    if not SEC_CACHE_ENABLED:
+        return
+    for f in filings:
+        accession_no = _accession_no(f)
+        # touch() refreshes a cached filing's recency, so eviction drops the least recently seen
+        if accession_no and not FILING_CACHE.touch(accession_no):
+            FILING_CACHE.put(accession_no, f)
+            incr("sec_cache_writes")
+
+
+def iter_cached_filing_pages(page_size: int = 200) -> Iterator[List[Dict]]:
+    """
+    Replays every filing in the local cache in pages, with no network access.
+    """
+    page = []
+    for f in FILING_CACHE.iter_filings():
+        page.append(f)
+        if len(page) >= page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def is_filing_cached(accession_no: str) -> bool:
+    return FILING_CACHE.has(accession_no)
+
+
+def _filed_at_key(x: Optional[str]) -> datetime:
+    return _parse_filed_at(x) or datetime.min.replace(tzinfo=timezone.utc)
+
+
+def oldest_filed_at(values: List[Optional[str]]) -> Optional[str]:
+    values = [v for v in values if v]
+    return min(values, key=_filed_at_key) if values else None
+
+
+def newest_filed_at(values: List[Optional[str]]) -> Optional[str]:
+    values = [v for v in values if v]
+    return max(values, key=_filed_at_key) if values else None
+
+
+def _not_newer_than(filings: List[Dict], cutoff_dt: Optional[datetime]) -> List[Dict]:
+    """
+    Filings filed at or before cutoff_dt. Ties are kept: filings sharing the cutoff's filedAt
+    may not all have been seen yet, and the holdings upsert makes a re-read one a no-op.
+    """
+    if not cutoff_dt:
+        return filings
+    filtered = []
+    for f in filings:
+        f_dt = _parse_filed_at(f.get("filedAt"))
+        if f_dt and f_dt <= cutoff_dt:
+            filtered.append(f)
+    return filtered
+
+
+def _ticker_clause(tickers: List[str]) -> str:
+    tickers = [t.upper() for t in tickers]
+    if len(tickers) == 1:
+        return f"holdings.ticker:{tickers[0]}"
+    return "holdings.ticker:(" + " OR ".join(tickers) + ")"
+
+
+def _sec_url() -> str:
     if not SEC_API_KEY or SEC_API_KEY.startswith("YOUR_"):
         raise ValueError("SEC_API_KEY missing or invalid")
+    return f"{SEC_BASE_URL}?token={SEC_API_KEY}"
+
+
+def _iter_response_filings(r) -> Iterator[Dict]:
+    """
+    The filings of one response. With ijson they are decoded one at a time straight off the
+    socket, so only one filing's full holdings array is ever in memory; else the page at once.
+    """
+    if SEC_STREAM_JSON:
+        try:
+            import ijson
+        except ImportError:
+            ijson = None
+        if ijson is not None:
+            r.raw.decode_content = True
+            yield from ijson.items(r.raw, "filings.item", use_float=True)
+            return
+    yield from r.json().get("filings", [])
+
+
+def _prune_holdings(f: Dict, wanted: set) -> Dict:
+    f["holdings"] = [h for h in f.get("holdings") or [] if (h.get("ticker") or "").upper() in wanted]
+    return f
+
+
+def _post_query(url: str, payload: Dict, tickers: List[str]) -> List[Dict]:
+    """
+    One page of a sec-api query. Each filing is written whole to the raw cache, then cut down
+    to the holdings of `tickers`: a large manager's thousands of other positions never reach
+    the page, so page memory no longer grows with the size of the filers on it.
+    """
+    wanted = {t.upper() for t in tickers}
+    r = request_with_retry("POST", url, limiter=SEC_RATE_LIMITER, json=payload, timeout=30, stream=True)
+    try:
+        filings = []
+        for f in _iter_response_filings(r):
+            _cache_filings([f])
+            filings.append(_prune_holdings(f, wanted))
+    finally:
+        r.close()
+
+    incr("sec_pages")
+    if filings:
+        incr("sec_filings", len(filings))
+    return filings
 
-    url = f"{SEC_BASE_URL}?token={SEC_API_KEY}"
+
+def iter_13f_filing_pages_backfill(
+    tickers: List[str],
+    page_size: int = 200,
+    end_checkpoint_filed_at: Optional[str] = None,
+    years: int = 5,
+) -> Iterator[List[Dict]]:
+    """
+    Walks the whole backfill window newest -> oldest, one page at a time, for every
+    filing that holds ANY of `tickers` (one query for the batch, each filing downloaded once).
+    Each yielded page is already filtered to filings not newer than the checkpoint,
+    so the caller can store it and move the checkpoint to its oldest filedAt.
+    """
+    url = _sec_url()
 
     today = datetime.utcnow().date()
     start_date = today - timedelta(days=years * 365)
@@ -42,39 +192,159 @@ def get_13f_filings_for_ticker_backfill(
 
     if end_checkpoint_filed_at:
         end_str = end_checkpoint_filed_at[:10]
-        checkpoint_dt = _parse_filed_at(end_checkpoint_filed_at)
+        cutoff_dt = _parse_filed_at(end_checkpoint_filed_at)
     else:
         end_str = today.strftime("%Y-%m-%d")
-        checkpoint_dt = None
-
-    payload = {
-        "query": (
-            f'formType:"13F-HR" '
-            f'AND filedAt:[{start_str} TO {end_str}] '
-            f'AND holdings.ticker:{ticker}'
-        ),
-        "from": "0",
-        "size": str(limit),
-        "sort": [{"filedAt": {"order": "desc"}}]
-    }
-
-    r = requests.post(url, json=payload, timeout=30)
-    r.raise_for_status()
-    filings = r.json().get("filings", [])
-
-    # Only older than checkpoint so we don't re-pull data
-    if checkpoint_dt:
-        filtered = []
-        for f in filings:
-            f_dt = _parse_filed_at(f.get("filedAt"))
-            if f_dt and f_dt < checkpoint_dt:
-                filtered.append(f)
-        filings = filtered
+        cutoff_dt = None
+
+    offset = 0
+    while True:
+        payload = {
+            "query": (
+                f'formType:"13F-HR" '
+                f'AND filedAt:[{start_str} TO {end_str}] '
+                f'AND {_ticker_clause(tickers)}'
+            ),
+            "from": str(offset),
+            "size": str(page_size),
+            "sort": [{"filedAt": {"order": "desc"}}]
+        }
+
+        filings = _post_query(url, payload, tickers)
+        if not filings:
+            return
+
+        # Nothing newer than the checkpoint, so we don't re-pull data
+        page = _not_newer_than(filings, cutoff_dt)
+        if page:
+            yield page
+
+        if len(filings) < page_size:
+            return
+
+        offset += page_size
+        if offset + page_size > SEC_MAX_FROM:
+            # sec-api caps from+size, so restart the window at the oldest filing seen (its
+            # timestamp included: unseen filings may share it)
+            oldest = min((f.get("filedAt") for f in filings if f.get("filedAt")), default=None)
+            oldest_dt = _parse_filed_at(oldest)
+            if not oldest_dt or (cutoff_dt and oldest_dt >= cutoff_dt):
+                return
+            end_str = oldest[:10]
+            cutoff_dt = oldest_dt
+            offset = 0
+
 
+def iter_13f_filing_pages_forward(
+    tickers: List[str],
+    start_filed_at: str,
+    page_size: int = 200,
+) -> Iterator[List[Dict]]:
+    """
+    Walks filings from start_filed_at up to today, oldest -> newest, for every filing that holds
+    ANY of `tickers` (the forward side of the checkpoint; backfill is untouched).
+    Pages arrive in filedAt order, so once a page is stored the caller can move each ticker's
+    forward checkpoint to the page's newest filedAt. The start day is re-read, which is harmless:
+    a filing that is already stored doesn't replace its own rows.
+    """
+    url = _sec_url()
+
+    start_str = start_filed_at[:10]
+    end_str = datetime.utcnow().date().strftime("%Y-%m-%d")
+
+    offset = 0
+    while True:
+        payload = {
+            "query": (
+                f'formType:"13F-HR" '
+                f'AND filedAt:[{start_str} TO {end_str}] '
+                f'AND {_ticker_clause(tickers)}'
+            ),
+            "from": str(offset),
+            "size": str(page_size),
+            "sort": [{"filedAt": {"order": "asc"}}]
+        }
+
+        filings = _post_query(url, payload, tickers)
+        if not filings:
+            return
+        yield filings
+
+        if len(filings) < page_size:
+            return
+
+        offset += page_size
+        if offset + page_size > SEC_MAX_FROM:
+            # Same from+size cap as backfill: restart the window at the newest filing seen
+            newest = newest_filed_at([f.get("filedAt") for f in filings])
+            if not newest or newest[:10] <= start_str:
+                return
+            start_str = newest[:10]
+            offset = 0
+
+
+def iter_13f_filing_pages_for_ticker_backfill(
+    ticker: str,
+    page_size: int = 200,
+    end_checkpoint_filed_at: Optional[str] = None,
+    years: int = 5,
+) -> Iterator[List[Dict]]:
+    return iter_13f_filing_pages_backfill(
+        [ticker],
+        page_size=page_size,
+        end_checkpoint_filed_at=end_checkpoint_filed_at,
+        years=years,
+    )
+
+
+def get_13f_filings_for_ticker_backfill(
+    ticker: str,
+    limit: int = 200,
+    end_checkpoint_filed_at: Optional[str] = None,
+    years: int = 5,
+) -> List[Dict]:
+    """
+    Every filing in the backfill window not newer than the checkpoint (limit is the page size),
+    with holdings cut to `ticker` (the raw cache keeps the full filings).
+    Prefer iter_13f_filing_pages_for_ticker_backfill for large names: this holds all pages in memory.
+    """
+    filings = []
+    for page in iter_13f_filing_pages_for_ticker_backfill(
+        ticker=ticker,
+        page_size=limit,
+        end_checkpoint_filed_at=end_checkpoint_filed_at,
+        years=years,
+    ):
+        filings.extend(page)
     return filings
 
 
-def extract_holdings(filings: List[Dict], ticker: str) -> List[Tuple]:
+def _checkpoint_cutoffs(checkpoints: Optional[Dict[str, Optional[str]]]) -> Dict[str, datetime]:
+    cutoffs = {}
+    for t, cp in (checkpoints or {}).items():
+        cp_dt = _parse_filed_at(cp)
+        if cp_dt:
+            cutoffs[t.upper()] = cp_dt
+    return cutoffs
+
+
+def extract_holdings_multi(
+    filings: List[Dict],
+    tickers: List[str],
+    checkpoints: Optional[Dict[str, Optional[str]]] = None,
+    forward_checkpoints: Optional[Dict[str, Optional[str]]] = None,
+) -> List[Tuple]:
+    """
+    One pass over each filing's holdings, keeping rows for every ticker in `tickers`.
+    checkpoints (ticker -> filedAt) skips rows filed after a ticker's backfill checkpoint;
+    forward_checkpoints (ticker -> filedAt) skips rows filed before a ticker's forward checkpoint.
+    Both bounds are inclusive: filings sharing the checkpoint's filedAt may not all have been
+    stored yet, and re-reading one that was is harmless (latest filing wins).
+    """
+    wanted = {t.upper() for t in tickers}
+    cutoffs = _checkpoint_cutoffs(checkpoints)
+    floors = _checkpoint_cutoffs(forward_checkpoints)
+
     rows = []
 
     for f in filings:
@@ -87,12 +357,7 @@ def extract_holdings(filings: List[Dict], ticker: str) -> List[Tuple]:
 
         filed_date = str(filed_at)[:10]
 
-        accession_no = (
-            f.get("accessionNo")
-            or f.get("accessionNumber")
-            or f.get("id")
-            or f.get("linkToHtml")
-        )
+        accession_no = _accession_no(f)
         if not accession_no:
             continue
 
@@ -100,8 +365,16 @@ def extract_holdings(filings: List[Dict], ticker: str) -> List[Tuple]:
         if not holdings:
             continue
 
+        filed_dt = _parse_filed_at(filed_at) if cutoffs or floors else None
+
         for h in holdings:
-            if (h.get("ticker") or "").upper() != ticker.upper():
+            t = (h.get("ticker") or "").upper()
+            if t not in wanted:
+                continue
+
+            if t in cutoffs and not (filed_dt and filed_dt <= cutoffs[t]):
+                continue
+            if t in floors and not (filed_dt and filed_dt >= floors[t]):
                 continue
 
             value_k = _safe_float(h.get("value") or h.get("marketValue") or h.get("valueK"))
@@ -109,12 +382,17 @@ def extract_holdings(filings: List[Dict], ticker: str) -> List[Tuple]:
                 continue
 
             rows.append((
-                str(accession_no),
+                accession_no,
                 str(manager),
                 str(quarter),
-                ticker.upper(),
+                t,
                 value_k,
                 filed_date
             ))
 
-    return rows
\ No newline at end of file
+    incr("holdings_extracted", len(rows))
+    return rows
+
+
+def extract_holdings(filings: List[Dict], ticker: str) -> List[Tuple]:
+    return extract_holdings_multi(filings, [ticker])
@@ -0,0 +1,181 @@
+"""
+Columnar Parquet snapshot of the DB (and of the computed exposure frame), partitioned
+as <table>/ticker=XXX/year=YYYY/*.parquet, so analysis reruns and notebooks can read
+just the columns and partitions they need, memory-mapped, without decoding SQLite rows.
+
+Needs pyarrow (optional dependency; only this module imports it).
+"""
+import os
+import shutil
+from typing import List, Optional
+from urllib.parse import unquote
+
+import pandas as pd
+
+from db import session, quarter_text_sql
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.path.join(BASE_DIR, "snapshot")
+EXPORT_CHUNK_ROWS = 500_000
+
+# table -> (query with a {where} slot, ticker column the slot filters on)
+SNAPSHOT_QUERIES = {
+    "holdings": (f"""
+        SELECT
+            h.accession_no,
+            m.name AS manager,
+            {quarter_text_sql("h.quarter")} AS quarter,
+            h.ticker,
+            h.value_k,
+            h.filed_date,
+            h.quarter / 10000 AS year
+        FROM holdings h
+        JOIN managers m ON m.manager_id = h.manager_id
+        {{where}}
+        ORDER BY h.ticker, h.quarter
+    """, "h.ticker"),
+    "net_exposure": (f"""
+        SELECT
+            ticker,
+            {quarter_text_sql()} AS quarter,
+            net_exposure_change,
+            net_exposure.quarter / 10000 AS year
+        FROM net_exposure
+        {{where}}
+        ORDER BY ticker, net_exposure.quarter
+    """, "ticker"),
+    "prices_eod": ("""
+        SELECT
+            ticker,
+            date,
+            close,
+            CAST(substr(date, 1, 4) AS INTEGER) AS year
+        FROM prices_eod
+        {where}
+        ORDER BY ticker, date
+    """, "ticker"),
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("snapshot export/read needs pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def _clear_partitions(table_dir: str, tickers: Optional[set] = None):
+    """
+    Removes the ticker=XXX partitions of `tickers` (all of the table if None). A table left
+    with no partitions is removed too, so reading it fails instead of returning nothing.
+    """
+    if not os.path.isdir(table_dir):
+        return
+    if tickers is None:
+        shutil.rmtree(table_dir)
+        return
+    for name in os.listdir(table_dir):
+        key, _, value = name.partition("=")
+        if key == "ticker" and unquote(value) in tickers:
+            shutil.rmtree(os.path.join(table_dir, name))
+    if not any(n.startswith("ticker=") for n in os.listdir(table_dir)):
+        shutil.rmtree(table_dir)
+
+
+def _write_partitioned(frames, table_dir: str, tickers: Optional[set] = None) -> int:
+    """
+    Writes an iterable of DataFrames (each with ticker/year columns) as one hive-partitioned dataset.
+    The partitions of `tickers` (the whole dataset if None) are removed first, so a ticker's
+    snapshot never mixes two exports and other tickers' partitions are kept.
+    """
+    pa = _pyarrow()
+    _clear_partitions(table_dir, tickers)
+
+    n = 0
+    for i, df in enumerate(frames):
+        if df.empty:
+            continue
+        pa.parquet.write_to_dataset(
+            pa.Table.from_pandas(df, preserve_index=False),
+            root_path=table_dir,
+            partition_cols=["ticker", "year"],
+            basename_template=f"part-{i:05d}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            # pyarrow refuses more than 1024 partitions per write by default; one chunk spans
+            # up to tickers x years of them
+            max_partitions=max(1024, len(df.groupby(["ticker", "year"]).size())),
+        )
+        n += len(df)
+    return n
+
+
+def export_snapshot(
+    tickers: Optional[List[str]] = None,
+    exposure_df: Optional[pd.DataFrame] = None,
+    snapshot_dir: str = SNAPSHOT_DIR,
+):
+    """
+    Snapshots holdings, net_exposure and prices_eod (all tickers, or just `tickers`; other
+    tickers' partitions are left alone), plus the exposure/return frame from
+    compute_exposure_vs_next_q_return if given.
+    """
+    params = [t.upper() for t in tickers] if tickers else None
+    wanted = set(params) if params else None
+
+    with session() as conn:
+        for table, (query, ticker_col) in SNAPSHOT_QUERIES.items():
+            where = f"WHERE {ticker_col} IN ({','.join(['?'] * len(params))})" if params else ""
+            sql = query.format(where=where)
+            chunks = pd.read_sql(sql, conn, params=params, chunksize=EXPORT_CHUNK_ROWS)
+            n = _write_partitioned(chunks, os.path.join(snapshot_dir, table), wanted)
+            print(f"snapshot: {table} rows={n}")
+
+    if exposure_df is not None:
+        # An empty frame still clears the old exposure partitions, so they can't be served as current
+        expo = exposure_df.copy()
+        if not expo.empty:
+            expo["year"] = expo["quarter"].str.slice(0, 4).astype(int)
+            if wanted is not None:
+                wanted |= set(expo["ticker"])
+        n = _write_partitioned([expo], os.path.join(snapshot_dir, "exposure"), wanted)
+        print(f"snapshot: exposure rows={n}")
+
+
+def read_snapshot(
+    table: str,
+    tickers: Optional[List[str]] = None,
+    years: Optional[List[int]] = None,
+    columns: Optional[List[str]] = None,
+    snapshot_dir: str = SNAPSHOT_DIR,
+) -> pd.DataFrame:
+    """
+    Reads one snapshot table memory-mapped. tickers/years prune partitions (only the matching
+    directories are opened) and columns prunes Parquet column chunks.
+    """
+    pa = _pyarrow()
+    path = os.path.join(snapshot_dir, table)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"no snapshot for {table} at {path}; run export_snapshot() first")
+
+    filters = []
+    if tickers:
+        filters.append(("ticker", "in", [t.upper() for t in tickers]))
+    if years:
+        filters.append(("year", "in", [int(y) for y in years]))
+
+    t = pa.parquet.read_table(
+        path,
+        columns=columns,
+        filters=filters or None,
+        memory_map=True,
+        partitioning="hive",
+    )
+    df = t.to_pandas()
+
+    # Partition keys come back as categoricals; hand back plain columns like the DB path does
+    for col in ("ticker", "year"):
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(int if col == "year" else str)
+    return df
@@ -1,15 +1,195 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
 import numpy as np
 import pandas as pd
 from scipy import stats
 import statsmodels.api as sm
 
+RESAMPLE_BLOCK_LEN = 4       # quarters per block: keeps a year of autocorrelation intact
+RESAMPLE_CHUNK = 10_000      # max resamples per batched matrix (and per process-pool task)
+RESAMPLE_MEMORY_BYTES = 512 * 1024 ** 2  # working-set budget per batch; large panels get fewer draws per batch
+# Rough bytes per (draw, row) cell in one batch: indices, X/Y gathers, centred copies, ranks and rankdata scratch
+_BYTES_PER_CELL = 128
+RESAMPLE_SEED = 12345
+RESAMPLE_STATS = ["r", "rho", "beta", "r_squared", "hit_rate"]
 
-def run_stats(df: pd.DataFrame):
+
+def load_exposure_snapshot(tickers: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Just the two columns run_stats needs, memory-mapped from the Parquet snapshot.
+    """
+    from snapshot import read_snapshot
+    return read_snapshot("exposure", tickers, columns=["net_exposure_change", "price_return_next_q"])
+
+
+def _batched_stats(X: np.ndarray, Y: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Every run_stats statistic for each row of X/Y (shape: resamples x n) at once.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xm = X - X.mean(axis=1, keepdims=True)
+        ym = Y - Y.mean(axis=1, keepdims=True)
+        sxx = np.einsum("ij,ij->i", xm, xm)
+        syy = np.einsum("ij,ij->i", ym, ym)
+        sxy = np.einsum("ij,ij->i", xm, ym)
+        r = sxy / np.sqrt(sxx * syy)
+
+        # Spearman = Pearson on average ranks (ties are common in bootstrap draws)
+        rx = stats.rankdata(X, axis=1)
+        ry = stats.rankdata(Y, axis=1)
+        rx -= rx.mean(axis=1, keepdims=True)
+        ry -= ry.mean(axis=1, keepdims=True)
+        rho = np.einsum("ij,ij->i", rx, ry) / np.sqrt(
+            np.einsum("ij,ij->i", rx, rx) * np.einsum("ij,ij->i", ry, ry)
+        )
+
+        return {
+            "r": r,
+            "rho": rho,
+            "beta": sxy / sxx,
+            "r_squared": r * r,
+            "hit_rate": (np.sign(X) == np.sign(Y)).mean(axis=1),
+        }
+
+
+def _ticker_blocks(group_sizes: np.ndarray, block_len: int):
+    """
+    Each ticker's run of rows cut into block_len pieces (the last piece of a ticker may be
+    shorter). Returns (blocks, block_ticker): row offsets of shape (n_blocks, block_len) with
+    -1 as padding, and the ticker (group) index of each block. No block spans two tickers.
+    """
+    group_start = np.cumsum(group_sizes) - group_sizes
+    per_group = -(-group_sizes // block_len)
+    block_ticker = np.repeat(np.arange(len(group_sizes)), per_group)
+    nth = np.arange(per_group.sum()) - np.repeat(np.cumsum(per_group) - per_group, per_group)
+
+    blocks = (group_start[block_ticker] + nth * block_len)[:, None] + np.arange(block_len)[None, :]
+    blocks[blocks >= (group_start + group_sizes)[block_ticker][:, None]] = -1
+    return blocks, block_ticker
+
+
+def _resample_chunk(x: np.ndarray, y: np.ndarray, group_sizes: np.ndarray, size: int, block_len: int, seed) -> Dict[str, np.ndarray]:
+    """
+    One batch of `size` draws: moving-block bootstrap within each ticker (x, y resampled
+    together, each ticker keeping its row count) and block permutation (whole ticker-aligned
+    y blocks shuffled against a fixed x, breaking the pairing).
+    """
+    rng = np.random.default_rng(seed)
+    n = len(x)
+    blocks, block_ticker = _ticker_blocks(group_sizes, block_len)
+    valid = blocks >= 0
+
+    # Bootstrap: each block slot draws a start inside its own ticker, so blocks never cross tickers
+    group_start = (np.cumsum(group_sizes) - group_sizes)[block_ticker]
+    group_len = group_sizes[block_ticker]
+    span = np.minimum(block_len, group_len)
+    starts = group_start + rng.integers(0, group_len - span + 1, size=(size, len(blocks)))
+    boot_idx = (starts[:, :, None] + np.arange(block_len)[None, None, :])[:, valid].reshape(size, n)
+    boot = _batched_stats(x[boot_idx], y[boot_idx])
+
+    # Permutation: shuffle the block order per draw; padding drops out, leaving n rows per draw
+    order = np.argsort(rng.random((size, len(blocks))), axis=1)
+    shuffled = blocks[order]
+    perm_idx = shuffled[shuffled >= 0].reshape(size, n)
+    perm = _batched_stats(np.broadcast_to(x, (size, n)), y[perm_idx])
+
+    return {"boot": boot, "perm": perm}
+
+
+def _chunk_size(n: int) -> int:
+    return int(max(1, min(RESAMPLE_CHUNK, RESAMPLE_MEMORY_BYTES // (max(n, 1) * _BYTES_PER_CELL))))
+
+
+def run_resampling_stats(
+    df: pd.DataFrame,
+    n_resamples: int = 100_000,
+    block_len: int = RESAMPLE_BLOCK_LEN,
+    seed: int = RESAMPLE_SEED,
+    workers: Optional[int] = None,
+    ci: float = 0.95,
+) -> dict:
+    """
+    Block-bootstrap confidence intervals and block-permutation p-values for
+    r, rho, beta, R^2 and hit rate. Rows are ordered by ticker then quarter so blocks
+    are runs of consecutive quarters of one ticker (without a ticker column the frame is
+    one series). Draws are split into batches sized to RESAMPLE_MEMORY_BYTES, each with
+    its own child of SeedSequence(seed), so results don't depend on `workers`.
+    """
+    if "ticker" in df.columns:
+        df = df.sort_values([c for c in ("ticker", "quarter") if c in df.columns], kind="mergesort")
+    x = df["net_exposure_change"].astype(float).to_numpy()
+    y = df["price_return_next_q"].astype(float).to_numpy()
+    n = len(x)
+    block_len = max(1, min(block_len, n))
+    if "ticker" in df.columns:
+        group_sizes = df.groupby("ticker", sort=False).size().to_numpy()
+    else:
+        group_sizes = np.array([n])
+
+    observed = {k: float(v[0]) for k, v in _batched_stats(x[None, :], y[None, :]).items()}
+
+    chunk = _chunk_size(n)
+    sizes = [chunk] * (n_resamples // chunk)
+    if n_resamples % chunk:
+        sizes.append(n_resamples % chunk)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    n_chunks = len(sizes)
+    args = ([x] * n_chunks, [y] * n_chunks, [group_sizes] * n_chunks, sizes, [block_len] * n_chunks, seeds)
+
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    if workers > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(sizes))) as pool:
+            chunks = list(pool.map(_resample_chunk, *args))
+    else:
+        chunks = list(map(_resample_chunk, *args))
+
+    alpha = (1 - ci) / 2
+    out = {}
+    for k in RESAMPLE_STATS:
+        boot = np.concatenate([c["boot"][k] for c in chunks])
+        perm = np.concatenate([c["perm"][k] for c in chunks])
+        perm = perm[~np.isnan(perm)]
+
+        # R^2 and hit rate only have an upper tail; the rest are tested two-sided
+        if k in ("r_squared", "hit_rate"):
+            extreme = np.sum(perm >= observed[k])
+        else:
+            extreme = np.sum(np.abs(perm) >= abs(observed[k]))
+
+        lo, hi = np.nanquantile(boot, [alpha, 1 - alpha])
+        out[k] = {
+            "observed": observed[k],
+            "ci_low": float(lo),
+            "ci_high": float(hi),
+            "p_perm": float((extreme + 1) / (len(perm) + 1)),
+        }
+
+    return {
+        "n_resamples": int(n_resamples),
+        "block_len": int(block_len),
+        "seed": int(seed),
+        "ci": ci,
+        "stats": out,
+    }
+
+
+def run_stats(
+    df: Optional[pd.DataFrame] = None,
+    tickers: Optional[List[str]] = None,
+    n_resamples: int = 0,
+    seed: int = RESAMPLE_SEED,
+):
     """
     df must contain:
       - net_exposure_change
       - price_return_next_q
+    With df=None the exposure frame is read from the Parquet snapshot (optionally only `tickers`).
+    n_resamples > 0 adds results["resampling"] from run_resampling_stats.
     """
+    if df is None:
+        df = load_exposure_snapshot(tickers)
+
     x = df["net_exposure_change"].astype(float).values
     y = df["price_return_next_q"].astype(float).values
 
@@ -56,4 +236,7 @@ def run_stats(df: pd.DataFrame):
     "p_value": float(p_binom)
 }
     
-    return results
\ No newline at end of file
+    if n_resamples > 0:
+        results["resampling"] = run_resampling_stats(df, n_resamples=n_resamples, seed=seed)
+
+    return results
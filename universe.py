@@ -0,0 +1,423 @@
+"""
+Sharded runner for large ticker universes (e.g. the Russell 3000).
+
+The universe is split into shards and each phase runs shards in a process pool:
+
+    ingest   each worker backfills its shard into its own staging SQLite file
+             (universe_staging/), which the parent merges into my_db.db through the
+             normal insert path as soon as the shard finishes
+    prices   the parent plans the missing quarter closes, workers fetch them,
+             the parent upserts them
+    analyze  workers write each shard's trade reports and exposure/return frame
+
+my_db.db only ever has one writer (the parent). Shard progress lives in the
+universe_progress table, and staging files keep their own checkpoints, so a killed
+run started again resumes where each shard stopped (by default the latest unfinished
+run over the same universe is picked up; --run-id names one). A shard's staging file
+is deleted as soon as its merge commits.
+
+    python universe.py --tickers-file r3000.txt --workers 8
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import db
+import metrics
+from db import (
+    session,
+    transaction,
+    create_db,
+    insert_holdings_with_checkpoints,
+    upsert_prices_eod,
+    get_backfill_checkpoint,
+    get_forward_checkpoint,
+    get_shard_phases,
+    set_shard_phase,
+    latest_unfinished_universe,
+    reset_universe_progress,
+    quarter_text_sql,
+)
+from sec_edgar import oldest_filed_at, newest_filed_at
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STAGING_DIR = os.path.join(BASE_DIR, "universe_staging")
+OUT_DIR = os.path.join(BASE_DIR, "universe_reports")
+
+SHARD_SIZE = 50  # one SEC batch query per shard
+UNIVERSE_WORKERS = 4
+THREADS_PER_WORKER = 2
+# Shared by all workers: each process gets SEC_REQUESTS_PER_SECOND / workers
+SEC_REQUESTS_PER_SECOND = 5.0
+MERGE_CHUNK_ROWS = 50_000
+
+PHASES = ["ingest", "prices", "analyze"]
+# Shard state after each phase; a shard only enters a phase from the state before it
+PHASE_FROM = {"ingest": "pending", "prices": "merged", "analyze": "priced"}
+PHASE_TO = {"ingest": "merged", "prices": "priced", "analyze": "done"}
+
+
+def load_universe(path: str) -> List[str]:
+    """
+    Tickers from a text/CSV file: first column of each line, '#' comments and a 'ticker' header skipped.
+    """
+    seen = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            t = line.split("#", 1)[0].split(",", 1)[0].strip().upper()
+            if t and t != "TICKER":
+                seen.setdefault(t, None)
+    return list(seen)
+
+
+def make_shards(tickers: List[str], shard_size: int = SHARD_SIZE) -> List[List[str]]:
+    size = max(1, shard_size)
+    return [tickers[i:i + size] for i in range(0, len(tickers), size)]
+
+
+def _universe_digest(tickers: List[str], shard_size: int) -> str:
+    return hashlib.sha1(f"{shard_size}:{','.join(tickers)}".encode()).hexdigest()[:12]
+
+
+def universe_key(tickers: List[str], shard_size: int, run_id: str) -> str:
+    return f"{run_id}:{_universe_digest(tickers, shard_size)}"
+
+
+def _staging_path(key: str, shard_id: int) -> str:
+    return os.path.join(STAGING_DIR, key.replace(":", "_"), f"shard_{shard_id:05d}.db")
+
+
+def _remove_db_files(path: str):
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def _remove_empty_dir(path: str):
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
+
+
+def _worker_counters() -> Dict:
+    return metrics.report()["counters"]
+
+
+def _ingest_shard(shard_id: int, tickers: List[str], staging_path: str, checkpoints: Dict, settings: Dict) -> Dict:
+    """
+    Worker: ingests one shard into its staging DB. A fresh staging DB starts from the main
+    DB's checkpoints (ticker -> (backfill, forward)); an existing one (killed run) continues from its own.
+    """
+    import pipeline
+
+    metrics.reset()
+    fresh = not os.path.exists(staging_path)
+    os.makedirs(os.path.dirname(staging_path), exist_ok=True)
+    db.DB_PATH = staging_path
+    db.create_db()
+
+    with session():
+        if fresh:
+            with transaction():
+                for t, (cp, fcp) in checkpoints.items():
+                    if cp:
+                        db.set_backfill_checkpoint(t, cp)
+                    if fcp:
+                        db.set_forward_checkpoint(t, fcp)
+
+        pipeline.configure(
+            tickers=tickers,
+            run_sec_ingest=True,
+            sec_replay_from_cache=False,
+            sec_batch_size=len(tickers),
+            **settings,
+        )
+        pipeline.sec_ingest()
+
+    return {"shard_id": shard_id, "counters": _worker_counters()}
+
+
+def _merge_shard(staging_path: str, tickers: List[str]) -> int:
+    """
+    Parent: copies a staging DB's holdings and checkpoints into the main DB (inside the
+    caller's transaction). Re-merging is harmless: rows are latest-filing-wins upserts, so an
+    already-merged filing never replaces its own rows (and superseded rows land back in the
+    archive), and checkpoints only ever widen (backfill older, forward newer).
+    """
+    src = sqlite3.connect(f"file:{staging_path}?mode=ro", uri=True)
+    try:
+        # Superseded rows go through the same latest-filing-wins insert, which re-archives them
+        cur = src.execute(f"""
+            SELECT h.accession_no, m.name, {quarter_text_sql("h.quarter")}, h.ticker, h.value_k, h.filed_date
+            FROM (SELECT * FROM holdings UNION ALL SELECT * FROM holdings_superseded) h
+            JOIN managers m ON m.manager_id = h.manager_id
+        """)
+        inserted = 0
+        while True:
+            rows = cur.fetchmany(MERGE_CHUNK_ROWS)
+            if not rows:
+                break
+            inserted += insert_holdings_with_checkpoints(rows, {})
+
+        staged = {
+            t: (cp, fcp)
+            for t, cp, fcp in src.execute("SELECT ticker, last_filed_at, newest_filed_at FROM ingest_checkpoint")
+        }
+    finally:
+        src.close()
+
+    moved, moved_fwd = {}, {}
+    for t in tickers:
+        cp, fcp = staged.get(t, (None, None))
+        if cp:
+            moved[t] = oldest_filed_at([get_backfill_checkpoint(t), cp])
+        if fcp:
+            moved_fwd[t] = newest_filed_at([get_forward_checkpoint(t), fcp])
+    insert_holdings_with_checkpoints([], moved, moved_fwd)
+    return inserted
+
+
+def _fetch_prices(shard_id: int, plan: List[tuple]) -> Dict:
+    """
+    Worker: fetches the planned (ticker, run of missing quarters) ranges; network only.
+    """
+    from update_prices import PRICE_LOOKBACK_DAYS, fetch_closes_in_range, _closes_for_quarters, _to_date
+
+    metrics.reset()
+    rows = []
+    for ticker, run in plan:
+        date_from = (_to_date(run[0]) - timedelta(days=PRICE_LOOKBACK_DAYS)).isoformat()
+        bars = fetch_closes_in_range(ticker, date_from, run[-1])
+        rows.extend((ticker.upper(), d, float(c)) for d, c in _closes_for_quarters(bars, run))
+    return {"shard_id": shard_id, "rows": rows, "calls": len(plan), "counters": _worker_counters()}
+
+
+def _price_plan(tickers: List[str], max_quarters: int) -> List[tuple]:
+    from update_prices import get_recent_quarters_for_ticker, find_missing_quarters, _contiguous_runs
+
+    plan = []
+    for t in tickers:
+        missing = find_missing_quarters(t, get_recent_quarters_for_ticker(t, max_quarters))
+        plan.extend((t, run) for run in _contiguous_runs(missing))
+    return plan
+
+
+def _analyze_shard(shard_id: int, tickers: List[str], main_db: str, out_dir: str) -> Dict:
+    """
+    Worker: trade reports and the exposure/return frame for one shard (reads the main DB).
+    """
+    from analysis import infer_trades_per_manager
+    from analysis_stock import compute_exposure_vs_next_q_return
+    from reports import write_trades_txt_all
+
+    db.DB_PATH = main_db
+    with session():
+        trades = infer_trades_per_manager(tickers=tickers)
+        write_trades_txt_all(trades, tickers, out_dir)
+        df = compute_exposure_vs_next_q_return(tickers)
+
+    shard_csv = os.path.join(out_dir, "exposure", f"shard_{shard_id:05d}.csv")
+    os.makedirs(os.path.dirname(shard_csv), exist_ok=True)
+    df.to_csv(shard_csv, index=False)
+    return {"shard_id": shard_id, "rows": len(df)}
+
+
+def _add_counters(counters: Dict):
+    for name, n in counters.items():
+        metrics.incr(name, n)
+
+
+def _run_phase(phase: str, key: str, shards: List[List[str]], workers: int, submit, finish, committed=None):
+    """
+    Runs every shard waiting for `phase` through the pool. finish(shard_id, result) runs in
+    the parent (the only DB writer) and records the shard's new state in the same transaction;
+    committed(shard_id), if given, runs once that transaction has committed.
+    """
+    phases = get_shard_phases(key)
+    todo = [i for i, _ in enumerate(shards) if phases.get(i) == PHASE_FROM[phase]]
+    print(f"[{phase}] {len(todo)} of {len(shards)} shards to run")
+    if not todo:
+        return
+
+    failed = 0
+    # spawn, not fork: a forked child would inherit the parent's open session on my_db.db
+    ctx = multiprocessing.get_context("spawn")
+    with metrics.stage(f"universe_{phase}") as st, ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = {submit(pool, i): i for i in todo}
+        for fut in as_completed(futures):
+            i = futures[fut]
+            try:
+                result = fut.result()
+            except Exception as e:
+                failed += 1
+                print(f"[{phase}] shard {i}: failed ({e}); rerun to resume")
+                continue
+
+            _add_counters(result.get("counters", {}))
+            with transaction():
+                finish(i, result)
+                set_shard_phase(key, i, shards[i], PHASE_TO[phase])
+            if committed:
+                committed(i)
+        st["rows_in"] = len(todo)
+        st["rows_out"] = len(todo) - failed
+
+
+def run_universe(
+    tickers: List[str],
+    shard_size: int = SHARD_SIZE,
+    workers: int = UNIVERSE_WORKERS,
+    run_id: Optional[str] = None,
+    phases: List[str] = PHASES,
+    restart: bool = False,
+    years: int = 5,
+    ingest_mode: str = "both",
+    max_quarters: int = 28,
+    sec_requests_per_second: float = SEC_REQUESTS_PER_SECOND,
+    threads_per_worker: int = THREADS_PER_WORKER,
+    out_dir: str = OUT_DIR,
+) -> str:
+    """
+    Runs the requested phases over the sharded universe and returns the universe key.
+    Without a run_id the latest unfinished run over the same tickers and shard size is resumed,
+    whenever it was started; if there is none a new run id (the UTC start time) is used.
+    """
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    shards = make_shards(tickers, shard_size)
+    main_db = db.DB_PATH
+
+    create_db()
+    if run_id:
+        key = universe_key(tickers, shard_size, run_id)
+    else:
+        key = latest_unfinished_universe(":" + _universe_digest(tickers, shard_size))
+        key = key or universe_key(tickers, shard_size, datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"))
+    metrics.reset()
+    with session():
+        if restart:
+            reset_universe_progress(key)
+        known = get_shard_phases(key)
+        with transaction():
+            for i, shard in enumerate(shards):
+                if i not in known:
+                    set_shard_phase(key, i, shard, "pending")
+                    if restart:
+                        _remove_db_files(_staging_path(key, i))
+
+        print(f"universe {key}: {len(tickers)} tickers, {len(shards)} shards, {workers} workers")
+
+        if "ingest" in phases:
+            settings = {
+                "years_13f_window": years,
+                "sec_ingest_mode": ingest_mode,
+                "sec_ingest_workers": threads_per_worker,
+                "sec_requests_per_second": sec_requests_per_second / max(1, workers),
+            }
+
+            def submit_ingest(pool, i):
+                cps = {t: (get_backfill_checkpoint(t), get_forward_checkpoint(t)) for t in shards[i]}
+                return pool.submit(_ingest_shard, i, shards[i], _staging_path(key, i), cps, settings)
+
+            def finish_ingest(i, result):
+                inserted = _merge_shard(_staging_path(key, i), shards[i])
+                print(f"[ingest] shard {i}: merged {inserted} new holdings")
+
+            def merged(i):
+                _remove_db_files(_staging_path(key, i))
+
+            _run_phase("ingest", key, shards, workers, submit_ingest, finish_ingest, merged)
+            # Staging files a killed run merged but didn't get to delete
+            for i, phase in get_shard_phases(key).items():
+                if phase != "pending":
+                    merged(i)
+            _remove_empty_dir(os.path.dirname(_staging_path(key, 0)))
+
+        if "prices" in phases:
+            def submit_prices(pool, i):
+                return pool.submit(_fetch_prices, i, _price_plan(shards[i], max_quarters))
+
+            def finish_prices(i, result):
+                changed = upsert_prices_eod(result["rows"])
+                print(f"[prices] shard {i}: {result['calls']} range requests, stored/updated {changed} prices")
+
+            _run_phase("prices", key, shards, workers, submit_prices, finish_prices)
+
+        if "analyze" in phases:
+            os.makedirs(out_dir, exist_ok=True)
+
+            def submit_analyze(pool, i):
+                return pool.submit(_analyze_shard, i, shards[i], main_db, out_dir)
+
+            def finish_analyze(i, result):
+                print(f"[analyze] shard {i}: {result['rows']} exposure rows")
+
+            _run_phase("analyze", key, shards, workers, submit_analyze, finish_analyze)
+            _combine_exposure(out_dir, len(shards))
+
+    path = metrics.write_report(os.path.join(BASE_DIR, "run_reports"))
+    print(f"Saved {path}")
+    return key
+
+
+def _combine_exposure(out_dir: str, n_shards: int):
+    import pandas as pd
+
+    frames = []
+    for i in range(n_shards):
+        p = os.path.join(out_dir, "exposure", f"shard_{i:05d}.csv")
+        try:
+            frames.append(pd.read_csv(p))
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            continue
+    if not frames:
+        return
+    path = os.path.join(out_dir, "exposure_vs_next_q_return.csv")
+    pd.concat(frames, ignore_index=True).to_csv(path, index=False)
+    print(f"Saved {path}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Sharded ingest/prices/analysis over a large ticker universe")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--tickers-file", help="one ticker per line (or first CSV column)")
+    src.add_argument("--tickers", nargs="+", metavar="TICKER")
+    ap.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    ap.add_argument("--workers", type=int, default=UNIVERSE_WORKERS)
+    ap.add_argument("--threads-per-worker", type=int, default=THREADS_PER_WORKER)
+    ap.add_argument("--rps", type=float, default=SEC_REQUESTS_PER_SECOND, help="total SEC requests/second across workers")
+    ap.add_argument("--years", type=int, default=5)
+    ap.add_argument("--ingest-mode", choices=["forward", "backfill", "both"], default="both")
+    ap.add_argument("--quarters", type=int, default=28)
+    ap.add_argument("--phases", nargs="+", choices=PHASES, default=PHASES)
+    ap.add_argument("--run-id", help="resume key (default: the latest unfinished run over this universe, else a new one)")
+    ap.add_argument("--restart", action="store_true", help="forget this run's progress and staging files")
+    ap.add_argument("--out-dir", default=OUT_DIR)
+    args = ap.parse_args(argv)
+
+    tickers = load_universe(args.tickers_file) if args.tickers_file else args.tickers
+    run_universe(
+        tickers,
+        shard_size=args.shard_size,
+        workers=args.workers,
+        run_id=args.run_id,
+        phases=args.phases,
+        restart=args.restart,
+        years=args.years,
+        ingest_mode=args.ingest_mode,
+        max_quarters=args.quarters,
+        sec_requests_per_second=args.rps,
+        threads_per_worker=args.threads_per_worker,
+        out_dir=args.out_dir,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,124 @@
-import requests
-from typing import List, Optional, Tuple
+from bisect import bisect_right
+from datetime import date, timedelta
+from typing import List, Tuple
 
 from db import (
     create_db,
     upsert_prices_eod,
-    get_connection,
+    session,
+    get_prices_eod_for_ticker,
+    quarter_from_int,
 )
 from api import STOCKDATA_API_KEY, STOCKDATA_BASE_URL
+from http_client import request_with_retry
+from metrics import incr
 
 TICKERS = ["ORCL", "UNH", "FDS"]
 MAX_QUARTERS = 28
 
+# A quarter-end close can sit up to a week before the quarter date (weekends, holidays)
+PRICE_LOOKBACK_DAYS = 7
+# Consecutive missing quarters are fetched as one date range, at most this many per request
+MAX_QUARTERS_PER_RANGE = 4
+
 
 def get_recent_quarters_for_ticker(ticker: str, limit: int) -> List[str]:
     """
     Pull distinct quarter-end dates from holdings for a ticker.
     Returns most recent `limit` dates as YYYY-MM-DD strings.
     """
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute("""
-        SELECT DISTINCT quarter
-        FROM holdings
-        WHERE ticker = ?
-        ORDER BY date(quarter) DESC
-        LIMIT ?
-    """, (ticker.upper(), limit))
-
-    rows = [r[0] for r in cur.fetchall()]
-    conn.close()
+    with session() as conn:
+        cur = conn.execute("""
+            SELECT DISTINCT quarter
+            FROM holdings
+            WHERE ticker = ?
+            ORDER BY quarter DESC
+            LIMIT ?
+        """, (ticker.upper(), limit))
+        rows = [quarter_from_int(r[0]) for r in cur.fetchall()]
     return rows
 
 
-def fetch_close_on_date(ticker: str, date_str: str) -> Optional[Tuple[str, float]]:
+def _to_date(s: str) -> date:
+    return date.fromisoformat(str(s)[:10])
+
+
+def find_missing_quarters(ticker: str, quarters: List[str]) -> List[str]:
+    """
+    Quarter dates with no stored close in (quarter - PRICE_LOOKBACK_DAYS, quarter].
+    """
+    stored = sorted(d for d, _ in get_prices_eod_for_ticker(ticker))
+    missing = []
+    for q in quarters:
+        i = bisect_right(stored, q)
+        if i == 0 or _to_date(stored[i - 1]) <= _to_date(q) - timedelta(days=PRICE_LOOKBACK_DAYS):
+            missing.append(q)
+    return missing
+
+
+def _next_quarter_end(q: date) -> date:
+    month = q.month + 3
+    year = q.year + (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    first_of_next = date(year + (month == 12), month % 12 + 1, 1)
+    return first_of_next - timedelta(days=1)
+
+
+def _contiguous_runs(quarters: List[str]) -> List[List[str]]:
+    """
+    Splits quarter dates into runs of back-to-back calendar quarters (capped at MAX_QUARTERS_PER_RANGE).
     """
-    Fetch EOD close for ticker on a specific date.
-    API returns nearest previous trading day if market was closed.
-    Returns (price_date, close) or None.
+    runs = []
+    for q in sorted(quarters):
+        if (
+            runs
+            and len(runs[-1]) < MAX_QUARTERS_PER_RANGE
+            and _next_quarter_end(_to_date(runs[-1][-1])) == _to_date(q)
+        ):
+            runs[-1].append(q)
+        else:
+            runs.append([q])
+    return runs
+
+
+def fetch_closes_in_range(ticker: str, date_from: str, date_to: str) -> List[Tuple[str, float]]:
+    """
+    Fetch every EOD close for ticker between date_from and date_to (inclusive), oldest first.
     """
     url = f"{STOCKDATA_BASE_URL}/data/eod"
     params = {
         "symbols": ticker.upper(),
-        "date": date_str,
+        "date_from": date_from,
+        "date_to": date_to,
         "api_token": STOCKDATA_API_KEY,
     }
 
-    r = requests.get(url, params=params, timeout=15)
-    r.raise_for_status()
+    r = request_with_retry("GET", url, params=params, timeout=15)
 
-    data = r.json().get("data", [])
-    if not data:
-        return None
+    bars = []
+    for bar in r.json().get("data", []):
+        if bar.get("date") is None or bar.get("close") is None:
+            continue
+        bars.append((str(bar.get("date"))[:10], float(bar.get("close"))))
+    bars.sort()
+    incr("price_bars", len(bars))
+    return bars
 
-    bar = data[0]
-    return str(bar.get("date"))[:10], float(bar.get("close"))
+
+def _closes_for_quarters(bars: List[Tuple[str, float]], quarters: List[str]) -> List[Tuple[str, float]]:
+    """
+    For each quarter date, the last bar on or before it (same rule the single-date endpoint uses).
+    """
+    dates = [d for d, _ in bars]
+    out = []
+    for q in quarters:
+        i = bisect_right(dates, q)
+        if i == 0:
+            continue
+        price_date, close = bars[i - 1]
+        if _to_date(price_date) > _to_date(q) - timedelta(days=PRICE_LOOKBACK_DAYS):
+            out.append((price_date, close))
+    return out
 
 
 def run_update_prices(
@@ -63,32 +127,42 @@ def run_update_prices(
 ) -> int:
     """
     Populates prices_eod for the most recent max_quarters quarter dates per ticker.
+    Only quarters without a stored close are fetched, one date-range request per run
+    of consecutive missing quarters, so a warm run makes no API calls.
     """
     create_db()
     tickers = tickers or TICKERS
 
+    with session():
+        total_calls = _update_prices(tickers, max_quarters)
+
+    print(f"TOTAL API CALLS USED: {total_calls}")
+    return total_calls
+
+
+def _update_prices(tickers: List[str], max_quarters: int) -> int:
     total_calls = 0
 
     for ticker in tickers:
         quarters = get_recent_quarters_for_ticker(ticker, max_quarters)
-        print(f"{ticker}: fetching prices for {len(quarters)} quarter dates")
+        missing = find_missing_quarters(ticker, quarters)
+        runs = _contiguous_runs(missing)
+        print(f"{ticker}: {len(quarters)} quarter dates, {len(missing)} missing, {len(runs)} range requests")
 
         rows = []
-        for q in quarters:
-            result = fetch_close_on_date(ticker, q)
+        for run in runs:
+            date_from = (_to_date(run[0]) - timedelta(days=PRICE_LOOKBACK_DAYS)).isoformat()
+            bars = fetch_closes_in_range(ticker, date_from, run[-1])
             total_calls += 1
-            if result is None:
-                continue
 
-            price_date, close = result
-            rows.append((ticker.upper(), price_date, float(close)))
+            for price_date, close in _closes_for_quarters(bars, run):
+                rows.append((ticker.upper(), price_date, float(close)))
 
         changed = upsert_prices_eod(rows)
         print(f"{ticker}: stored/updated {changed} prices")
 
-    print(f"TOTAL API CALLS USED: {total_calls}")
     return total_calls
 
 
 if __name__ == "__main__":
-    run_update_prices()
\ No newline at end of file
+    run_update_prices()